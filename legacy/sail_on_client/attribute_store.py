@@ -0,0 +1,175 @@
+"""Save and restore attributes with tensors as memory mappable buffers."""
+
+import json
+import os
+import pickle as pkl
+import numpy as np
+import torch
+from torch import Tensor
+
+from typing import Any, Dict, List, Tuple
+
+ATTRIBUTE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+BUFFER_FILE = "buffers.bin"
+OBJECT_FILE = "objects.pkl"
+# Offsets of buffers are aligned so that every buffer can be viewed with its dtype
+BUFFER_ALIGNMENT = 64
+
+
+class _AttributeEncoder(object):
+    """Encode attributes as a json tree with references to raw buffers."""
+
+    def __init__(self, buffer_file: Any) -> None:
+        """Initialize."""
+        self.buffer_file = buffer_file
+        self.offset = 0
+        self.objects: List[Any] = []
+
+    def _write_buffer(self, data: np.ndarray) -> Dict[str, Any]:
+        """Write array to the buffer file and return a reference to it."""
+        padding = -self.offset % BUFFER_ALIGNMENT
+        self.buffer_file.write(b"\0" * padding)
+        self.offset += padding
+        data = np.ascontiguousarray(data)
+        reference = {
+            "offset": self.offset,
+            "dtype": data.dtype.str,
+            "shape": list(data.shape),
+        }
+        self.buffer_file.write(data.tobytes())
+        self.offset += data.nbytes
+        return reference
+
+    def encode(self, value: Any) -> Any:
+        """Encode a value as a json compatible tree."""
+        if isinstance(value, Tensor):
+            try:
+                data = value.detach().cpu().numpy()
+            except TypeError:
+                # dtypes without a numpy equivalent are pickled
+                return self._encode_object(value)
+            return {"__tensor__": self._write_buffer(data)}
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            return {"__ndarray__": self._write_buffer(value)}
+        elif isinstance(value, dict):
+            return {
+                "__dict__": [[self.encode(k), self.encode(v)] for k, v in value.items()]
+            }
+        elif isinstance(value, tuple):
+            return {"__tuple__": [self.encode(v) for v in value]}
+        elif isinstance(value, list):
+            return [self.encode(v) for v in value]
+        elif value is None or isinstance(value, (str, bool, int, float)):
+            return value
+        return self._encode_object(value)
+
+    def _encode_object(self, value: Any) -> Dict[str, int]:
+        """Keep a value that can not be encoded for pickling."""
+        self.objects.append(value)
+        return {"__object__": len(self.objects) - 1}
+
+
+def save_raw_attributes(attribute_dir: str, attribute_dict: Dict) -> None:
+    """
+    Save attributes with tensors and arrays as raw buffers.
+
+    The directory contains a buffer file with all the tensors and arrays, a
+    json manifest with the rest of the attributes and a pickle file for
+    values that can not be represented in json.
+
+    Args:
+        attribute_dir (str): Directory where attributes are saved
+        attribute_dict (dict): Finalized dictionary with attributes
+
+    Return:
+        None
+    """
+    os.makedirs(attribute_dir, exist_ok=True)
+    manifest_path = os.path.join(attribute_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    with open(os.path.join(attribute_dir, BUFFER_FILE), "wb") as buffer_file:
+        encoder = _AttributeEncoder(buffer_file)
+        manifest = {
+            "attribute_format_version": ATTRIBUTE_FORMAT_VERSION,
+            "attributes": encoder.encode(attribute_dict),
+        }
+    with open(os.path.join(attribute_dir, OBJECT_FILE), "wb") as object_file:
+        pkl.dump(encoder.objects, object_file)
+    # The manifest is written last so that a directory with a manifest is complete
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+def is_raw_attribute_dir(attribute_dir: str) -> bool:
+    """
+    Check if a directory contains attributes saved as raw buffers.
+
+    Args:
+        attribute_dir (str): Path to the directory
+
+    Return:
+        True if the directory has a manifest for raw attributes
+    """
+    return os.path.isfile(os.path.join(attribute_dir, MANIFEST_FILE))
+
+
+class _AttributeDecoder(object):
+    """Decode attributes with tensors that are views of a memory map."""
+
+    def __init__(self, buffers: np.ndarray, objects: List[Any]) -> None:
+        """Initialize."""
+        self.buffers = buffers
+        self.objects = objects
+
+    def _view(self, reference: Dict[str, Any]) -> np.ndarray:
+        """Return view of a buffer without copying it."""
+        dtype = np.dtype(reference["dtype"])
+        shape: Tuple[int, ...] = tuple(reference["shape"])
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        offset = reference["offset"]
+        return self.buffers[offset : offset + nbytes].view(dtype).reshape(shape)
+
+    def decode(self, value: Any) -> Any:
+        """Decode a value from the json tree."""
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        elif not isinstance(value, dict):
+            return value
+        elif "__tensor__" in value:
+            return torch.from_numpy(self._view(value["__tensor__"]))
+        elif "__ndarray__" in value:
+            return self._view(value["__ndarray__"])
+        elif "__dict__" in value:
+            return {self.decode(k): self.decode(v) for k, v in value["__dict__"]}
+        elif "__tuple__" in value:
+            return tuple(self.decode(v) for v in value["__tuple__"])
+        return self.objects[value["__object__"]]
+
+
+def load_raw_attributes(attribute_dir: str) -> Dict:
+    """
+    Load attributes saved as raw buffers.
+
+    Tensors and arrays are views of a copy on write memory map over the buffer
+    file, so only the parts of them that are accessed are read from disk.
+
+    Args:
+        attribute_dir (str): Directory where attributes are saved
+
+    Return:
+        Dictionary with attributes
+    """
+    with open(os.path.join(attribute_dir, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    with open(os.path.join(attribute_dir, OBJECT_FILE), "rb") as object_file:
+        objects = pkl.load(object_file)
+    buffer_path = os.path.join(attribute_dir, BUFFER_FILE)
+    buffers: np.ndarray
+    if os.path.getsize(buffer_path) > 0:
+        buffers = np.memmap(buffer_path, dtype=np.uint8, mode="c")
+    else:
+        buffers = np.zeros(0, dtype=np.uint8)
+    return _AttributeDecoder(buffers, objects).decode(manifest["attributes"])
@@ -0,0 +1,386 @@
+"""Extract features for all the rounds of a test in large batches."""
+
+import logging
+import multiprocessing as mp
+import os
+import pickle as pkl
+
+from collections import deque
+from multiprocessing.pool import AsyncResult, Pool
+from sail_on_client.errors import RoundError
+from sail_on_client.feature_cache import FeatureCache, extract_features
+from sail_on_client.stage_scheduler import WORKER_EXCLUDED
+from sail_on_client.utils import Dataset, dataset_ids, safe_remove
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Seconds to wait for the workers to load the detector before batches are
+# extracted in the protocol's process
+WORKER_START_TIMEOUT = 600
+
+# Algorithm, feature cache and toolset of a worker process, set when it starts
+_worker_state: Optional[Tuple[Any, Optional[FeatureCache], Dict[str, Any]]] = None
+# Error raised while loading the state of a worker process
+_worker_error: Optional[str] = None
+
+
+def _init_worker(worker_state: bytes) -> None:
+    """
+    Load the state used for extracting batches in a worker process.
+
+    The state is unpickled here instead of by the pool, which would start the
+    worker again and again when the detector can not be loaded in it.
+
+    Args:
+        worker_state (bytes): Pickled algorithm, feature cache and toolset
+
+    Return:
+        None
+    """
+    global _worker_state, _worker_error
+    try:
+        _worker_state = pkl.loads(worker_state)
+    except Exception as e:
+        _worker_error = f"{type(e).__name__}: {e}"
+
+
+def _worker_ready() -> Optional[str]:
+    """Return the error raised while loading the state of a worker, None if it loaded."""
+    return _worker_error
+
+
+def _extract_batch(
+    novelty_algorithm: Any,
+    feature_cache: Optional[FeatureCache],
+    toolset: Dict[str, Any],
+    image_ids: List[str],
+    batch_path: Optional[str],
+) -> Tuple[Dict, Dict]:
+    """
+    Extract features and logits for the images in a batch.
+
+    Args:
+        novelty_algorithm: Algorithm used for feature extraction
+        feature_cache (FeatureCache): Cache for the features, None to extract
+                                      features for all the images
+        toolset (dict): Toolset for the batch
+        image_ids (list): Image ids in the batch
+        batch_path (str): Path for the dataset of the batch, None to provide
+                          the image ids to the algorithm
+
+    Return:
+        Tuple with features and logits for the images in the batch
+    """
+    toolset["dataset"] = image_ids
+    if batch_path is not None:
+        toolset["dataset"] = batch_path
+        with open(batch_path, "w") as f:
+            f.writelines([f"{image_id}\n" for image_id in image_ids])
+    try:
+        return extract_features(novelty_algorithm, toolset, feature_cache, image_ids)
+    finally:
+        safe_remove(toolset["dataset"])
+
+
+def _extract_in_worker(
+    image_ids: List[str], round_id: int, batch_path: Optional[str]
+) -> Tuple[Dict, Dict]:
+    """Extract features for a batch in a worker process."""
+    if _worker_state is None:
+        raise RuntimeError("No extractor available in the worker")
+    novelty_algorithm, feature_cache, toolset = _worker_state
+    toolset = dict(toolset)
+    toolset["round_id"] = round_id
+    return _extract_batch(
+        novelty_algorithm, feature_cache, toolset, image_ids, batch_path
+    )
+
+
+def merge_rounds(round_image_ids: List[List[str]], batch_size: int) -> List[List[str]]:
+    """
+    Merge the image ids of rounds into batches.
+
+    Args:
+        round_image_ids (list): Image ids for every round of a test
+        batch_size (int): Maximum number of images in a batch
+
+    Return:
+        List of batches with the unique image ids in the order of the rounds
+    """
+    image_ids = list(
+        dict.fromkeys(
+            image_id for image_ids in round_image_ids for image_id in image_ids
+        )
+    )
+    return [
+        image_ids[start : start + batch_size]
+        for start in range(0, len(image_ids), batch_size)
+    ]
+
+
+class BatchedExtractor(object):
+    """
+    Request every round of a test up front and extract features in batches.
+
+    The image ids of all the rounds are merged into batches that are
+    extracted by worker processes started with spawn, so they do not inherit
+    the threads of the protocol. The detector, the feature cache and the
+    toolset are pickled once for every worker. Batches are extracted ahead of
+    the rounds that need them, two per worker, and the features of an image
+    are dropped once every round with the image got them. Features for a
+    round are provided in the order of the images in the round, so the saved
+    features match the features saved by extracting the rounds one after
+    another. The detector is expected to extract features for an image
+    independently of the other images in the batch.
+    """
+
+    def __init__(
+        self,
+        toolset: Dict[str, Any],
+        novelty_algorithm: Any,
+        feature_cache: Optional[FeatureCache],
+        dataset_request: Callable[[int], Dataset],
+        batch_size: int,
+        num_workers: int = 1,
+    ) -> None:
+        """
+        Initialize the extractor for a test.
+
+        Args:
+            toolset (dict): Toolset used by the protocol
+            novelty_algorithm: Algorithm used for feature extraction
+            feature_cache (FeatureCache): Cache for the features, None to extract
+                                          features for all the images
+            dataset_request (callable): Function that requests the dataset for a round
+            batch_size (int): Maximum number of images extracted together
+            num_workers (int): Number of worker processes used for extraction
+
+        Return:
+            None
+        """
+        self.toolset = toolset
+        self.novelty_algorithm = novelty_algorithm
+        self.feature_cache = feature_cache
+        self._dataset_request = dataset_request
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self._datasets: Optional[List[Dataset]] = None
+        self._round_error: Optional[RoundError] = None
+        self._batches: List[List[str]] = []
+        # First round with images in every batch
+        self._batch_rounds: List[int] = []
+        self._image_batches: Dict[str, int] = {}
+        # Number of rounds that did not get the features of an image yet
+        self._image_uses: Dict[str, int] = {}
+        self._pool: Optional[Pool] = None
+        self._pending: Deque[AsyncResult] = deque()
+        self._submitted = 0
+        self._received = 0
+        self._features: Dict[str, Any] = {}
+        self._logits: Dict[str, Any] = {}
+
+    def _request_rounds(self) -> List[List[str]]:
+        """Request the datasets for all the rounds of the test."""
+        self._datasets = []
+        round_image_ids: List[List[str]] = []
+        while True:
+            try:
+                dataset = self._dataset_request(len(self._datasets))
+            except RoundError as e:
+                # Raised again when the protocol requests the round
+                self._round_error = e
+                break
+            self._datasets.append(dataset)
+            round_image_ids.append(dataset_ids(dataset))
+        return round_image_ids
+
+    def _batch_path(self, batch_idx: int) -> Optional[str]:
+        """Return path for the dataset of a batch, None for in memory datasets."""
+        assert self._datasets is not None
+        if not isinstance(self._datasets[0], str):
+            return None
+        return f"{os.path.splitext(self._datasets[0])[0]}_batch_{batch_idx}.csv"
+
+    def extract_batch(self, batch_idx: int) -> Tuple[Dict, Dict]:
+        """
+        Extract features and logits for a batch in this process.
+
+        Args:
+            batch_idx (int): Index of the batch
+
+        Return:
+            Tuple with features and logits for the images in the batch
+        """
+        toolset = dict(self.toolset)
+        toolset["round_id"] = self._batch_rounds[batch_idx]
+        return _extract_batch(
+            self.novelty_algorithm,
+            self.feature_cache,
+            toolset,
+            self._batches[batch_idx],
+            self._batch_path(batch_idx),
+        )
+
+    def _start_workers(self) -> None:
+        """Start the worker processes, batches are extracted here if they can not."""
+        num_workers = min(self.num_workers, len(self._batches))
+        if num_workers <= 1:
+            return
+        toolset = {
+            key: val for key, val in self.toolset.items() if key not in WORKER_EXCLUDED
+        }
+        try:
+            worker_state = pkl.dumps(
+                (self.novelty_algorithm, self.feature_cache, toolset)
+            )
+            self._pool = mp.get_context("spawn").Pool(
+                num_workers, initializer=_init_worker, initargs=(worker_state,)
+            )
+            # Every worker loads the same state, so one of them is checked
+            worker_error = self._pool.apply_async(_worker_ready).get(
+                WORKER_START_TIMEOUT
+            )
+        except Exception:
+            logging.exception("Failed to start workers, extracting batches in order")
+            self._stop_workers()
+            return
+        if worker_error is not None:
+            logging.error(
+                f"Workers failed to load the detector ({worker_error}), "
+                "extracting batches in order"
+            )
+            self._stop_workers()
+            return
+        self._submit_batches()
+
+    def _stop_workers(self) -> None:
+        """Stop the worker processes without waiting for their batches."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _submit_batches(self) -> None:
+        """Keep two batches for every worker in the queue of the pool."""
+        assert self._pool is not None
+        while self._submitted < len(self._batches) and len(self._pending) < (
+            2 * self.num_workers
+        ):
+            batch_idx = self._submitted
+            self._pending.append(
+                self._pool.apply_async(
+                    _extract_in_worker,
+                    (
+                        self._batches[batch_idx],
+                        self._batch_rounds[batch_idx],
+                        self._batch_path(batch_idx),
+                    ),
+                )
+            )
+            self._submitted += 1
+
+    def _receive_batch(self) -> None:
+        """Add the features of the next batch."""
+        if self._pool is None:
+            features_dict, logit_dict = self.extract_batch(self._received)
+        else:
+            features_dict, logit_dict = self._pending.popleft().get()
+            self._submit_batches()
+        self._received += 1
+        self._features.update(features_dict)
+        self._logits.update(logit_dict)
+        if self._received == len(self._batches) and self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def dataset_request(self, round_id: int) -> Dataset:
+        """
+        Request data for a round.
+
+        All the rounds are requested and their extraction is started on the
+        first request.
+
+        Args:
+            round_id (int): The sequential number of the round
+
+        Return:
+            Filename of a file containing a list of image files
+        """
+        if self._datasets is None:
+            round_image_ids = self._request_rounds()
+            self._batches = merge_rounds(round_image_ids, self.batch_size)
+            image_rounds: Dict[str, int] = {}
+            for round_idx, image_ids in enumerate(round_image_ids):
+                for image_id in image_ids:
+                    image_rounds.setdefault(image_id, round_idx)
+                    self._image_uses[image_id] = self._image_uses.get(image_id, 0) + 1
+            for batch_idx, image_ids in enumerate(self._batches):
+                self._batch_rounds.append(image_rounds[image_ids[0]])
+                for image_id in image_ids:
+                    self._image_batches[image_id] = batch_idx
+            logging.info(
+                f"Extracting features for {len(round_image_ids)} rounds in "
+                f"{len(self._batches)} batches with {self.num_workers} workers"
+            )
+            self._start_workers()
+        assert self._datasets is not None
+        if round_id < len(self._datasets):
+            return self._datasets[round_id]
+        if self._round_error is not None:
+            raise self._round_error
+        raise RoundError("NoRound", f"Round {round_id} is not available")
+
+    def extract(
+        self, toolset: Dict[str, Any], image_ids: List[str]
+    ) -> Tuple[Dict, Dict]:
+        """
+        Get features and logits for the images in a round.
+
+        Args:
+            toolset (dict): Toolset used by the protocol
+            image_ids (list): List of image ids in the round
+
+        Return:
+            Tuple with features and logits for the round
+        """
+        last_batch = max(
+            (self._image_batches.get(image_id, -1) for image_id in image_ids),
+            default=-1,
+        )
+        while self._received <= last_batch:
+            self._receive_batch()
+        features_dict = {
+            image_id: self._features[image_id]
+            for image_id in image_ids
+            if image_id in self._features
+        }
+        logit_dict = {
+            image_id: self._logits[image_id]
+            for image_id in image_ids
+            if image_id in self._logits
+        }
+        for image_id in image_ids:
+            if image_id not in self._image_uses:
+                continue
+            self._image_uses[image_id] -= 1
+            if self._image_uses[image_id] == 0:
+                del self._image_uses[image_id]
+                self._features.pop(image_id, None)
+                self._logits.pop(image_id, None)
+        return features_dict, logit_dict
+
+    def close(self) -> None:
+        """
+        Stop the worker processes and drop the features that were not used.
+
+        Return:
+            None
+        """
+        if self._pool is not None:
+            self._stop_workers()
+            # Datasets of the batches that were being extracted
+            for batch_idx in range(self._received, self._submitted):
+                safe_remove(self._batch_path(batch_idx))
+        self._pending.clear()
+        self._features = {}
+        self._logits = {}
@@ -0,0 +1,168 @@
+"""Atomic writer for checkpoints that can write on a background thread."""
+
+import logging
+import os
+import pickle as pkl
+import queue
+import shutil
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def pickle_to(obj: Any, path: str) -> None:
+    """
+    Pickle an object to a file.
+
+    Args:
+        obj: Object that is pickled
+        path (str): Path to the file
+
+    Return:
+        None
+    """
+    with open(path, "wb") as f:
+        pkl.dump(obj, f)
+
+
+def atomic_write(path: str, write_fn: Callable[[str], None]) -> None:
+    """
+    Write a file or directory to a temporary path and move it to its location.
+
+    Args:
+        path (str): Final path of the file or directory
+        write_fn (callable): Function that writes to the path provided to it
+
+    Return:
+        None
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    write_fn(tmp_path)
+    if os.path.isdir(tmp_path) and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter(object):
+    """
+    Write checkpoints atomically, optionally on a background thread.
+
+    Writes submitted to the writer can run after submit returns, so they
+    should not refer to objects that the caller modifies later. Objects are
+    serialized by the writer, so serializing them does not block the caller,
+    and only values that are still modified are copied before they are
+    submitted.
+    """
+
+    def __init__(self, background: bool = True, max_pending: int = 2) -> None:
+        """
+        Initialize the writer.
+
+        Args:
+            background (bool): Write on a background thread instead of the caller
+            max_pending (int): Number of writes that can be queued before submit blocks
+
+        Return:
+            None
+        """
+        self.background = background
+        self.write_latencies: List[float] = []
+        self.max_queue_depth = 0
+        self._error: Optional[Exception] = None
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(target=self._write_checkpoints, daemon=True)
+            self._thread.start()
+
+    def _write(self, path: str, write_fn: Callable[[str], None]) -> None:
+        """Write a checkpoint and record the time taken to write it."""
+        start_time = time.perf_counter()
+        atomic_write(path, write_fn)
+        self.write_latencies.append(time.perf_counter() - start_time)
+        logging.info(f"Checkpoint written in {path}")
+
+    def _write_checkpoints(self) -> None:
+        """Write checkpoints from the queue till the writer is closed."""
+        while True:
+            item: Optional[Tuple[str, Callable]] = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, write_fn = item
+            try:
+                if self._error is None:
+                    self._write(path, write_fn)
+            except Exception as e:
+                logging.exception(f"Failed to write checkpoint in {path}")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self) -> None:
+        """Raise error encountered by the background thread."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Failed to write checkpoint") from error
+
+    def submit(self, path: str, write_fn: Callable[[str], None]) -> None:
+        """
+        Write a checkpoint.
+
+        Args:
+            path (str): Path of the checkpoint
+            write_fn (callable): Function that writes the checkpoint to the path
+                                 provided to it
+
+        Return:
+            None
+        """
+        self._check_error()
+        if not self.background:
+            self._write(path, write_fn)
+            return
+        self._queue.put((path, write_fn))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def flush(self) -> None:
+        """
+        Wait for submitted checkpoints to be written.
+
+        Return:
+            None
+        """
+        if self.background:
+            self._queue.join()
+        self._check_error()
+
+    def close(self) -> None:
+        """
+        Write submitted checkpoints and stop the background thread.
+
+        Return:
+            None
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._check_error()
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Get metrics for the checkpoints written so far.
+
+        Return:
+            Dictionary with queue depth and write latency in seconds
+        """
+        latencies = self.write_latencies
+        return {
+            "writes": len(latencies),
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_write_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_write_latency": max(latencies, default=0.0),
+        }
@@ -1,12 +1,123 @@
 """Checkpoint to save and restore attributes."""
 
 import logging
+import numpy as np
 import torch
 import os
 import pickle as pkl
 from torch import Tensor
+from sail_on_client.attribute_store import (
+    MANIFEST_FILE,
+    is_raw_attribute_dir,
+    load_raw_attributes,
+)
+from sail_on_client.checkpoint_writer import atomic_write, pickle_to
 
-from typing import Dict, Any
+from functools import partial
+from itertools import chain
+from typing import Dict, Any, List, Optional, Tuple
+
+# Key in the attribute dictionary with the location of rounds in saved attributes
+ROUND_INDEX_KEY = "_round_index"
+
+
+def _concat_chunks(chunks: List[Any]) -> Any:
+    """
+    Concatenate chunks of a sequence attribute.
+
+    :params chunks: List of tensors, lists or tuples saved in different rounds
+
+    :return Concatenated value with the type of the first chunk
+    """
+    if isinstance(chunks[0], Tensor):
+        return torch.cat(chunks)
+    elif isinstance(chunks[0], tuple):
+        return tuple(chain.from_iterable(chunks))
+    else:
+        return list(chain.from_iterable(chunks))
+
+
+def _copy_chunk(chunk: Any) -> Any:
+    """
+    Copy values of a sequence attribute saved in a round.
+
+    Detectors can reuse or modify the value of an attribute in later rounds,
+    the saved chunks are copied so the values of earlier rounds are kept.
+
+    :params chunk: List, tuple or tensor saved in a round
+
+    :return Copy of the values that is not modified by the detector
+    """
+    if isinstance(chunk, Tensor):
+        return chunk.clone()
+    elif isinstance(chunk, list):
+        return list(chunk)
+    return chunk
+
+
+class AttributeChunks(object):
+    """
+    Sequence attribute accumulated over multiple rounds.
+
+    The values saved in every round are kept as separate chunks and are only
+    concatenated when the attributes are finalized for writing, which keeps
+    saving a round independent of the number of rounds saved before it.
+    """
+
+    def __init__(self, chunks: List[Any]) -> None:
+        """Initialize."""
+        self.chunks = chunks
+
+    def append(self, chunk: Any) -> None:
+        """Add values saved in a round."""
+        self.chunks.append(chunk)
+
+    def finalize(self) -> Any:
+        """Return the concatenated value of the attribute."""
+        return _concat_chunks(self.chunks)
+
+    def __reduce__(self) -> Tuple[Any, Tuple[List[Any]]]:
+        """Pickle the attribute as its concatenated value."""
+        return _concat_chunks, (self.chunks,)
+
+
+def _finalize_value(value: Any) -> Any:
+    """
+    Finalize the value of an attribute saved for a test.
+
+    :params value: Saved value of the attribute
+
+    :return Concatenated chunks or a copy of a value the detector can modify
+    """
+    if isinstance(value, AttributeChunks):
+        return value.finalize()
+    elif isinstance(value, dict):
+        return {key: _copy_chunk(val) for key, val in value.items()}
+    elif isinstance(value, np.ndarray):
+        return value.copy()
+    return _copy_chunk(value)
+
+
+def finalize_attributes(attribute_dict: Dict) -> Dict:
+    """
+    Concatenate sequence attributes accumulated over multiple rounds.
+
+    Tensors, arrays and lists are copied, so the finalized attributes can be
+    written on another thread while the detector keeps modifying its values.
+
+    :params attribute_dict: Dictionary with saved attributes
+
+    :return Dictionary with the same structure that can be written to a file
+    """
+    finalized_dict: Dict[str, Any] = {}
+    for attribute, attribute_val in attribute_dict.items():
+        if isinstance(attribute_val, dict):
+            finalized_dict[attribute] = {
+                test_id: _finalize_value(val) for test_id, val in attribute_val.items()
+            }
+        else:
+            finalized_dict[attribute] = attribute_val
+    return finalized_dict
 
 
 class Checkpointer(object):
@@ -15,6 +126,12 @@ class Checkpointer(object):
     def __init__(self, toolset: Dict) -> None:
         """Initialize."""
         self.toolset = toolset
+        self._attribute_cache: Tuple[Optional[Tuple], Dict] = (None, {})
+        self._round_offsets: Dict[int, Tuple[int, int]] = {}
+        self._round_ids_cache: Tuple[Optional[Tuple[str, int]], List[str]] = (
+            None,
+            [],
+        )
 
     def _save_elementwise_attribute(
         self, detector: Any, attribute: str, attribute_dict: Dict
@@ -34,26 +151,17 @@ class Checkpointer(object):
             if test_id in attribute_dict:
                 attribute_dict[test_id].update(attribute_val)
             else:
-                attribute_dict[test_id] = attribute_val
-        elif isinstance(attribute_val, list):
-            if test_id in attribute_dict:
-                attribute_dict[test_id].extend(attribute_val)
+                # Copied since later rounds update the saved dictionary
+                attribute_dict[test_id] = dict(attribute_val)
+        elif isinstance(attribute_val, (list, tuple, Tensor)):
+            if test_id not in attribute_dict:
+                attribute_dict[test_id] = _copy_chunk(attribute_val)
+            elif isinstance(attribute_dict[test_id], AttributeChunks):
+                attribute_dict[test_id].append(_copy_chunk(attribute_val))
             else:
-                attribute_dict[test_id] = attribute_val
-        elif isinstance(attribute_val, tuple):
-            if test_id in attribute_dict:
-                old_attr_val = list(attribute_dict[test_id])
-                old_attr_val.extend(list(attribute_val))
-                attribute_dict[test_id] = tuple(old_attr_val)
-            else:
-                attribute_dict[test_id] = attribute_val
-        elif isinstance(attribute_val, Tensor):
-            if test_id in attribute_dict:
-                attribute_dict[test_id] = torch.cat(
-                    [attribute_dict[test_id], attribute_val]
+                attribute_dict[test_id] = AttributeChunks(
+                    [attribute_dict[test_id], _copy_chunk(attribute_val)]
                 )
-            else:
-                attribute_dict[test_id] = attribute_val
         else:
             logging.info(
                 "Treating attribute value as a single element rather than an iterable"
@@ -61,6 +169,49 @@ class Checkpointer(object):
             attribute_dict[test_id] = attribute_val
         return attribute_dict
 
+    def _index_elementwise_attribute(
+        self, detector: Any, attribute: str, attribute_index: Dict, saved_val: Any
+    ) -> Dict:
+        """
+        Private method to record the location of a round in a saved attribute.
+
+        Sequence attributes record start and end offsets of the round while
+        dictionary attributes record the keys added in the round. Keys saved
+        in an earlier round are not added again, so detectors that keep a
+        dictionary for the entire test restore the keys added in every round.
+
+        :params detector: Instance of novelty detector
+        :params attribute: Name of the detector attribute that is saved
+        :params attribute_index: A dictionary containing index for other tests
+        :params saved_val: Value of the attribute saved in earlier rounds of the test
+
+        :return Updated attribute index
+        """
+        attribute_val = getattr(detector, attribute)
+        test_id = self.toolset["test_id"]
+        round_id = self.toolset["round_id"]
+        if isinstance(attribute_val, dict):
+            test_index = attribute_index.setdefault(test_id, {"ids": {}})
+            if not isinstance(saved_val, dict):
+                saved_val = {}
+            test_index["ids"].setdefault(round_id, []).extend(
+                key for key in attribute_val if key not in saved_val
+            )
+        elif isinstance(attribute_val, (list, tuple, Tensor)):
+            test_index = attribute_index.setdefault(
+                test_id, {"offsets": {}, "length": 0}
+            )
+            round_len = len(attribute_val)
+            if round_id in test_index["offsets"]:
+                test_index["offsets"][round_id][1] += round_len
+            else:
+                test_index["offsets"][round_id] = [
+                    test_index["length"],
+                    test_index["length"] + round_len,
+                ]
+            test_index["length"] += round_len
+        return attribute_index
+
     def save_attributes(self, step_descriptor: str) -> None:
         """
         Save attribute for a detector.
@@ -76,26 +227,193 @@ class Checkpointer(object):
         save_elementwise = self.toolset["save_elementwise"]
         attribute_dict = self.toolset["attributes"]
         self.detector: Any
-        if len(attributes) > 0:
+        if len(attributes) > 0 and not save_elementwise:
+            self._save_round_attributes(step_descriptor, attributes)
+        elif len(attributes) > 0:
             for attribute in attributes:
-                if hasattr(self.detector, attribute) and save_elementwise:
+                if hasattr(self.detector, attribute):
                     if attribute not in attribute_dict:
                         attribute_dict[attribute] = {}
+                    # The round is indexed before it is added to the saved value
+                    if "round_id" in self.toolset:
+                        round_index = attribute_dict.setdefault(ROUND_INDEX_KEY, {})
+                        round_index[attribute] = self._index_elementwise_attribute(
+                            self.detector,
+                            attribute,
+                            round_index.get(attribute, {}),
+                            attribute_dict[attribute].get(self.toolset["test_id"]),
+                        )
                     attribute_dict[attribute] = self._save_elementwise_attribute(
                         self.detector, attribute, attribute_dict[attribute]
                     )
-                elif hasattr(self.detector, attribute) and not save_elementwise:
-                    raise NotImplementedError(
-                        "Saving attributes for an entire round is not supported"
-                    )
                 else:
                     logging.warn(f"Detector does not have {attribute} attribute")
         else:
             logging.info(f"No attributes found for {step_descriptor}")
         self.toolset["attributes"] = attribute_dict
 
+    def _round_shard_path(self, step_descriptor: str) -> str:
+        """
+        Private method to get the path of the shard for the current round.
+
+        :params step_descriptor: String describing steps for protocol
+
+        :return Path to the shard with attributes for the round and step
+        """
+        save_dir = self.toolset["save_dir"]
+        if not os.path.isdir(save_dir) and os.path.splitext(save_dir)[1]:
+            save_dir = os.path.dirname(save_dir)
+        test_id = self.toolset["test_id"]
+        round_id = self.toolset["round_id"]
+        return os.path.join(
+            save_dir, f"{test_id}_rounds", f"{round_id}_{step_descriptor}.pkl"
+        )
+
+    def _save_round_attributes(
+        self, step_descriptor: str, attributes: List[str]
+    ) -> None:
+        """
+        Private method to save attributes for an entire round in a shard.
+
+        Every round and step is saved in a separate shard, so a round can be
+        restored without loading the rounds before it. The shard is written
+        before the method returns since the detector can modify the attributes
+        in later steps.
+
+        :params step_descriptor: String describing steps for protocol
+        :params attributes: Name of the detector attributes that need to be saved
+
+        :return None
+        """
+        round_attributes = {}
+        for attribute in attributes:
+            if hasattr(self.detector, attribute):
+                round_attributes[attribute] = getattr(self.detector, attribute)
+            else:
+                logging.warn(f"Detector does not have {attribute} attribute")
+        shard_path = self._round_shard_path(step_descriptor)
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        atomic_write(shard_path, partial(pickle_to, round_attributes))
+        logging.info(f"Saved attributes for round in {shard_path}")
+
+    def _restore_round_attributes(
+        self, step_descriptor: str, attributes: List[str]
+    ) -> None:
+        """
+        Private method to restore attributes for an entire round from a shard.
+
+        Only the shard for the current round is loaded.
+
+        :params step_descriptor: String describing steps for protocol
+        :params attributes: Name of the detector attributes that need to be restored
+
+        :return None
+        """
+        shard_path = self._round_shard_path(step_descriptor)
+        if not os.path.isfile(shard_path):
+            raise FileNotFoundError(
+                f"No attributes saved for round {self.toolset['round_id']} "
+                f"in {shard_path}"
+            )
+        with open(shard_path, "rb") as f:
+            round_attributes = pkl.load(f)
+        for attribute in attributes:
+            if attribute in round_attributes:
+                setattr(self.detector, attribute, round_attributes[attribute])
+            else:
+                logging.warn(f"Attribute {attribute} not found in {shard_path}")
+
+    def _attribute_path(self) -> str:
+        """
+        Private method to get the path of saved attributes for the current test.
+
+        :return Path to the pickle file or the directory with raw attributes
+        """
+        test_id = self.toolset["test_id"]
+        save_dir = self.toolset["save_dir"]
+        if self.toolset.get("attribute_format", "pkl") == "raw":
+            if is_raw_attribute_dir(save_dir):
+                return save_dir
+            return os.path.join(save_dir, f"{test_id}_attribute")
+        if os.path.isdir(save_dir):
+            return os.path.join(save_dir, f"{test_id}_attribute.pkl")
+        return save_dir
+
+    def _load_attributes(self) -> Dict:
+        """
+        Private method to load saved attributes for the current test.
+
+        The attributes are loaded once per test and reused by later rounds till
+        the file with the attributes is rewritten.
+
+        :return Dictionary with saved attributes
+        """
+        test_id = self.toolset["test_id"]
+        attribute_path = self._attribute_path()
+        raw_format = self.toolset.get("attribute_format", "pkl") == "raw"
+        # The manifest of raw attributes is replaced last when they are rewritten
+        stat = os.stat(
+            os.path.join(attribute_path, MANIFEST_FILE)
+            if raw_format
+            else attribute_path
+        )
+        cache_key = (test_id, attribute_path, stat.st_mtime_ns, stat.st_size)
+        # Adapters using the mixin are not required to call Checkpointer.__init__
+        cached_key, attribute_val = getattr(self, "_attribute_cache", (None, {}))
+        if cached_key != cache_key:
+            if raw_format:
+                attribute_val = load_raw_attributes(attribute_path)
+            else:
+                with open(attribute_path, "rb") as f:
+                    attribute_val = pkl.load(f)
+            self._attribute_cache = (cache_key, attribute_val)
+            self._round_offsets = {}
+        return attribute_val
+
+    def _round_ids(self) -> List[str]:
+        """
+        Private method to get image ids for the current round.
+
+        :return List of image ids in the round
+        """
+        if isinstance(self.toolset["dataset"], list):
+            return self.toolset["dataset"]
+        round_key = (self.toolset["dataset"], self.toolset["round_id"])
+        cached_round_key, dataset_ids = getattr(self, "_round_ids_cache", (None, []))
+        if cached_round_key != round_key:
+            with open(self.toolset["dataset"], "r") as f:
+                dataset_ids = [dataset_id.strip() for dataset_id in f.readlines()]
+            self._round_ids_cache = (round_key, dataset_ids)
+        return dataset_ids
+
+    def _unindexed_round_offsets(self, round_id: int) -> Tuple[int, int]:
+        """
+        Private method to locate a round in attributes saved without an index.
+
+        The round starts where the previous restored round ended, rounds that
+        were not restored before are assumed to have the size of the round.
+
+        :params round_id: Round that is restored
+
+        :return Start and end offset of the round
+        """
+        round_offsets = getattr(self, "_round_offsets", {})
+        if round_id not in round_offsets:
+            round_len = len(self._round_ids())
+            if round_id - 1 in round_offsets:
+                start = round_offsets[round_id - 1][1]
+            else:
+                start = round_id * round_len
+            round_offsets[round_id] = (start, start + round_len)
+            self._round_offsets = round_offsets
+        return round_offsets[round_id]
+
     def _restore_elementwise_attribute(
-        self, detector: Any, attribute_name: str, attribute_val: Dict
+        self,
+        detector: Any,
+        attribute_name: str,
+        attribute_val: Dict,
+        test_index: Optional[Dict] = None,
     ) -> Any:
         """
         Private method to restore attributes element wise.
@@ -103,26 +421,41 @@ class Checkpointer(object):
         :params detector: Instance of novelty detector
         :params attribute_name: Name of the detector attribute that needs to be saved
         :params attribute_val: A dictonary containing value for attributes
+        :params test_index: Location of the rounds in the attribute, attributes
+                            saved without an index assume rounds of equal size
 
         :return Detector with updated value for attributes
         """
-        dataset_ids = list(
-            map(lambda x: x.strip(), open(self.toolset["dataset"], "r").readlines())
-        )
         round_id = self.toolset["round_id"]
-        round_len = len(dataset_ids)
+        if test_index is not None:
+            round_locations = test_index.get("ids", test_index.get("offsets", {}))
+            if round_id not in round_locations:
+                raise KeyError(
+                    f"Round {round_id} of {self.toolset['test_id']} was not saved "
+                    f"for {attribute_name}"
+                )
+        if test_index is not None and "ids" in test_index:
+            round_ids = test_index["ids"][round_id]
+            round_attribute_val = {
+                dataset_id: attribute_val[dataset_id] for dataset_id in round_ids
+            }
+            setattr(detector, attribute_name, round_attribute_val)
+            return detector
+        elif test_index is not None and "offsets" in test_index:
+            start, end = test_index["offsets"][round_id]
+            setattr(detector, attribute_name, attribute_val[start:end])
+            return detector
         if isinstance(attribute_val, dict):
             round_attribute_val = {}
-            for dataset_id in dataset_ids:
+            for dataset_id in self._round_ids():
                 round_attribute_val[dataset_id] = attribute_val[dataset_id]
         elif (
             isinstance(attribute_val, list)
             or isinstance(attribute_val, tuple)
             or isinstance(attribute_val, Tensor)
         ):
-            round_attribute_val = attribute_val[
-                round_id * round_len : (round_id + 1) * round_len
-            ]
+            start, end = self._unindexed_round_offsets(round_id)
+            round_attribute_val = attribute_val[start:end]
         else:
             logging.info(
                 "Treating attribute value as a single element rather than an iterable."
@@ -144,23 +477,19 @@ class Checkpointer(object):
             and step_descriptor in self.toolset["saved_attributes"]
         ):
             attributes = self.toolset["saved_attributes"][step_descriptor]
-            save_elementwise = self.toolset["save_elementwise"]
-            save_dir = self.toolset["save_dir"]
+            if not self.toolset["save_elementwise"]:
+                self._restore_round_attributes(step_descriptor, attributes)
+                return
             test_id = self.toolset["test_id"]
-            if os.path.isdir(save_dir):
-                attribute_file = os.path.join(save_dir, f"{test_id}_attribute.pkl")
-                attribute_val = pkl.load(open(attribute_file, "rb"))
-            else:
-                attribute_val = pkl.load(open(save_dir, "rb"))
+            attribute_val = self._load_attributes()
+            round_index = attribute_val.get(ROUND_INDEX_KEY, {})
             for attribute in attributes:
-                if save_elementwise:
-                    self.detector = self._restore_elementwise_attribute(
-                        self.detector, attribute, attribute_val[attribute][test_id]
-                    )
-                else:
-                    raise NotImplementedError(
-                        "Restoring attributes for an entire round is not supported."
-                    )
+                self.detector = self._restore_elementwise_attribute(
+                    self.detector,
+                    attribute,
+                    attribute_val[attribute][test_id],
+                    round_index.get(attribute, {}).get(test_id),
+                )
 
         else:
             logging.info(f"No attributes found for {step_descriptor}.")
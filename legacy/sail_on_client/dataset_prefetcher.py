@@ -0,0 +1,109 @@
+"""Request datasets for upcoming rounds in the background."""
+
+import logging
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from sail_on_client.utils import Dataset, safe_remove
+from typing import Any, Optional, Tuple
+
+
+class DatasetPrefetcher(object):
+    """
+    Request the dataset for a round and prefetch the dataset for the next round.
+
+    The next round is requested on a background thread while the detector
+    processes the current round. A RoundError raised for the prefetched round
+    is raised when the round is requested, so the end of a test is handled
+    the same way with and without prefetching.
+    """
+
+    def __init__(
+        self,
+        harness: Any,
+        session_id: str,
+        prefetch: bool = True,
+        in_memory: bool = False,
+    ) -> None:
+        """
+        Initialize the prefetcher.
+
+        Args:
+            harness (Harness): Harness used for requesting datasets
+            session_id (str): Session identifier provided by the server
+            prefetch (bool): Request the next round in the background, this
+                             requires a harness that can request a dataset
+                             while other requests are in progress
+            in_memory (bool): Request the list of image ids in a round instead
+                              of a file with the image ids
+
+        Return:
+            None
+        """
+        self.harness = harness
+        self.session_id = session_id
+        self.prefetch = prefetch
+        self._request = harness.dataset_request
+        if in_memory:
+            self._request = harness.dataset_ids_request
+        self.hits = 0
+        self._pending: Optional[Tuple[Tuple[str, int], Future]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if prefetch:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _discard_pending(self) -> None:
+        """Wait for a prefetched dataset that is not required and remove it."""
+        if self._pending is None:
+            return
+        _, future = self._pending
+        self._pending = None
+        try:
+            safe_remove(future.result())
+        except Exception:
+            pass
+
+    def dataset_request(self, test_id: str, round_id: int) -> Dataset:
+        """
+        Request data for a round.
+
+        Args:
+            test_id (str): The test being evaluated
+            round_id (int): The sequential number of the round being evaluated
+
+        Return:
+            Filename of a file containing a list of image files, or the list of
+            image files for an in memory prefetcher
+        """
+        if self._pending is not None and self._pending[0] == (test_id, round_id):
+            _, future = self._pending
+            self._pending = None
+            # Raises RoundError if the round is not available
+            dataset = future.result()
+            self.hits += 1
+        else:
+            self._discard_pending()
+            dataset = self._request(test_id, round_id, self.session_id)
+        if self._executor is not None:
+            self._pending = (
+                (test_id, round_id + 1),
+                self._executor.submit(
+                    self._request,
+                    test_id,
+                    round_id + 1,
+                    self.session_id,
+                ),
+            )
+        return dataset
+
+    def close(self) -> None:
+        """
+        Discard the prefetched dataset and stop the background thread.
+
+        Return:
+            None
+        """
+        self._discard_pending()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        logging.info(f"Prefetched datasets used: {self.hits}")
@@ -0,0 +1,211 @@
+"""Feature cache shared across tests and sessions."""
+
+import hashlib
+import logging
+import os
+
+from sail_on_client.feature_store import FeatureStore
+from sail_on_client.utils import safe_remove
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _file_digest(file_path: str) -> str:
+    """
+    Compute sha256 digest of a file.
+
+    Args:
+        file_path (str): Path to the file
+
+    Return:
+        Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_checksum(model_paths: List[str]) -> str:
+    """
+    Compute a checksum for the models used by a detector.
+
+    Args:
+        model_paths (list): Paths to the models, paths that are not files are
+                            used as is
+
+    Return:
+        Hex digest for the models
+    """
+    digest = hashlib.sha256()
+    for model_path in model_paths:
+        if os.path.isfile(model_path):
+            digest.update(_file_digest(model_path).encode("utf-8"))
+        else:
+            digest.update(model_path.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FeatureCache(object):
+    """
+    Cache for features and logits backed by a feature store.
+
+    Features are keyed by image id or by the hash of the image file and are
+    kept in a separate store for every detector class and model checksum.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        version: Dict[str, Any],
+        key_type: str = "id",
+        dataset_root: str = "",
+    ) -> None:
+        """
+        Open the cache for a detector.
+
+        Args:
+            cache_dir (str): Directory where cached features are stored
+            version (dict): Version of the features from feature_store_version
+            key_type (str): id to key features by image id and hash to key
+                            them by the content of the image
+            dataset_root (str): Root directory for the images, used with hash keys
+
+        Return:
+            None
+        """
+        if key_type not in ("id", "hash"):
+            raise ValueError(f"Unsupported key type {key_type} for feature cache")
+        self.key_type = key_type
+        self.dataset_root = dataset_root
+        checksum = model_checksum(version["model_paths"])
+        detector_class = version["detector_class"]
+        cache_version = {
+            "detector_class": detector_class,
+            "model_checksum": checksum,
+            "key_type": key_type,
+        }
+        store_dir = os.path.join(
+            cache_dir, f"{detector_class}.{checksum[:16]}.{key_type}"
+        )
+        self.feature_store = FeatureStore(store_dir, cache_version, mode="a")
+        self._keys: Dict[str, str] = {}
+
+    def _key(self, image_id: str) -> str:
+        """Return key used by the cache for an image."""
+        if self.key_type == "id":
+            return image_id
+        if image_id not in self._keys:
+            image_path = os.path.join(self.dataset_root, image_id)
+            self._keys[image_id] = _file_digest(image_path)
+        return self._keys[image_id]
+
+    def lookup(self, image_ids: List[str]) -> Tuple[Dict, Dict, List[str]]:
+        """
+        Get cached features and logits for images.
+
+        Args:
+            image_ids (list): List of image ids
+
+        Return:
+            Tuple with features and logits for the hits and ids that were missed
+        """
+        # Other tests and sessions may have added features to the cache
+        self.feature_store.refresh()
+        hit_ids = []
+        missed_ids = []
+        for image_id in image_ids:
+            if self._key(image_id) in self.feature_store:
+                hit_ids.append(image_id)
+            else:
+                missed_ids.append(image_id)
+        if len(hit_ids) == 0:
+            return {}, {}, missed_ids
+        keys = [self._key(image_id) for image_id in hit_ids]
+        features = self.feature_store.features(keys)
+        logits = self.feature_store.logits(keys)
+        features_dict = {
+            image_id: features[key] for image_id, key in zip(hit_ids, keys)
+        }
+        logit_dict = {image_id: logits[key] for image_id, key in zip(hit_ids, keys)}
+        return features_dict, logit_dict, missed_ids
+
+    def add(self, features_dict: Dict[str, Any], logit_dict: Dict[str, Any]) -> None:
+        """
+        Add features and logits for images to the cache.
+
+        Args:
+            features_dict (dict): Dictionary with image id as key and features as value
+            logit_dict (dict): Dictionary with image id as key and logits as value
+
+        Return:
+            None
+        """
+        self.feature_store.append(
+            {self._key(image_id): val for image_id, val in features_dict.items()},
+            {self._key(image_id): val for image_id, val in logit_dict.items()},
+        )
+
+
+def extract_features(
+    novelty_algorithm: Any,
+    toolset: Dict,
+    feature_cache: Optional[FeatureCache],
+    image_ids: List[str],
+) -> Tuple[Dict, Dict]:
+    """
+    Run feature extraction only for the images missing in the cache.
+
+    The algorithm is provided a dataset file with the images that were missed,
+    its output is added to the cache and merged with the hits in the order of
+    the images in the round.
+
+    Args:
+        novelty_algorithm: Algorithm used for feature extraction
+        toolset (dict): Toolset used by the protocol
+        feature_cache (FeatureCache): Cache for the features, None to extract
+                                      features for all the images
+        image_ids (list): List of image ids in the round
+
+    Return:
+        Tuple with features and logits for all the images in the round
+    """
+    if feature_cache is None:
+        return novelty_algorithm.execute(toolset, "FeatureExtraction")
+    features_dict, logit_dict, missed_ids = feature_cache.lookup(image_ids)
+    logging.info(
+        f"Feature cache hits: {len(image_ids) - len(missed_ids)}/{len(image_ids)}"
+    )
+    if len(missed_ids) > 0:
+        dataset = toolset["dataset"]
+        missed_dataset = ""
+        if len(missed_ids) < len(image_ids) and isinstance(dataset, str):
+            missed_dataset = f"{os.path.splitext(dataset)[0]}_missed.csv"
+            with open(missed_dataset, "w") as f:
+                f.writelines([f"{image_id}\n" for image_id in missed_ids])
+            toolset["dataset"] = missed_dataset
+        elif len(missed_ids) < len(image_ids):
+            # Datasets kept in memory are replaced by the missed image ids
+            toolset["dataset"] = missed_ids
+        try:
+            missed_features, missed_logits = novelty_algorithm.execute(
+                toolset, "FeatureExtraction"
+            )
+        finally:
+            toolset["dataset"] = dataset
+            safe_remove(missed_dataset)
+        feature_cache.add(missed_features, missed_logits)
+        features_dict.update(missed_features)
+        logit_dict.update(missed_logits)
+    return (
+        {
+            image_id: features_dict[image_id]
+            for image_id in image_ids
+            if image_id in features_dict
+        },
+        {
+            image_id: logit_dict[image_id]
+            for image_id in image_ids
+            if image_id in logit_dict
+        },
+    )
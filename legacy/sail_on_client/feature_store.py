@@ -0,0 +1,472 @@
+"""Memory mapped store for features and logits extracted by a detector."""
+
+import fcntl
+import json
+import os
+import logging
+import queue
+import threading
+import numpy as np
+import torch
+
+from contextlib import contextmanager
+from sail_on_client.utils import ProtocolConfig
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+STORE_FORMAT_VERSION = 2
+
+
+def _model_paths(detector_config: Any) -> List[str]:
+    """
+    Collect paths of the models used by a detector.
+
+    Args:
+        detector_config (dict): Detector configuration from the protocol config
+
+    Return:
+        Sorted list of model paths present in the configuration
+    """
+    paths: List[str] = []
+    if isinstance(detector_config, dict):
+        for key, value in detector_config.items():
+            if isinstance(value, dict):
+                paths.extend(_model_paths(value))
+            elif key == "model_path" or key.endswith("weight_path"):
+                paths.append(str(value))
+    return sorted(paths)
+
+
+def feature_store_version(config: ProtocolConfig) -> Dict[str, Any]:
+    """
+    Version of the features produced with a protocol configuration.
+
+    Args:
+        config (dict or Config): Protocol configuration
+
+    Return:
+        Dictionary with detector class and model paths
+    """
+    return {
+        "detector_class": config["novelty_detector_class"],
+        "model_paths": _model_paths(config["detector_config"]),
+    }
+
+
+def _as_array(value: Any) -> np.ndarray:
+    """
+    Convert a feature or logit to a numpy array.
+
+    Args:
+        value: Tensor, array or sequence associated with an image
+
+    Return:
+        Numpy array for the value
+    """
+    if hasattr(value, "detach"):
+        value = value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+class FeatureStore(object):
+    """
+    Columnar store that keeps features and logits in memory mapped files.
+
+    A store is a directory with one raw binary file per column, an index.json
+    that describes the columns and an ids.jsonl log with a line for the image
+    ids of every append. Rows are appended in the order the image ids are
+    provided and are only visible once their line is added to the log, so an
+    append costs the same however large the store is. Appends hold a lock on
+    the store, so several processes can append to it.
+    """
+
+    def __init__(
+        self, store_dir: str, version: Optional[Dict] = None, mode: str = "r"
+    ) -> None:
+        """
+        Open a feature store.
+
+        Args:
+            store_dir (str): Directory used by the store
+            version (dict): Expected version of the store, checked if provided
+            mode (str): r to read an existing store and a to append to a store
+
+        Return:
+            None
+        """
+        if mode not in ("r", "a"):
+            raise ValueError(f"Unsupported mode {mode} for feature store")
+        self.store_dir = store_dir
+        self.mode = mode
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.ids_path = os.path.join(store_dir, "ids.jsonl")
+        self._ids_offset = 0
+        self._loaded_stat = self._index_stat()
+        self._memmaps: Dict[str, np.ndarray] = {}
+        self.version = version
+        self.columns: Dict[str, Dict] = {}
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        if mode == "r" and not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No feature store found in {store_dir}")
+        elif mode == "a":
+            os.makedirs(store_dir, exist_ok=True)
+            with self._lock():
+                self._load_index()
+                self._truncate()
+                if not os.path.exists(self.index_path):
+                    self._write_index()
+        else:
+            self._load_index()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickle the store without its memory maps, which are mapped again."""
+        state = dict(self.__dict__)
+        state["_memmaps"] = {}
+        return state
+
+    def _load_index(self) -> None:
+        """Load rows added to the log since it was last loaded."""
+        if not os.path.exists(self.index_path):
+            return
+        if not self.columns:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index["store_format_version"] != STORE_FORMAT_VERSION:
+                raise ValueError(
+                    f"Feature store in {self.store_dir} has format "
+                    f"{index['store_format_version']} instead of "
+                    f"{STORE_FORMAT_VERSION}"
+                )
+            if self.version is not None and index["version"] != self.version:
+                raise ValueError(
+                    f"Feature store in {self.store_dir} was created with "
+                    f"{index['version']} instead of {self.version}"
+                )
+            self.version = index["version"]
+            self.columns = index["columns"]
+        if not os.path.exists(self.ids_path):
+            return
+        with open(self.ids_path, "rb") as f:
+            f.seek(self._ids_offset)
+            log = f.read()
+        # A line without a newline is an append that is still being written
+        lines = log.split(b"\n")[:-1]
+        if len(lines) == 0:
+            return
+        for line in lines:
+            for image_id in json.loads(line):
+                self.rows[image_id] = len(self.ids)
+                self.ids.append(image_id)
+            self._ids_offset += len(line) + 1
+        self._memmaps = {}
+
+    def _index_stat(self) -> Tuple[Tuple[int, int], ...]:
+        """Return size and modification time of the index and the log."""
+        stats = []
+        for path in (self.index_path, self.ids_path):
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                stats.append((-1, -1))
+        return tuple(stats)
+
+    def refresh(self) -> bool:
+        """
+        Load rows appended by other processes if the index or the log changed.
+
+        Return:
+            True if the index or the log changed since they were last checked
+        """
+        index_stat = self._index_stat()
+        if index_stat == self._loaded_stat:
+            return False
+        # The files are checked before they are read, so a later change is seen
+        self._loaded_stat = index_stat
+        self._load_index()
+        return True
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold an exclusive lock on the store."""
+        with open(os.path.join(self.store_dir, "lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        """Return number of images in the store."""
+        return len(self.ids)
+
+    def __contains__(self, image_id: object) -> bool:
+        """Check if features for an image are present in the store."""
+        return image_id in self.rows
+
+    def _column_path(self, column: str) -> str:
+        """Return path to the binary file for a column."""
+        return os.path.join(self.store_dir, f"{column}.bin")
+
+    def _row_nbytes(self, column: str) -> int:
+        """Return number of bytes used by a row of the column."""
+        column_info = self.columns[column]
+        row_size = int(np.prod(column_info["shape"], dtype=np.int64))
+        return row_size * np.dtype(column_info["dtype"]).itemsize
+
+    def _truncate(self) -> None:
+        """Drop rows written to the data files without being added to the log."""
+        if (
+            os.path.exists(self.ids_path)
+            and os.path.getsize(self.ids_path) > self._ids_offset
+        ):
+            logging.warning(f"Dropping partially written ids in {self.ids_path}")
+            with open(self.ids_path, "r+b") as f:
+                f.truncate(self._ids_offset)
+        for column in self.columns:
+            column_path = self._column_path(column)
+            expected_size = len(self.ids) * self._row_nbytes(column)
+            if os.path.getsize(column_path) > expected_size:
+                logging.warning(f"Dropping partially written rows in {column_path}")
+                with open(column_path, "r+b") as f:
+                    f.truncate(expected_size)
+
+    def _write_index(self) -> None:
+        """Atomically replace the description of the columns in the store."""
+        index = {
+            "store_format_version": STORE_FORMAT_VERSION,
+            "version": self.version,
+            "columns": self.columns,
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, features_dict: Dict[str, Any], logit_dict: Dict[str, Any]) -> int:
+        """
+        Append features and logits for images that are not in the store.
+
+        Args:
+            features_dict (dict): Dictionary with image id as key and features as value
+            logit_dict (dict): Dictionary with image id as key and logits as value
+
+        Return:
+            Number of rows added to the store
+        """
+        if self.mode != "a":
+            raise ValueError("Feature store was not opened for appending")
+        with self._lock():
+            # Other processes may have appended to the store since it was loaded
+            self._load_index()
+            self._truncate()
+            return self._append(features_dict, logit_dict)
+
+    def _append(self, features_dict: Dict[str, Any], logit_dict: Dict[str, Any]) -> int:
+        """Append rows to the store while holding the lock."""
+        image_ids = [
+            image_id for image_id in features_dict if image_id not in self.rows
+        ]
+        if len(image_ids) == 0:
+            return 0
+        column_values = {
+            "features": [features_dict[image_id] for image_id in image_ids],
+            "logits": [logit_dict[image_id] for image_id in image_ids],
+        }
+        new_columns = False
+        for column, values in column_values.items():
+            data = np.ascontiguousarray(np.stack([_as_array(v) for v in values]))
+            column_info = {
+                "dtype": data.dtype.str,
+                "shape": list(data.shape[1:]),
+                "tensor": isinstance(values[0], torch.Tensor),
+            }
+            if column not in self.columns:
+                self.columns[column] = column_info
+                new_columns = True
+            elif self.columns[column] != column_info:
+                raise ValueError(
+                    f"Expected {column} with {self.columns[column]} got {column_info}"
+                )
+            with open(self._column_path(column), "ab") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        if new_columns:
+            self._write_index()
+        line = f"{json.dumps(image_ids)}\n".encode("utf-8")
+        with open(self.ids_path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._ids_offset += len(line)
+        for image_id in image_ids:
+            self.rows[image_id] = len(self.ids)
+            self.ids.append(image_id)
+        self._memmaps = {}
+        return len(image_ids)
+
+    def _memmap(self, column: str) -> np.ndarray:
+        """Return a copy on write memory map over the rows of a column in the log."""
+        if column not in self.columns:
+            # nothing was appended to the store yet
+            return np.empty(0)
+        if column not in self._memmaps:
+            column_info = self.columns[column]
+            if len(self.ids) == 0:
+                # an empty file can not be memory mapped
+                return np.empty(
+                    (0, *column_info["shape"]), dtype=np.dtype(column_info["dtype"])
+                )
+            self._memmaps[column] = np.memmap(
+                self._column_path(column),
+                dtype=np.dtype(column_info["dtype"]),
+                mode="c",
+                shape=(len(self.ids), *column_info["shape"]),
+            )
+        return self._memmaps[column]
+
+    def _rows(
+        self, column: str, image_ids: Iterable[str]
+    ) -> Dict[str, Union[np.ndarray, torch.Tensor]]:
+        """Return views of the rows associated with the images in a column."""
+        data = self._memmap(column)
+        if self.columns.get(column, {}).get("tensor"):
+            return {
+                image_id: torch.from_numpy(data[self.rows[image_id]])
+                for image_id in image_ids
+            }
+        return {image_id: data[self.rows[image_id]] for image_id in image_ids}
+
+    def features(
+        self, image_ids: Iterable[str]
+    ) -> Dict[str, Union[np.ndarray, torch.Tensor]]:
+        """
+        Get features for images without copying them.
+
+        Args:
+            image_ids (list): List of image ids
+
+        Return:
+            Dictionary with image id as key and a view of the features as value.
+            The view is a tensor if the features were saved as tensors.
+        """
+        return self._rows("features", image_ids)
+
+    def logits(
+        self, image_ids: Iterable[str]
+    ) -> Dict[str, Union[np.ndarray, torch.Tensor]]:
+        """
+        Get logits for images without copying them.
+
+        Args:
+            image_ids (list): List of image ids
+
+        Return:
+            Dictionary with image id as key and a view of the logits as value.
+            The view is a tensor if the logits were saved as tensors.
+        """
+        return self._rows("logits", image_ids)
+
+    def gather(
+        self, image_ids: List[str]
+    ) -> Tuple[Union[np.ndarray, torch.Tensor], Union[np.ndarray, torch.Tensor]]:
+        """
+        Gather features and logits for images in contiguous arrays.
+
+        Args:
+            image_ids (list): List of image ids
+
+        Return:
+            Tuple with features and logits where the i-th row is associated with
+            the i-th image id. The arrays are tensors if they were saved as tensors.
+        """
+        rows = np.fromiter(
+            (self.rows[image_id] for image_id in image_ids),
+            dtype=np.int64,
+            count=len(image_ids),
+        )
+        gathered: List[Union[np.ndarray, torch.Tensor]] = []
+        for column in ("features", "logits"):
+            data = np.asarray(self._memmap(column)[rows])
+            if self.columns.get(column, {}).get("tensor"):
+                gathered.append(torch.from_numpy(data))
+            else:
+                gathered.append(data)
+        return gathered[0], gathered[1]
+
+
+class FeatureWriter(object):
+    """
+    Append features to a feature store on a background thread.
+
+    Every call to write is appended to the store as soon as the thread gets to
+    it, so the features of a test are on disk round by round instead of being
+    accumulated in memory till the end of the test.
+    """
+
+    def __init__(self, feature_store: FeatureStore, max_pending: int = 4) -> None:
+        """
+        Start a writer for a feature store.
+
+        Args:
+            feature_store (FeatureStore): Store opened for appending
+            max_pending (int): Number of rounds that can be queued before write blocks
+
+        Return:
+            None
+        """
+        self.feature_store = feature_store
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._write_rounds, daemon=True)
+        self._thread.start()
+
+    def _write_rounds(self) -> None:
+        """Append rounds from the queue till the writer is closed."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self.feature_store.append(*item)
+            except Exception as e:
+                logging.exception(f"Failed to write in {self.feature_store.store_dir}")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self) -> None:
+        """Raise error encountered by the background thread."""
+        if self._error is not None:
+            raise RuntimeError(
+                f"Failed to write features in {self.feature_store.store_dir}"
+            ) from self._error
+
+    def write(self, features_dict: Dict[str, Any], logit_dict: Dict[str, Any]) -> None:
+        """
+        Queue features and logits of a round for writing.
+
+        Args:
+            features_dict (dict): Dictionary with image id as key and features as value
+            logit_dict (dict): Dictionary with image id as key and logits as value
+
+        Return:
+            None
+        """
+        self._check_error()
+        self._queue.put((features_dict, logit_dict))
+
+    def close(self) -> None:
+        """
+        Wait for queued rounds to be written and stop the thread.
+
+        Return:
+            None
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
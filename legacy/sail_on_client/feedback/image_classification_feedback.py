@@ -1,6 +1,7 @@
 """Image Classification Feedback."""
 import pandas as pd
 
+from sail_on_client.instrumentation import InstrumentedHarness
 from sail_on_client.protocol.parinterface import ParInterface
 from sail_on_client.protocol.localinterface import LocalInterface
 
@@ -15,7 +16,7 @@ class ImageClassificationFeedback:
         first_budget: int,
         income_per_batch: int,
         maximum_budget: int,
-        interface: Union[LocalInterface, ParInterface],
+        interface: Union[LocalInterface, ParInterface, InstrumentedHarness],
         session_id: str,
         test_id: str,
         feedback_type: str = "classification",
@@ -0,0 +1,405 @@
+"""Record time spent in the stages of a protocol as json lines."""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from sail_on_client.utils import dataset_ids
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+
+class StageRecorder(object):
+    """
+    Record wall time, cpu time, images and bytes for stages of a protocol.
+
+    Every record is written as a json line in the record file. CPU time is
+    measured for the process, so it includes threads that run concurrently
+    with the stage. A recorder unpickled in a worker process appends to the
+    same file.
+    """
+
+    def __init__(self, record_path: str = "", session_id: str = "") -> None:
+        """
+        Initialize the recorder.
+
+        Args:
+            record_path (str): Path to the json lines file for the records,
+                               nothing is recorded if the path is empty
+            session_id (str): Session identifier added to the records
+
+        Return:
+            None
+        """
+        self.record_path = record_path
+        self.session_id = session_id
+        self._lock = threading.Lock()
+        self._record_file: Optional[TextIO] = None
+        if record_path:
+            self._record_file = open(record_path, "a")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickle the recorder without its lock and record file."""
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        state["_record_file"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Reopen the record file in the process that unpickles the recorder."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if self.record_path:
+            self._record_file = open(self.record_path, "a")
+
+    @property
+    def enabled(self) -> bool:
+        """Check if the stages are recorded."""
+        return self._record_file is not None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """Write a record as a single line."""
+        with self._lock:
+            if self._record_file is None:
+                return
+            self._record_file.write(f"{json.dumps(record)}\n")
+            self._record_file.flush()
+
+    @contextmanager
+    def record(
+        self, stage: str, test_id: str = "", round_id: int = -1
+    ) -> Iterator[Dict[str, int]]:
+        """
+        Record a stage executed in the context.
+
+        Args:
+            stage (str): Name of the stage
+            test_id (str): Test id, empty for stages that are not part of a test
+            round_id (int): Round id, -1 for stages that are not part of a round
+
+        Return:
+            Dictionary where the number of images and bytes processed by the
+            stage can be set. Stages that raise an error are not recorded.
+        """
+        metrics = {"images": 0, "bytes": 0}
+        if not self.enabled:
+            yield metrics
+            return
+        start_wall_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        yield metrics
+        wall_time = time.perf_counter() - start_wall_time
+        self._write(
+            {
+                "session_id": self.session_id,
+                "test_id": test_id,
+                "round_id": round_id,
+                "stage": stage,
+                "wall_time": wall_time,
+                "cpu_time": time.process_time() - start_cpu_time,
+                "images": metrics["images"],
+                "images_per_second": (
+                    metrics["images"] / wall_time if wall_time > 0 else 0.0
+                ),
+                "bytes": metrics["bytes"],
+                "pid": os.getpid(),
+            }
+        )
+
+    def close(self) -> None:
+        """
+        Close the record file.
+
+        Return:
+            None
+        """
+        with self._lock:
+            if self._record_file is not None:
+                self._record_file.close()
+                self._record_file = None
+
+
+def _file_size(file_path: Optional[str]) -> int:
+    """Return size of a file, 0 if the file does not exist."""
+    if file_path is None or not os.path.isfile(file_path):
+        return 0
+    return os.path.getsize(file_path)
+
+
+def _result_size(result: Any) -> int:
+    """
+    Return size of a result without serializing it.
+
+    Args:
+        result: Path to a result file, a text or binary buffer, or a DataFrame
+
+    Return:
+        Size of the file or the buffer, memory used by the values of a DataFrame
+    """
+    if isinstance(result, str):
+        return _file_size(result)
+    elif isinstance(result, io.BytesIO):
+        return result.getbuffer().nbytes
+    elif isinstance(result, io.StringIO):
+        return len(result.getvalue())
+    elif hasattr(result, "memory_usage"):
+        return int(result.memory_usage(index=False, deep=True).sum())
+    return 0
+
+
+class InstrumentedAlgorithm(object):
+    """Algorithm that records the time spent in every step it executes."""
+
+    def __init__(self, algorithm: Any, stage_recorder: StageRecorder) -> None:
+        """
+        Wrap an algorithm.
+
+        Args:
+            algorithm: Algorithm used by the protocol
+            stage_recorder (StageRecorder): Recorder for the steps
+
+        Return:
+            None
+        """
+        self.algorithm = algorithm
+        self.stage_recorder = stage_recorder
+        self._round_images: Tuple[Any, int] = (None, 0)
+
+    def __getattr__(self, name: str) -> Any:
+        """Provide attributes of the algorithm."""
+        if name in ("algorithm", "stage_recorder", "_round_images"):
+            raise AttributeError(name)
+        return getattr(self.algorithm, name)
+
+    def _images(self, toolset: Dict) -> int:
+        """Return number of images in the dataset of the round in the toolset."""
+        dataset = toolset.get("dataset")
+        if dataset is None:
+            return 0
+        # The ids are read once for all the steps of a round
+        if self._round_images[0] is not dataset:
+            self._round_images = (dataset, len(dataset_ids(dataset)))
+        return self._round_images[1]
+
+    def execute(self, toolset: Dict, step_descriptor: str) -> Any:
+        """
+        Execute a step of the algorithm and record it.
+
+        Args:
+            toolset (dict): Dictionary containing parameters for different steps
+            step_descriptor (str): Name of the step
+
+        Return:
+            Output of the step
+        """
+        with self.stage_recorder.record(
+            step_descriptor, toolset.get("test_id", ""), toolset.get("round_id", -1)
+        ) as metrics:
+            output = self.algorithm.execute(toolset, step_descriptor)
+            if step_descriptor == "FeatureExtraction" and isinstance(output, tuple):
+                metrics["images"] = len(output[0])
+            elif step_descriptor != "Initialize" and self.stage_recorder.enabled:
+                # Images in the round processed by the step
+                metrics["images"] = self._images(toolset)
+        return output
+
+
+class InstrumentedHarness(object):
+    """Harness that records the time spent in requests for a round."""
+
+    def __init__(self, harness: Any, stage_recorder: StageRecorder) -> None:
+        """
+        Wrap a harness.
+
+        Args:
+            harness (Harness): Harness used by the protocol
+            stage_recorder (StageRecorder): Recorder for the requests
+
+        Return:
+            None
+        """
+        self.harness = harness
+        self.stage_recorder = stage_recorder
+
+    def __getattr__(self, name: str) -> Any:
+        """Provide attributes of the harness."""
+        if name in ("harness", "stage_recorder"):
+            raise AttributeError(name)
+        return getattr(self.harness, name)
+
+    def dataset_request(self, test_id: str, round_id: int, session_id: str) -> str:
+        """
+        Request data for evaluation and record the request.
+
+        Args:
+            test_id (str): The test being evaluated at this moment.
+            round_id (int): The sequential number of the round being evaluated
+            session_id (str): The identifier provided by the server for a single
+                              experiment
+
+        Return:
+            Filename of a file containing a list of image files
+        """
+        with self.stage_recorder.record(
+            "dataset_request", test_id, round_id
+        ) as metrics:
+            dataset = self.harness.dataset_request(test_id, round_id, session_id)
+            if self.stage_recorder.enabled:
+                with open(dataset, "r") as f:
+                    metrics["images"] = len(f.readlines())
+                metrics["bytes"] = _file_size(dataset)
+        return dataset
+
+    def dataset_ids_request(
+        self, test_id: str, round_id: int, session_id: str
+    ) -> List[str]:
+        """
+        Request the image ids for a round and record the request.
+
+        Args:
+            test_id (str): The test being evaluated at this moment.
+            round_id (int): The sequential number of the round being evaluated
+            session_id (str): The identifier provided by the server for a single
+                              experiment
+
+        Return:
+            List of image files
+        """
+        with self.stage_recorder.record(
+            "dataset_request", test_id, round_id
+        ) as metrics:
+            image_ids = self.harness.dataset_ids_request(test_id, round_id, session_id)
+            metrics["images"] = len(image_ids)
+            metrics["bytes"] = sum(len(image_id) + 1 for image_id in image_ids)
+        return image_ids
+
+    def get_feedback_request(
+        self,
+        feedback_ids: list,
+        feedback_type: str,
+        test_id: str,
+        round_id: int,
+        session_id: str,
+    ) -> str:
+        """
+        Get feedback for images and record the request.
+
+        Args:
+            feedback_ids (list): List of media ids for which feedback is required
+            feedback_type (str): Type of feedback, e.g. classification
+            test_id (str): The id of the test currently being evaluated
+            round_id (int): The sequential number of the round being evaluated
+            session_id (str): The id provided by a server denoting a session
+
+        Return:
+            Path to a file containing the requested feedback
+        """
+        with self.stage_recorder.record(
+            "get_feedback_request", test_id, round_id
+        ) as metrics:
+            feedback_file = self.harness.get_feedback_request(
+                feedback_ids, feedback_type, test_id, round_id, session_id
+            )
+            metrics["images"] = len(feedback_ids)
+            if self.stage_recorder.enabled:
+                metrics["bytes"] = _file_size(feedback_file)
+        return feedback_file
+
+    def get_test_metadata(self, session_id: str, test_id: str) -> Dict[str, Any]:
+        """
+        Retrieve the metadata for a test and record the request.
+
+        Args:
+            session_id (str): The id provided by a server denoting a session
+            test_id (str): The id of the test currently being evaluated
+
+        Return:
+            Metadata of the test
+        """
+        with self.stage_recorder.record("get_test_metadata", test_id):
+            return self.harness.get_test_metadata(session_id, test_id)
+
+    def post_results(
+        self, result_files: Dict[str, Any], test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """
+        Post results for a round and record the request.
+
+        Args:
+            result_files (dict): A dictionary of results with protocol constant
+                                 as key and file path, buffer or DataFrame
+                                 as value
+            test_id (str): The id of the test currently being evaluated
+            round_id (int): The sequential number of the round being evaluated
+            session_id (str): The id provided by a server denoting a session
+
+        Return:
+            None
+        """
+        with self.stage_recorder.record("post_results", test_id, round_id) as metrics:
+            if self.stage_recorder.enabled:
+                metrics["bytes"] = sum(map(_result_size, result_files.values()))
+            self.harness.post_results(result_files, test_id, round_id, session_id)
+
+    def post_results_batch(
+        self, batch: List[Tuple[Dict[str, Any], str, int]], session_id: str
+    ) -> List[Optional[Exception]]:
+        """
+        Post results for many rounds and record the request.
+
+        Args:
+            batch (list): List of (result_files, test_id, round_id) for the rounds
+            session_id (str): The id provided by a server denoting a session
+
+        Return:
+            Error raised for every round, None for rounds that were posted
+        """
+        with self.stage_recorder.record("post_results_batch") as metrics:
+            if self.stage_recorder.enabled:
+                metrics["bytes"] = sum(
+                    _result_size(result)
+                    for result_files, _, _ in batch
+                    for result in result_files.values()
+                )
+            return self.harness.post_results_batch(batch, session_id)
+
+
+def write_stage_summary(record_path: str, session_id: str) -> Dict[str, Dict]:
+    """
+    Summarize the records for a session and append the summary to the records.
+
+    Args:
+        record_path (str): Path to the json lines file with the records
+        session_id (str): Session identifier
+
+    Return:
+        Dictionary with the name of a stage as key and totals for the stage as value
+    """
+    records: List[Dict[str, Any]] = []
+    if os.path.exists(record_path):
+        with open(record_path, "r") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    summary: Dict[str, Dict] = {}
+    for record in records:
+        if record.get("session_id") != session_id or "stage" not in record:
+            continue
+        stage_summary = summary.setdefault(
+            record["stage"],
+            {"count": 0, "wall_time": 0.0, "cpu_time": 0.0, "images": 0, "bytes": 0},
+        )
+        stage_summary["count"] += 1
+        for key in ["wall_time", "cpu_time", "images", "bytes"]:
+            stage_summary[key] += record[key]
+    for stage_summary in summary.values():
+        wall_time = stage_summary["wall_time"]
+        stage_summary["images_per_second"] = (
+            stage_summary["images"] / wall_time if wall_time > 0 else 0.0
+        )
+    with open(record_path, "a") as f:
+        f.write(f"{json.dumps({'session_id': session_id, 'summary': summary})}\n")
+    for stage, stage_summary in summary.items():
+        logging.info(f"Stage {stage}: {stage_summary}")
+    return summary
@@ -0,0 +1,206 @@
+"""Record the progress of a session so an interrupted session can be resumed."""
+
+import json
+import logging
+import os
+
+from sail_on_client.feature_store import FeatureStore
+from typing import Any, Dict, Optional, Set
+
+
+class ProgressLedger(object):
+    """
+    Append only ledger with the completed tests and rounds of a session.
+
+    Every entry is a json line that is synced to disk before the method
+    recording it returns, so the ledger survives a crash of the client. A
+    round is recorded once its results are posted and a test once all its
+    results are posted and its features and attributes are saved. Entries
+    written before the last session in the ledger are ignored.
+    """
+
+    def __init__(self, ledger_path: str = "") -> None:
+        """
+        Open a ledger and load the entries for the last session in it.
+
+        Args:
+            ledger_path (str): Path to the json lines file for the ledger,
+                               nothing is recorded if the path is empty
+
+        Return:
+            None
+        """
+        self.ledger_path = ledger_path
+        self.session_id: Optional[str] = None
+        self.session_ended = False
+        self.completed_tests: Set[str] = set()
+        self.rounds: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        if ledger_path and os.path.exists(ledger_path):
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        """Check if the progress is recorded."""
+        return bool(self.ledger_path)
+
+    def _load(self) -> None:
+        """Load entries from the ledger file."""
+        with open(self.ledger_path, "r") as f:
+            lines = f.readlines()
+        for line_no, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last entry is partially written if the client crashed
+                if line_no == len(lines) - 1:
+                    logging.warning(f"Ignoring partial entry in {self.ledger_path}")
+                    continue
+                raise
+            self._apply(entry)
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        """Update the progress with an entry."""
+        event = entry["event"]
+        if event == "session":
+            self.session_id = entry["session_id"]
+            self.session_ended = False
+            self.completed_tests = set()
+            self.rounds = {}
+        elif event == "round":
+            self.rounds.setdefault(entry["test_id"], {})[entry["round_id"]] = entry
+        elif event == "test":
+            self.completed_tests.add(entry["test_id"])
+        elif event == "session_end":
+            self.session_ended = True
+        else:
+            raise ValueError(f"Unknown event {event} in {self.ledger_path}")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        """Append an entry to the ledger and sync it to disk."""
+        self._apply(entry)
+        if not self.enabled:
+            return
+        # Every entry is a single append, so workers can share the ledger
+        with open(self.ledger_path, "a") as f:
+            f.write(f"{json.dumps(entry)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start_session(self, session_id: str) -> None:
+        """
+        Record the start of a session, this discards the progress of earlier sessions.
+
+        Args:
+            session_id (str): Session identifier provided by the server
+
+        Return:
+            None
+        """
+        self._write({"event": "session", "session_id": session_id})
+
+    def end_session(self) -> None:
+        """
+        Record that the session was terminated.
+
+        Return:
+            None
+        """
+        self._write({"event": "session_end", "session_id": self.session_id})
+
+    def record_round(
+        self, test_id: str, round_id: int, feature_offset: int = 0
+    ) -> None:
+        """
+        Record a completed round.
+
+        Args:
+            test_id (str): The id of the test
+            round_id (int): The sequential number of the round
+            feature_offset (int): Number of images in the test up to the end
+                                  of the round, i.e. the rows of the saved
+                                  features that belong to completed rounds
+
+        Return:
+            None
+        """
+        self._write(
+            {
+                "event": "round",
+                "test_id": test_id,
+                "round_id": round_id,
+                "feature_offset": feature_offset,
+            }
+        )
+
+    def record_test(self, test_id: str) -> None:
+        """
+        Record a completed test.
+
+        Args:
+            test_id (str): The id of the test
+
+        Return:
+            None
+        """
+        self._write({"event": "test", "test_id": test_id})
+
+    def test_complete(self, test_id: str) -> bool:
+        """Check if a test is complete."""
+        return test_id in self.completed_tests
+
+    def last_round(self, test_id: str) -> int:
+        """
+        Find the last round of a test that is complete.
+
+        Rounds are posted in order, so the rounds before the last completed
+        round are complete as well.
+
+        Args:
+            test_id (str): The id of the test
+
+        Return:
+            Last completed round, -1 if no round is complete
+        """
+        return max(self.rounds.get(test_id, {}).keys(), default=-1)
+
+    def feature_offset(self, test_id: str) -> int:
+        """
+        Get the number of images in the completed rounds of a test.
+
+        Args:
+            test_id (str): The id of the test
+
+        Return:
+            Feature offset recorded for the last completed round
+        """
+        last_round = self.last_round(test_id)
+        if last_round < 0:
+            return 0
+        return self.rounds[test_id][last_round]["feature_offset"]
+
+    def saved_features(
+        self, test_id: str, store_dir: str, version: Optional[Dict] = None
+    ) -> Optional[FeatureStore]:
+        """
+        Open the features saved for the completed rounds of a test.
+
+        Args:
+            test_id (str): The id of the test
+            store_dir (str): Directory of the feature store for the test
+            version (dict): Expected version of the store
+
+        Return:
+            Feature store opened for reading, None if no features were saved
+        """
+        try:
+            feature_store = FeatureStore(store_dir, version)
+        except FileNotFoundError:
+            return None
+        feature_offset = self.feature_offset(test_id)
+        if len(feature_store) < feature_offset:
+            logging.warning(
+                f"{store_dir} has features for {len(feature_store)} of the "
+                f"{feature_offset} images in completed rounds, the missing "
+                "features are extracted again"
+            )
+        return feature_store
@@ -0,0 +1,407 @@
+"""Asyncio client implementation for Par interface."""
+
+import asyncio
+import json
+import os
+import traceback
+
+from functools import partial
+from typing import Any, Callable, Dict, Optional, TypeVar, Union
+from sail_on_client.errors import ServerError
+from sail_on_client.protocol.parinterface import api_error
+from sail_on_client.utils import result_content
+from json import JSONDecodeError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore
+
+T = TypeVar("T")
+
+
+def _read_file(path: str) -> str:
+    """
+    Read a text file.
+
+    Arguments:
+        -path : path to the file
+    Returns:
+        -content of the file
+    """
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _write_file(path: str, content: bytes) -> None:
+    """
+    Write a response to a file.
+
+    Arguments:
+        -path    : path to the file
+        -content : body of the response
+    Returns: No return
+    """
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+class AsyncParInterface(object):
+    """
+    Interface to PAR server with awaitable requests.
+
+    The requests of all the sessions driven by an event loop share the
+    connection pool of the interface, so a single thread can evaluate many
+    sessions concurrently. The pool is bound to the event loop that makes the
+    first request and is released by close. Files are read and written by the
+    default executor of the event loop so requests are not blocked by disk.
+    """
+
+    def __init__(self, configfile: str, configfolder: str) -> None:
+        """
+        Initialize a client connection object.
+
+        Arguments:
+            -configfile   : name of the json file with the url of the server
+            -configfolder : directory with the configuration file
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncParInterface requires aiohttp, install sail_on_client[async]"
+            )
+        with open(os.path.join(configfolder, configfile), "r") as f:
+            self.configuration_data = json.load(f)
+        self.api_url = self.configuration_data["url"]
+        self.folder = configfolder
+        self.pool_size = self.configuration_data.get("pool_size", 100)
+        self.keep_alive = self.configuration_data.get("keep_alive", True)
+        self._client: Optional["aiohttp.ClientSession"] = None
+
+    def _session(self) -> "aiohttp.ClientSession":
+        """
+        Get the client session with pooled connections.
+
+        Returns:
+            -client session
+        """
+        if self._client is None or self._client.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, force_close=not self.keep_alive
+            )
+            self._client = aiohttp.ClientSession(connector=connector)
+        return self._client
+
+    def _check_response(self, status: int, content: bytes) -> None:
+        """
+        Raise the error reported by the server.
+
+        Arguments:
+            -status  : HTTP status code of the response
+            -content : body of the response
+        Returns: No return
+        """
+        if status == 200:
+            return
+        try:
+            error = api_error(status, json.loads(content))
+        except JSONDecodeError:
+            raise ServerError(
+                "InvalidResponse",
+                f"Server responded with {status}: {content.decode('utf-8', 'replace')}",
+                traceback.format_exc(),
+            )
+        if error is None:
+            raise ServerError("UnexpectedStatus", f"Server responded with {status}")
+        raise error
+
+    @staticmethod
+    async def _run_blocking(func: Callable[..., T], *args: Any) -> T:
+        """
+        Run a blocking function in the default executor of the event loop.
+
+        Arguments:
+            -func : function that blocks
+            -args : arguments for the function
+        Returns:
+            -value returned by the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args))
+
+    async def _request(self, method: str, route: str, **kwargs: Any) -> bytes:
+        """
+        Send a request to the server.
+
+        Arguments:
+            -method : HTTP method of the request
+            -route  : route on the server
+            -kwargs : arguments for the request
+        Returns:
+            -body of the response
+        """
+        async with self._session().request(
+            method, f"{self.api_url}{route}", **kwargs
+        ) as response:
+            content = await response.read()
+            self._check_response(response.status, content)
+        return content
+
+    @staticmethod
+    def _form(files: Dict[str, str]) -> "aiohttp.FormData":
+        """
+        Create multipart form data sent as files, similar to requests.
+
+        Arguments:
+            -files : dictionary with the name and content of every file
+        Returns:
+            -form data
+        """
+        form = aiohttp.FormData()
+        for name, content in files.items():
+            form.add_field(name, content, filename=name)
+        return form
+
+    async def close(self) -> None:
+        """
+        Close the connections in the pool.
+
+        Returns: No return
+        """
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def __aenter__(self) -> "AsyncParInterface":
+        """Enter a context that closes the interface on exit."""
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Close the interface."""
+        await self.close()
+
+    async def test_ids_request(
+        self,
+        protocol: str,
+        domain: str,
+        detector_seed: str,
+        test_assumptions: str = "{}",
+    ) -> str:
+        """
+        Request Test Identifiers as part of a series of individual tests.
+
+        Arguments:
+            -protocol   : string indicating which protocol is being evaluated
+            -domain     :
+            -detector_seed
+            -test_assumptions
+        Returns:
+            -filename of file containing test ids
+        """
+        payload = {
+            "protocol": protocol,
+            "domain": domain,
+            "detector_seed": detector_seed,
+        }
+
+        contents = await self._run_blocking(_read_file, test_assumptions)
+
+        content = await self._request(
+            "GET",
+            "/test/ids",
+            data=self._form(
+                {
+                    "test_requirements": json.dumps(payload),
+                    "test_assumptions": contents,
+                }
+            ),
+        )
+
+        filename = os.path.abspath(
+            os.path.join(self.folder, f"{protocol}.{domain}.{detector_seed}.csv")
+        )
+        await self._run_blocking(_write_file, filename, content)
+
+        return filename
+
+    async def session_request(
+        self,
+        test_ids: list,
+        protocol: str,
+        domain: str,
+        novelty_detector_version: str,
+        hints: list,
+    ) -> str:
+        """
+        Create a new session to evaluate the detector using an empirical protocol.
+
+        Arguments:
+            -test_ids   : list of tests being evaluated in this session
+            -protocol   : string indicating which protocol is being evaluated
+            -domain     : string indicating which domain is being evaluated
+            -novelty_detector_version : string indicating the version of the novelty
+                                        detector being evaluated
+            -hint       : a list hints provided for the session
+        Returns:
+            -session id
+        """
+        payload = {
+            "protocol": protocol,
+            "novelty_detector_version": novelty_detector_version,
+            "domain": domain,
+            "hints": hints,
+        }
+
+        ids = "\n".join(test_ids) + "\n"
+
+        content = await self._request(
+            "POST",
+            "/session",
+            data=self._form({"test_ids": ids, "configuration": json.dumps(payload)}),
+        )
+        return json.loads(content)["session_id"]
+
+    async def dataset_request(
+        self, test_id: str, round_id: int, session_id: str
+    ) -> str:
+        """
+        Request data for evaluation.
+
+        Arguments:
+            -test_id    : the test being evaluated at this moment.
+            -round_id   : the sequential number of the round being evaluated
+        Returns:
+            -filename of a file containing a list of image files (including full path for each)
+        """
+        params: Dict[str, Union[str, int]] = {
+            "session_id": session_id,
+            "test_id": test_id,
+            "round_id": round_id,
+        }
+        content = await self._request("GET", "/session/dataset", params=params)
+
+        filename = os.path.abspath(
+            os.path.join(self.folder, f"{session_id}.{test_id}.{round_id}.csv")
+        )
+        await self._run_blocking(_write_file, filename, content)
+        return filename
+
+    async def get_feedback_request(
+        self,
+        feedback_ids: list,
+        feedback_type: str,
+        test_id: str,
+        round_id: int,
+        session_id: str,
+    ) -> str:
+        """
+        Get Labels from the server based provided one or more example ids.
+
+        Arguments:
+            -feedback_ids
+            -test_id        : the id of the test currently being evaluated
+            -round_id       : the sequential number of the round being evaluated
+            -feedback_type -- label, detection, characterization
+        Returns:
+            -labels dictionary
+        """
+        params: Dict[str, Union[str, int]] = {
+            "feedback_ids": "|".join(feedback_ids),
+            "session_id": session_id,
+            "test_id": test_id,
+            "round_id": round_id,
+            "feedback_type": feedback_type,
+        }
+        content = await self._request("GET", "/session/feedback", params=params)
+
+        filename = os.path.abspath(
+            os.path.join(
+                self.folder, f"{session_id}.{test_id}.{round_id}_{feedback_type}.csv"
+            )
+        )
+        await self._run_blocking(_write_file, filename, content)
+
+        return filename
+
+    async def post_results(
+        self, result_files: Dict[str, Any], test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """
+        Post client detector predictions for the dataset.
+
+        Arguments:
+            -result_files (dict of "type : file", buffer or DataFrame)
+            -session_id
+            -test_id
+            -round_id
+        Returns: No return
+        """
+        payload = {
+            "session_id": session_id,
+            "test_id": test_id,
+            "round_id": round_id,
+            "result_types": "|".join(result_files.keys()),
+        }
+
+        files = {"test_identification": json.dumps(payload)}
+
+        if len(result_files.keys()) == 0:
+            raise Exception("Must provide at least one result file")
+
+        for r_type in result_files:
+            files[f"{r_type}_file"] = await self._run_blocking(
+                result_content, result_files[r_type]
+            )
+
+        await self._request("POST", "/session/results", data=self._form(files))
+
+    async def evaluate(self, test_id: str, round_id: int, session_id: str) -> str:
+        """
+        Get results for test(s).
+
+        Arguments:
+            -test_id
+            -round_id
+        Returns:
+            -filename
+        """
+        params: Dict[str, Union[str, int]] = {
+            "session_id": session_id,
+            "test_id": test_id,
+            "round_id": round_id,
+        }
+        content = await self._request("GET", "/session/evaluations", params=params)
+
+        filename = os.path.abspath(
+            os.path.join(
+                self.folder, f"{session_id}.{test_id}.{round_id}_evaluation.csv"
+            )
+        )
+
+        await self._run_blocking(_write_file, filename, content)
+
+        return filename
+
+    async def get_test_metadata(self, session_id: str, test_id: str) -> Dict[str, Any]:
+        """
+        Retrieve the metadata json for the specified test.
+
+        Arguments:
+            -test_id
+        Returns:
+            metadata json
+        """
+        content = await self._request(
+            "GET",
+            "/test/metadata",
+            params={"test_id": test_id, "session_id": session_id},
+        )
+        return json.loads(content)
+
+    async def terminate_session(self, session_id: str) -> None:
+        """
+        Terminate the session after the evaluation for the protocol is complete.
+
+        Arguments:
+        Returns: No return
+        """
+        await self._request("DELETE", "/session", params={"session_id": session_id})
@@ -22,13 +22,68 @@ class ConddaConfig(scfg.Config):
         "feature_extraction_only": scfg.Value(
             False, help="Quit after feature extraction"
         ),
+        "extraction_batch_size": scfg.Value(
+            0,
+            help="Number of images extracted together when all the rounds of a "
+            "test are extracted up front with feature_extraction_only (requires a "
+            "harness that supports prefetching), 0 extracts round by round",
+        ),
+        "extraction_workers": scfg.Value(
+            1, help="Number of worker processes used for extracting batches"
+        ),
         "save_features": scfg.Value(False, help="Save features as pkl file"),
         "use_saved_features": scfg.Value(False, help="Use features saved the pkl file"),
         "save_dir": scfg.Value("", help="Directory where features are saved"),
+        "feature_format": scfg.Value(
+            "pkl", help="Format used for saving features (pkl or memmap)"
+        ),
+        "batched_features": scfg.Value(
+            False,
+            help="Provide saved features for a round as a single array "
+            "(requires memmap feature format)",
+        ),
+        "feature_cache_dir": scfg.Value(
+            "", help="Directory with features shared across tests and sessions"
+        ),
+        "feature_cache_key": scfg.Value(
+            "id", help="Key for features in the cache (id or hash of the image)"
+        ),
         "save_attributes": scfg.Value(False, help="Flag to attributes in save dir"),
         "use_saved_attributes": scfg.Value(
             False, help="Use attributes saved in save dir"
         ),
+        "async_checkpoint": scfg.Value(
+            False, help="Write saved features and attributes on a background thread"
+        ),
+        "prefetch_dataset": scfg.Value(
+            False,
+            help="Request the dataset for the next round while the current round "
+            "is processed (requires a harness that supports prefetching)",
+        ),
+        "in_memory_dataset": scfg.Value(
+            False,
+            help="Provide the image ids of a round to the detector as a list "
+            "instead of a file (requires a harness with dataset_ids_request)",
+        ),
+        "test_workers": scfg.Value(
+            1, help="Number of worker processes used for running tests in parallel"
+        ),
+        "async_post_results": scfg.Value(
+            False, help="Post results on background threads while rounds continue"
+        ),
+        "results_batch_size": scfg.Value(
+            1, help="Number of rounds posted together by harnesses with batches"
+        ),
+        "instrumentation_file": scfg.Value(
+            "", help="JSON lines file where the time spent in every stage is recorded"
+        ),
+        "progress_file": scfg.Value(
+            "",
+            help="File where the completed tests and rounds of a session are recorded",
+        ),
+        "resume": scfg.Value(
+            False, help="Resume the session recorded in progress_file"
+        ),
         "saved_attributes": {},
         "skip_stage": [],
         "hints": [],
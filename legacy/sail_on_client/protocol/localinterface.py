@@ -4,17 +4,24 @@ from sail_on.api.file_provider import FileProvider
 from sail_on.api.file_provider import get_session_info
 from sail_on.api.errors import RoundError
 from sail_on_client.errors import RoundError as ClientRoundError
+from sail_on_client.utils import write_result
 from tinker.harness import Harness
 
 from tempfile import TemporaryDirectory
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 import os
+import multiprocessing as mp
 import shutil
 
 
 class LocalInterface(Harness):
     """Interface without any server communication."""
 
+    # Datasets for upcoming rounds can be requested while a round is in progress
+    supports_prefetch = True
+    # Session logs are updated under a lock shared with forked test workers
+    supports_test_workers = True
+
     def __init__(self, config_file: str, config_folder: str) -> None:
         """
         Initialize an object of local interface.
@@ -31,6 +38,9 @@ class LocalInterface(Harness):
         self.data_dir = self.configuration_data["data_dir"]
         self.result_directory = self.temp_dir.name
         self.file_provider = FileProvider(self.data_dir, self.result_directory)
+        # Session logs of the file provider are not safe for concurrent updates,
+        # the lock is shared with threads and test workers forked by a protocol
+        self._lock = mp.get_context("fork").RLock()
 
     def test_ids_request(
         self,
@@ -91,16 +101,41 @@ class LocalInterface(Harness):
         Returns:
             Filename of a file containing a list of image files (including full path for each)
         """
+        byte_stream = self._dataset_stream(test_id, round_id, session_id)
+        data_file = os.path.join(
+            self.result_directory, f"{session_id}.{test_id}.{round_id}.csv"
+        )
+        with open(data_file, "wb") as f:
+            f.write(byte_stream.getbuffer())
+        self.data_file = data_file
+        return data_file
+
+    def dataset_ids_request(
+        self, test_id: str, round_id: int, session_id: str
+    ) -> List[str]:
+        """
+        Request data for evaluation without writing it to a file.
+
+        Args:
+            test_id    : the test being evaluated at this moment.
+            round_id   : the sequential number of the round being evaluated
+            session_id : the identifier provided by the server for a single experiment
+
+        Returns:
+            List of image files (including full path for each)
+        """
+        byte_stream = self._dataset_stream(test_id, round_id, session_id)
+        return [
+            image_id.strip()
+            for image_id in byte_stream.getvalue().decode("utf-8").splitlines()
+            if image_id.strip()
+        ]
+
+    def _dataset_stream(self, test_id: str, round_id: int, session_id: str) -> Any:
+        """Request the dataset for a round from the file provider."""
         try:
-            self.data_file = os.path.join(
-                self.result_directory, f"{session_id}.{test_id}.{round_id}.csv"
-            )
-            byte_stream = self.file_provider.dataset_request(
-                session_id, test_id, round_id
-            )
-            with open(self.data_file, "wb") as f:
-                f.write(byte_stream.getbuffer())
-            return self.data_file
+            with self._lock:
+                return self.file_provider.dataset_request(session_id, test_id, round_id)
         except RoundError as r:
             raise ClientRoundError(
                 reason=r.reason, msg=r.msg, stack_trace=r.stack_trace
@@ -131,21 +166,23 @@ class LocalInterface(Harness):
             self.result_directory,
             f"{session_id}.{test_id}.{round_id}_{feedback_type}.csv",
         )
-        byte_stream = self.file_provider.get_feedback(
-            feedback_ids, feedback_type, session_id, test_id, round_id
-        )
+        with self._lock:
+            byte_stream = self.file_provider.get_feedback(
+                feedback_ids, feedback_type, session_id, test_id, round_id
+            )
         with open(self.feedback_file, "wb") as f:
             f.write(byte_stream.getbuffer())
         return self.feedback_file
 
     def post_results(
-        self, result_files: Dict[str, str], test_id: str, round_id: int, session_id: str
+        self, result_files: Dict[str, Any], test_id: str, round_id: int, session_id: str
     ) -> None:
         """
         Post client detector predictions for the dataset.
 
         Args:
-            result_files : A dictionary of results with protocol constant as key and file path as value
+            result_files : A dictionary of results with protocol constant as key and
+                           file path, buffer or DataFrame as value
             test_id        : the id of the test currently being evaluated
             round_id       : the sequential number of the round being evaluated
             session_id     : the id provided by a server denoting a session
@@ -153,16 +190,49 @@ class LocalInterface(Harness):
         Returns:
             None
         """
-        info = get_session_info(str(self.result_directory), session_id)
-        protocol = info["activity"]["created"]["protocol"]
-        domain = info["activity"]["created"]["domain"]
-        base_result_path = os.path.join(str(self.result_directory), protocol, domain)
-        os.makedirs(base_result_path, exist_ok=True)
-        for result_key in result_files.keys():
-            file_name = f"{session_id}.{test_id}_{result_key}.csv"
-            dst_path = os.path.join(str(base_result_path), file_name)
-            shutil.copy(result_files[result_key], dst_path)
-        self.file_provider.post_results(session_id, test_id, round_id, result_files)
+        with self._lock:
+            info = get_session_info(str(self.result_directory), session_id)
+            protocol = info["activity"]["created"]["protocol"]
+            domain = info["activity"]["created"]["domain"]
+            base_result_path = os.path.join(
+                str(self.result_directory), protocol, domain
+            )
+            os.makedirs(base_result_path, exist_ok=True)
+            posted_files = dict(result_files)
+            for result_key, result in result_files.items():
+                file_name = f"{session_id}.{test_id}_{result_key}.csv"
+                dst_path = os.path.join(str(base_result_path), file_name)
+                if isinstance(result, str):
+                    shutil.copy(result, dst_path)
+                else:
+                    # Results kept in memory are only written for archiving
+                    write_result(result, dst_path)
+                    posted_files[result_key] = dst_path
+            self.file_provider.post_results(session_id, test_id, round_id, posted_files)
+
+    def post_results_batch(
+        self, batch: List[Tuple[Dict[str, Any], str, int]], session_id: str
+    ) -> List[Optional[Exception]]:
+        """
+        Accept client detector predictions for many rounds.
+
+        Args:
+            batch          : list of (result_files, test_id, round_id) for the rounds
+            session_id     : the id provided by a server denoting a session
+
+        Returns:
+            Error raised for every round, None for rounds that were posted
+        """
+        errors: List[Optional[Exception]] = []
+        for result_files, test_id, round_id in batch:
+            try:
+                self.post_results(result_files, test_id, round_id, session_id)
+            except Exception as e:
+                # Errors are reported for the round instead of failing the batch
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
 
     def evaluate(self, test_id: str, round_id: int, session_id: str) -> str:
         """
@@ -176,7 +246,8 @@ class LocalInterface(Harness):
         Returns:
             Path to a file with the results
         """
-        return self.file_provider.evaluate(session_id, test_id, round_id)
+        with self._lock:
+            return self.file_provider.evaluate(session_id, test_id, round_id)
 
     def get_test_metadata(self, session_id: str, test_id: str) -> Dict[str, Any]:
         """
@@ -189,7 +260,8 @@ class LocalInterface(Harness):
         Returns:
             A json file containing metadata
         """
-        return self.file_provider.get_test_metadata(session_id, test_id)
+        with self._lock:
+            return self.file_provider.get_test_metadata(session_id, test_id)
 
     def terminate_session(self, session_id: str) -> None:
         """
@@ -200,4 +272,5 @@ class LocalInterface(Harness):
 
         Returns: None
         """
-        self.file_provider.terminate_session(session_id)
+        with self._lock:
+            self.file_provider.terminate_session(session_id)
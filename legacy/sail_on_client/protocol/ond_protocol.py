@@ -4,11 +4,39 @@ from tinker.baseprotocol import BaseProtocol
 
 from sail_on_client.protocol.ond_config import OndConfig
 from sail_on_client.errors import RoundError
-from sail_on_client.utils import safe_remove, safe_remove_results
+from sail_on_client.utils import dataset_ids, safe_remove
+from sail_on_client.feature_store import (
+    FeatureStore,
+    FeatureWriter,
+    feature_store_version,
+)
+from sail_on_client.feature_cache import FeatureCache, extract_features
+from sail_on_client.batched_extraction import BatchedExtractor
+from sail_on_client.checkpoint_writer import CheckpointWriter, pickle_to
+from sail_on_client.dataset_prefetcher import DatasetPrefetcher
+from sail_on_client.results_uploader import ResultsUploader
+from sail_on_client.progress_ledger import ProgressLedger
+from sail_on_client.instrumentation import (
+    InstrumentedAlgorithm,
+    InstrumentedHarness,
+    StageRecorder,
+    write_stage_summary,
+)
+from sail_on_client.stage_scheduler import (
+    PROTOCOL_STAGES,
+    ROUND_STAGES,
+    StageScheduler,
+    feature_extraction_start,
+    stages_to_skip,
+)
+from sail_on_client.checkpointer import finalize_attributes
+from sail_on_client.attribute_store import save_raw_attributes
 from sail_on_client.protocol.parinterface import ParInterface
+from sail_on_client.protocol.worker_pool import run_tests_in_workers
 from sail_on_client.feedback.image_classification_feedback import (
     ImageClassificationFeedback,
 )
+from functools import partial
 from itertools import count
 import os
 import json
@@ -17,7 +45,7 @@ import logging
 import pickle as pkl
 import ubelt as ub  # type: ignore
 
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
 
 
 class SailOn(BaseProtocol):
@@ -50,128 +78,492 @@ class SailOn(BaseProtocol):
 
         # provide all of the configuration information in the toolset
         self.toolset.update(self.config)
-        novelty_algorithm = self.get_algorithm(
-            self.config["novelty_detector_class"], self.toolset
-        )
-
-        # TODO: fix the version below
-        novelty_detector_version = "1.0.0"
-        novelty_detector_class = self.config["novelty_detector_class"]
-        self.toolset["session_id"] = self.harness.session_request(
-            self.config["test_ids"],
-            "OND",
-            self.config["domain"],
-            f"{novelty_detector_version}.{novelty_detector_class}",
-            self.config["hints"],
-        )
+        self.progress_ledger = ProgressLedger(self.config["progress_file"])
+        if self.config["resume"] and not self.progress_ledger.enabled:
+            raise ValueError("A progress_file is required for resuming a session")
+        if self.config["resume"] and self.progress_ledger.session_ended:
+            logging.info(f"Session {self.progress_ledger.session_id} is complete")
+            return
+        if self.config["resume"] and self.progress_ledger.session_id is not None:
+            self.toolset["session_id"] = self.progress_ledger.session_id
+            logging.info(f"Resuming session: {self.toolset['session_id']}")
+        else:
+            # TODO: fix the version below
+            novelty_detector_version = "1.0.0"
+            novelty_detector_class = self.config["novelty_detector_class"]
+            self.toolset["session_id"] = self.harness.session_request(
+                self.config["test_ids"],
+                "OND",
+                self.config["domain"],
+                f"{novelty_detector_version}.{novelty_detector_class}",
+                self.config["hints"],
+            )
+            self.progress_ledger.start_session(self.toolset["session_id"])
+            logging.info(f"New session: {self.toolset['session_id']}")
         session_id = self.toolset["session_id"]
 
-        logging.info(f"New session: {self.toolset['session_id']}")
+        test_ids = [
+            test_id
+            for test_id in self.config["test_ids"]
+            if not self.progress_ledger.test_complete(test_id)
+        ]
+        if len(test_ids) < len(self.config["test_ids"]):
+            logging.info(
+                f"Skipping {len(self.config['test_ids']) - len(test_ids)} "
+                "completed tests"
+            )
+        test_workers = self.config["test_workers"]
+        if test_workers > 1 and not getattr(
+            self.harness, "supports_test_workers", False
+        ):
+            logging.warning(
+                f"{type(self.harness).__name__} does not support test workers"
+            )
+            test_workers = 1
+        run_tests_in_workers(self._run_tests, test_ids, test_workers)
+        if self.config["instrumentation_file"]:
+            write_stage_summary(self.config["instrumentation_file"], session_id)
+        logging.info(f"Session ended: {self.toolset['session_id']}")
+        self.harness.terminate_session(session_id)
+        self.progress_ledger.end_session()
+
+    def _record_test(
+        self,
+        test: str,
+        checkpoint_writer: CheckpointWriter,
+        results_uploader: ResultsUploader,
+    ) -> None:
+        """
+        Record a test once its results and checkpoints are written.
+
+        Args:
+            test (str): Test id
+            checkpoint_writer (CheckpointWriter): Writer for saved features and
+                                                  attributes
+            results_uploader (ResultsUploader): Uploader used for posting results
+
+        Return:
+            None
+        """
+        if not self.progress_ledger.enabled:
+            return
+        results_uploader.wait(test)
+        checkpoint_writer.flush()
+        self.progress_ledger.record_test(test)
+
+    def _check_resumable(
+        self, novelty_algorithm: Any, test: str, round_id: int
+    ) -> None:
+        """
+        Check that a test can continue after a round completed in an earlier run.
+
+        Completed rounds are not run again, so the detector has to restore its
+        state from the attributes saved for the entire round. Extracting
+        features does not depend on the state of the detector.
+
+        Args:
+            novelty_algorithm: Algorithm used for the test
+            test (str): Test id
+            round_id (int): Last completed round of the test
+
+        Return:
+            None
+        """
+        if self.config["feature_extraction_only"]:
+            return
+        if (
+            not self.config["save_attributes"]
+            or self.config["save_elementwise"]
+            or len(self.config["saved_attributes"]) == 0
+            or not hasattr(novelty_algorithm, "restore_attributes")
+        ):
+            raise ValueError(
+                f"Rounds 0 to {round_id} of {test} were completed in an earlier run "
+                "and the detector can not be restored after them, resuming a test "
+                "requires a detector that restores attributes saved for entire "
+                "rounds with save_attributes and without save_elementwise"
+            )
+
+    def _restore_detector(
+        self, novelty_algorithm: Any, test: str, round_id: int
+    ) -> None:
+        """
+        Restore the state of the detector after a round completed in an earlier run.
+
+        Args:
+            novelty_algorithm: Algorithm used for the test
+            test (str): Test id
+            round_id (int): Last completed round of the test
+
+        Return:
+            None
+        """
+        logging.info(f"Restoring detector from round {round_id} of {test}")
+        self.toolset["round_id"] = round_id
+        self.toolset["use_saved_attributes"] = True
+        try:
+            for step_descriptor in ROUND_STAGES:
+                if step_descriptor not in self.config["saved_attributes"]:
+                    continue
+                try:
+                    novelty_algorithm.restore_attributes(step_descriptor)
+                except FileNotFoundError:
+                    logging.warning(f"No attributes saved for {step_descriptor}")
+        finally:
+            self.toolset["use_saved_attributes"] = self.config["use_saved_attributes"]
+
+    def _run_tests(self, test_ids: Iterable[str]) -> None:
+        """
+        Run tests one after another with a detector created for them.
+
+        Args:
+            test_ids (iterable): Test ids that are run in the session
+
+        Return:
+            None
+        """
+        stage_recorder = StageRecorder(
+            self.config["instrumentation_file"], self.toolset["session_id"]
+        )
+        harness = InstrumentedHarness(self.harness, stage_recorder)
+        novelty_algorithm = InstrumentedAlgorithm(
+            self.get_algorithm(self.config["novelty_detector_class"], self.toolset),
+            stage_recorder,
+        )
+        checkpoint_writer = CheckpointWriter(self.config["async_checkpoint"])
+        feature_cache: Optional[FeatureCache] = None
+        if self.config["feature_cache_dir"]:
+            feature_cache = FeatureCache(
+                self.config["feature_cache_dir"],
+                feature_store_version(self.config),
+                self.config["feature_cache_key"],
+                self.config["dataset_root"],
+            )
+        prefetch_dataset = self.config["prefetch_dataset"]
+        if prefetch_dataset and not getattr(self.harness, "supports_prefetch", False):
+            logging.warning(
+                f"{type(self.harness).__name__} does not support prefetching datasets"
+            )
+            prefetch_dataset = False
+        if self.config["extraction_batch_size"] > 0 and not getattr(
+            self.harness, "supports_prefetch", False
+        ):
+            logging.warning(
+                f"{type(self.harness).__name__} does not support requesting the "
+                "rounds of a test up front, features are extracted round by round"
+            )
+        in_memory_dataset = self.config["in_memory_dataset"]
+        if in_memory_dataset and not hasattr(self.harness, "dataset_ids_request"):
+            logging.warning(
+                f"{type(self.harness).__name__} does not support in memory datasets"
+            )
+            in_memory_dataset = False
+        dataset_prefetcher = DatasetPrefetcher(
+            harness, self.toolset["session_id"], prefetch_dataset, in_memory_dataset
+        )
+        results_batch_size = self.config["results_batch_size"]
+        if results_batch_size > 1 and not hasattr(self.harness, "post_results_batch"):
+            logging.warning(
+                f"{type(self.harness).__name__} does not support posting results "
+                "in batches"
+            )
+            results_batch_size = 1
+        results_uploader = ResultsUploader(
+            harness, self.config["async_post_results"], batch_size=results_batch_size
+        )
+        for test in test_ids:
+            self._run_test(
+                test,
+                harness,
+                novelty_algorithm,
+                checkpoint_writer,
+                feature_cache,
+                dataset_prefetcher,
+                results_uploader,
+                stage_recorder,
+            )
+        results_uploader.close()
+        dataset_prefetcher.close()
+        checkpoint_writer.close()
+        stage_recorder.close()
+        logging.info(f"Checkpoints: {checkpoint_writer.metrics()}")
 
-        for test in self.config["test_ids"]:
-            self.toolset["test_id"] = test
-            self.toolset["test_type"] = ""
-            if self.config["save_attributes"]:
-                self.toolset["attributes"] = {}
-            self.toolset["metadata"] = self.harness.get_test_metadata(session_id, test)
-            if "red_light" in self.toolset["metadata"]:
-                self.toolset["redlight_image"] = self.toolset["metadata"]["red_light"]
+    def _run_test(
+        self,
+        test: str,
+        harness: InstrumentedHarness,
+        novelty_algorithm: Any,
+        checkpoint_writer: CheckpointWriter,
+        feature_cache: Optional[FeatureCache],
+        dataset_prefetcher: DatasetPrefetcher,
+        results_uploader: ResultsUploader,
+        stage_recorder: StageRecorder,
+    ) -> None:
+        """
+        Run all the rounds in a test.
+
+        Args:
+            test (str): Test id
+            harness (InstrumentedHarness): Harness that records its requests
+            novelty_algorithm: Algorithm used for the test
+            checkpoint_writer (CheckpointWriter): Writer for saved features and
+                                                  attributes
+            feature_cache (FeatureCache): Cache for features, None if it is not used
+            dataset_prefetcher (DatasetPrefetcher): Prefetcher for the datasets
+            results_uploader (ResultsUploader): Uploader used for posting results
+            stage_recorder (StageRecorder): Recorder for the stages of the test
+
+        Return:
+            None
+        """
+        session_id = self.toolset["session_id"]
+        self.toolset["test_id"] = test
+        self.toolset["test_type"] = ""
+        if self.config["save_attributes"]:
+            self.toolset["attributes"] = {}
+        self.toolset["metadata"] = harness.get_test_metadata(session_id, test)
+        if "red_light" in self.toolset["metadata"]:
+            self.toolset["redlight_image"] = self.toolset["metadata"]["red_light"]
+        else:
+            self.toolset["redlight_image"] = ""
+
+        # Intialize feedback object for Image Classfication
+        if (
+            "feedback_params" in self.config["detector_config"]
+            and self.config["domain"] == "image_classification"
+        ):
+            logging.info("Creating Feedback object")
+            first_budget = self.config["detector_config"]["feedback_params"][
+                "first_budget"
+            ]
+            income_per_batch = self.config["detector_config"]["feedback_params"][
+                "income_per_batch"
+            ]
+            max_budget = self.config["detector_config"]["feedback_params"][
+                "maximum_budget"
+            ]
+            self.toolset["ImageClassificationFeedback"] = ImageClassificationFeedback(
+                first_budget,
+                income_per_batch,
+                max_budget,
+                harness,
+                session_id,
+                test,
+                "classification",
+            )
+        novelty_algorithm.execute(self.toolset, "Initialize")
+        self.toolset["image_features"] = {}
+        self.toolset["dataset_root"] = self.config["dataset_root"]
+        self.toolset["dataset_ids"] = []
+
+        logging.info(f"Start test: {self.toolset['test_id']}")
+        if (
+            self.config["save_features"]
+            and not self.config["use_saved_features"]
+            and self.config["feature_format"] == "memmap"
+        ):
+            feature_path = os.path.join(self.config["save_dir"], f"{test}_features")
+            logging.info(f"Saving features in {feature_path}")
+            feature_writer = FeatureWriter(
+                FeatureStore(feature_path, feature_store_version(self.config), mode="a")
+            )
+        elif self.config["save_features"] and not self.config["use_saved_features"]:
+            test_features: Dict[str, Dict] = {"features_dict": {}, "logit_dict": {}}
+
+        if (
+            self.config["use_saved_features"]
+            and self.config["feature_format"] == "memmap"
+        ):
+            feature_store = FeatureStore(
+                os.path.join(self.config["save_dir"], f"{test}_features"),
+                feature_store_version(self.config),
+            )
+        elif self.config["use_saved_features"]:
+            feature_dir = self.config["save_dir"]
+            if os.path.isdir(feature_dir):
+                test_features = pkl.load(
+                    open(os.path.join(feature_dir, f"{test}_features.pkl"), "rb")
+                )
             else:
-                self.toolset["redlight_image"] = ""
+                test_features = pkl.load(open(feature_dir, "rb"))
+            features_dict = test_features["features_dict"]
+            logit_dict = test_features["logit_dict"]
+
+        # Rounds completed before the session was interrupted are not run again,
+        # the detector restores its state from the attributes saved for the last
+        # completed round
+        resume_round = self.progress_ledger.last_round(test)
+        if resume_round >= 0:
+            self._check_resumable(novelty_algorithm, test, resume_round)
+        resume_features: Optional[FeatureStore] = None
+        if (
+            resume_round >= 0
+            and self.config["save_features"]
+            and not self.config["use_saved_features"]
+            and self.config["feature_format"] == "memmap"
+        ):
+            resume_features = self.progress_ledger.saved_features(
+                test, feature_path, feature_store_version(self.config)
+            )
+        # Features that were not saved for the completed rounds are extracted
+        # again, without running the other stages for the rounds
+        extract_completed_rounds = (
+            resume_round >= 0
+            and self.config["save_features"]
+            and not self.config["use_saved_features"]
+            and (
+                resume_features is None
+                or len(resume_features) < self.progress_ledger.feature_offset(test)
+            )
+        )
+        if extract_completed_rounds:
+            logging.info(f"Extracting features for rounds 0 to {resume_round}")
+            first_round = 0
+            feature_offset = 0
+        else:
+            first_round = resume_round + 1
+            feature_offset = self.progress_ledger.feature_offset(test)
+            if resume_features is not None:
+                self.toolset["dataset_ids"] = resume_features.ids[:feature_offset]
+
+        skipped_stages = stages_to_skip(self.config)
+        start_after = None
+        if (
+            not self.config["use_saved_features"]
+            and resume_features is None
+            and "FeatureExtraction" not in skipped_stages
+            and getattr(self.harness, "supports_prefetch", False)
+        ):
+            start_after = feature_extraction_start(
+                getattr(novelty_algorithm, "stage_dependencies", None),
+                PROTOCOL_STAGES["OND"],
+            )
+        batched_extractor: Optional[BatchedExtractor] = None
+        if (
+            self.config["feature_extraction_only"]
+            and self.config["save_features"]
+            and self.config["extraction_batch_size"] > 0
+            and not self.config["use_saved_features"]
+            and "FeatureExtraction" not in skipped_stages
+            and getattr(self.harness, "supports_prefetch", False)
+        ):
+            # All the rounds are extracted before the first round is processed
+            batched_extractor = BatchedExtractor(
+                self.toolset,
+                novelty_algorithm,
+                feature_cache,
+                partial(dataset_prefetcher.dataset_request, test),
+                self.config["extraction_batch_size"],
+                self.config["extraction_workers"],
+            )
+            stage_scheduler = StageScheduler(
+                self.toolset,
+                batched_extractor.dataset_request,
+                batched_extractor.extract,
+            )
+        else:
+            stage_scheduler = StageScheduler(
+                self.toolset,
+                partial(dataset_prefetcher.dataset_request, test),
+                lambda toolset, image_ids: extract_features(
+                    novelty_algorithm, toolset, feature_cache, image_ids
+                ),
+                start_after,
+            )
 
-            # Intialize feedback object for Image Classfication
+        for round_id in count(first_round):
             if (
-                "feedback_params" in self.config["detector_config"]
-                and self.config["domain"] == "image_classification"
+                resume_round >= 0
+                and round_id == resume_round + 1
+                and not self.config["feature_extraction_only"]
             ):
-                logging.info("Creating Feedback object")
-                first_budget = self.config["detector_config"]["feedback_params"][
-                    "first_budget"
-                ]
-                income_per_batch = self.config["detector_config"]["feedback_params"][
-                    "income_per_batch"
-                ]
-                max_budget = self.config["detector_config"]["feedback_params"][
-                    "maximum_budget"
-                ]
-                self.toolset[
-                    "ImageClassificationFeedback"
-                ] = ImageClassificationFeedback(
-                    first_budget,
-                    income_per_batch,
-                    max_budget,
-                    self.harness,
-                    session_id,
-                    test,
-                    "classification",
-                )
-            novelty_algorithm.execute(self.toolset, "Initialize")
-            self.toolset["image_features"] = {}
-            self.toolset["dataset_root"] = self.config["dataset_root"]
-            self.toolset["dataset_ids"] = []
-
-            logging.info(f"Start test: {self.toolset['test_id']}")
-            if self.config["save_features"] and not self.config["use_saved_features"]:
-                test_features: Dict[str, Dict] = {"features_dict": {}, "logit_dict": {}}
-
-            if self.config["use_saved_features"]:
-                feature_dir = self.config["save_dir"]
-                if os.path.isdir(feature_dir):
-                    test_features = pkl.load(
-                        open(os.path.join(feature_dir, f"{test}_features.pkl"), "rb")
-                    )
-                else:
-                    test_features = pkl.load(open(feature_dir, "rb"))
-                features_dict = test_features["features_dict"]
-                logit_dict = test_features["logit_dict"]
-
-            for round_id in count(0):
-                self.toolset["round_id"] = round_id
+                self._restore_detector(novelty_algorithm, test, resume_round)
+            self.toolset["round_id"] = round_id
+
+            logging.info(f"Start round: {self.toolset['round_id']}")
+            # see if there is another round available
+            try:
+                self.toolset["dataset"] = stage_scheduler.dataset_request(round_id)
+            except RoundError:
+                # no more rounds available, this test is done.
+                break
+
+            image_ids = dataset_ids(self.toolset["dataset"])
+            self.toolset["dataset_ids"].extend(image_ids)
+            feature_offset += len(image_ids)
+            replay_round = round_id <= resume_round
 
-                logging.info(f"Start round: {self.toolset['round_id']}")
-                # see if there is another round available
-                try:
-                    self.toolset["dataset"] = self.harness.dataset_request(
-                        test, round_id, session_id
+            if (
+                self.config["use_saved_features"]
+                and self.config["feature_format"] == "memmap"
+                and self.config["batched_features"]
+            ):
+                (
+                    self.toolset["features_array"],
+                    self.toolset["logit_array"],
+                ) = feature_store.gather(image_ids)
+                self.toolset["feature_ids"] = image_ids
+            elif (
+                self.config["use_saved_features"]
+                and self.config["feature_format"] == "memmap"
+            ):
+                self.toolset["features_dict"] = feature_store.features(image_ids)
+                self.toolset["logit_dict"] = feature_store.logits(image_ids)
+            elif self.config["use_saved_features"]:
+                self.toolset["features_dict"] = {}
+                self.toolset["logit_dict"] = {}
+                for image_id in image_ids:
+                    self.toolset["features_dict"][image_id] = features_dict[image_id]
+                    self.toolset["logit_dict"][image_id] = logit_dict[image_id]
+            elif resume_features is not None and all(
+                image_id in resume_features for image_id in image_ids
+            ):
+                self.toolset["features_dict"] = resume_features.features(image_ids)
+                self.toolset["logit_dict"] = resume_features.logits(image_ids)
+            elif "FeatureExtraction" in skipped_stages:
+                self.toolset["features_dict"] = {}
+                self.toolset["logit_dict"] = {}
+            else:
+                (
+                    self.toolset["features_dict"],
+                    self.toolset["logit_dict"],
+                ) = stage_scheduler.extract(round_id, image_ids)
+            stage_scheduler.stage_complete(round_id, "FeatureExtraction")
+
+            if not self.config["use_saved_features"]:
+                if (
+                    self.config["save_features"]
+                    and self.config["feature_format"] == "memmap"
+                ):
+                    feature_writer.write(
+                        self.toolset["features_dict"], self.toolset["logit_dict"]
                     )
-                except RoundError:
-                    # no more rounds available, this test is done.
-                    break
-
-                with open(self.toolset["dataset"], "r") as dataset:
-                    dataset_ids = dataset.readlines()
-                    image_ids = [image_id.strip() for image_id in dataset_ids]
-                    self.toolset["dataset_ids"].extend(image_ids)
-
-                if self.config["use_saved_features"]:
-                    self.toolset["features_dict"] = {}
-                    self.toolset["logit_dict"] = {}
-                    for image_id in image_ids:
-                        self.toolset["features_dict"][image_id] = features_dict[
-                            image_id
-                        ]
-                        self.toolset["logit_dict"][image_id] = logit_dict[image_id]
-
-                else:
-                    (
-                        self.toolset["features_dict"],
-                        self.toolset["logit_dict"],
-                    ) = novelty_algorithm.execute(self.toolset, "FeatureExtraction")
-
-                    if self.config["save_features"]:
-                        test_features["features_dict"].update(
-                            self.toolset["features_dict"]
-                        )
-                        test_features["logit_dict"].update(self.toolset["logit_dict"])
-                        if self.config["feature_extraction_only"]:
-                            continue
+                elif self.config["save_features"]:
+                    test_features["features_dict"].update(self.toolset["features_dict"])
+                    test_features["logit_dict"].update(self.toolset["logit_dict"])
+                if (
+                    self.config["save_features"]
+                    and self.config["feature_extraction_only"]
+                    and not replay_round
+                ):
+                    self.progress_ledger.record_round(
+                        test, round_id, feature_offset=feature_offset
+                    )
+                    continue
+            if replay_round:
+                # only the features of the completed round were needed
+                safe_remove(self.toolset["dataset"])
+                continue
 
-                results: Dict[str, Any] = {}
+            results: Dict[str, Any] = {}
 
+            if "WorldDetection" not in skipped_stages:
                 results["detection"] = novelty_algorithm.execute(
                     self.toolset, "WorldDetection"
                 )
+            stage_scheduler.stage_complete(round_id, "WorldDetection")
 
+            if "NoveltyClassification" not in skipped_stages:
                 ncl_results = novelty_algorithm.execute(
                     self.toolset, "NoveltyClassification"
                 )
@@ -179,46 +571,109 @@ class SailOn(BaseProtocol):
                     results.update(ncl_results)
                 else:
                     results["classification"] = ncl_results
+            stage_scheduler.stage_complete(round_id, "NoveltyClassification")
 
-                self.harness.post_results(results, test, round_id, session_id)
-                if self.toolset["use_feedback"]:
-                    novelty_algorithm.execute(self.toolset, "NoveltyAdaption")
-                logging.info(f"Round complete: {self.toolset['round_id']}")
-
-                # cleanup the round files
-                safe_remove(self.toolset["dataset"])
-                safe_remove_results(results)
-
-            if self.config["save_features"] and not self.config["use_saved_features"]:
-                feature_dir = self.config["save_dir"]
-                ub.ensuredir(feature_dir)
-                feature_path = os.path.join(feature_dir, f"{test}_features.pkl")
-                logging.info(f"Saving features in {feature_path}")
-                with open(feature_path, "wb") as f:
-                    pkl.dump(test_features, f)
-                if self.config["feature_extraction_only"]:
-                    continue
-
-            if self.config["save_attributes"]:
-                attribute_dir = self.config["save_dir"]
-                ub.ensuredir(attribute_dir)
-                attribute_path = os.path.join(attribute_dir, f"{test}_attribute.pkl")
-                logging.info(f"Saving features in {attribute_path}")
-                with open(attribute_path, "wb") as f:
-                    pkl.dump(self.toolset["attributes"], f)
+            if len(results) > 0:
+                # result files are removed by the uploader once they are posted
+                results_uploader.post_results(
+                    results,
+                    test,
+                    round_id,
+                    session_id,
+                    on_posted=partial(
+                        self.progress_ledger.record_round,
+                        test,
+                        round_id,
+                        feature_offset=feature_offset,
+                    ),
+                )
+            else:
+                self.progress_ledger.record_round(
+                    test, round_id, feature_offset=feature_offset
+                )
+            if self.toolset["use_feedback"] and "NoveltyAdaption" not in skipped_stages:
+                # Feedback for a round is provided after its results are posted
+                results_uploader.wait(test)
+                novelty_algorithm.execute(self.toolset, "NoveltyAdaption")
+                stage_scheduler.stage_complete(round_id, "NoveltyAdaption")
+            logging.info(f"Round complete: {self.toolset['round_id']}")
+
+            # cleanup the round files
+            with stage_recorder.record("cleanup", test, round_id):
+                # a dataset posted as a result is removed by the uploader once the
+                # results are posted, which can happen after the round is complete
+                if not any(
+                    isinstance(result, str) and result == self.toolset["dataset"]
+                    for result in results.values()
+                ):
+                    safe_remove(self.toolset["dataset"])
+        stage_scheduler.close()
+        if batched_extractor is not None:
+            batched_extractor.close()
+
+        if self.config["save_features"] and not self.config["use_saved_features"]:
+            feature_dir = self.config["save_dir"]
+            ub.ensuredir(feature_dir)
+            with stage_recorder.record("save_features", test):
+                if self.config["feature_format"] == "memmap":
+                    feature_writer.close()
+                else:
+                    feature_path = os.path.join(feature_dir, f"{test}_features.pkl")
+                    logging.info(f"Saving features in {feature_path}")
+                    # features of the test are not modified once they are saved
+                    checkpoint_writer.submit(
+                        feature_path, partial(pickle_to, test_features)
+                    )
+            if self.config["feature_extraction_only"]:
+                self._record_test(test, checkpoint_writer, results_uploader)
+                return
+
+        # Attributes saved for entire rounds were already written in round shards
+        if self.config["save_attributes"] and self.config["save_elementwise"]:
+            attribute_dir = self.config["save_dir"]
+            ub.ensuredir(attribute_dir)
+            with stage_recorder.record("save_attributes", test):
+                # finalized attributes do not share values the detector modifies
+                attributes = finalize_attributes(self.toolset["attributes"])
+                if self.config["attribute_format"] == "raw":
+                    attribute_path = os.path.join(attribute_dir, f"{test}_attribute")
+                    logging.info(f"Saving attributes in {attribute_path}")
+                    checkpoint_writer.submit(
+                        attribute_path,
+                        partial(save_raw_attributes, attribute_dict=attributes),
+                    )
+                else:
+                    attribute_path = os.path.join(
+                        attribute_dir, f"{test}_attribute.pkl"
+                    )
+                    logging.info(f"Saving attributes in {attribute_path}")
+                    checkpoint_writer.submit(
+                        attribute_path, partial(pickle_to, attributes)
+                    )
 
+        if "NoveltyCharacterization" not in skipped_stages:
             results = {}
             results["characterization"] = novelty_algorithm.execute(
                 self.toolset, "NoveltyCharacterization"
             )
-            if results["characterization"] is not None and os.path.exists(
-                results["characterization"]
+            characterization = results["characterization"]
+            # The dataset of the last round is removed after the round or by the
+            # uploader once the round is posted, so it is never a result here
+            last_dataset = (
+                isinstance(characterization, str)
+                and characterization == self.toolset["dataset"]
+            )
+            if (
+                characterization is not None
+                and not last_dataset
+                and (
+                    not isinstance(characterization, str)
+                    or os.path.exists(characterization)
+                )
             ):
-                self.harness.post_results(results, test, 0, session_id)
-            logging.info(f"Test complete: {self.toolset['test_id']}")
-
-            # cleanup the characterization file
-            safe_remove(results["characterization"])
-
-        logging.info(f"Session ended: {self.toolset['session_id']}")
-        self.harness.terminate_session(session_id)
+                results_uploader.post_results(results, test, 0, session_id)
+            elif not last_dataset:
+                # cleanup the characterization file
+                safe_remove(results["characterization"])
+        self._record_test(test, checkpoint_writer, results_uploader)
+        logging.info(f"Test complete: {self.toolset['test_id']}")
@@ -4,19 +4,77 @@ import requests
 import json
 import io
 import os
+import threading
 import traceback
 import logging
+import zlib
 
+from contextlib import ExitStack
 from tinker.harness import Harness
-from typing import Any, Dict, Union
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 from requests import Response
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
 from sail_on_client.errors import ApiError
+from sail_on_client.utils import open_result
 from json import JSONDecodeError
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+# Size of the chunks written to disk while a response is downloaded
+CHUNK_SIZE = 1 << 16
+
+# Encodings accepted in responses for a compression, responses are decoded by
+# urllib3 which requires zstandard for zstd
+ACCEPT_ENCODINGS = {"none": "identity", "gzip": "gzip", "zstd": "zstd, gzip"}
+
+
+def api_error(status_code: int, response_json: Dict[str, Any]) -> Optional[ApiError]:
+    """
+    Create the error reported by the server for a status code.
+
+    Arguments:
+        -status_code   : HTTP status code of the response
+        -response_json : json in the response with reason, message and stack trace
+    Returns:
+        -error for the status code, None if no error class has the status code
+    """
+    # Find the appropriate error class based on error code.
+    for subclass in ApiError.error_classes():
+        if subclass.error_code == status_code:
+            return subclass(
+                response_json["reason"],
+                response_json["message"],
+                response_json["stack_trace"],
+            )
+    return None
+
+
+def raise_api_error(status_code: int, response_json: Dict[str, Any]) -> None:
+    """
+    Raise the error reported by the server for a status code.
+
+    Arguments:
+        -status_code   : HTTP status code of the response
+        -response_json : json in the response with reason, message and stack trace
+    Returns: No return
+    """
+    error = api_error(status_code, response_json)
+    if error is not None:
+        raise error
+
 
 class ParInterface(Harness):
     """Interface to PAR server."""
 
+    # The server expects datasets for a test to be requested one round at a time
+    supports_prefetch = False
+    # Connections are created again by test workers forked by a protocol
+    supports_test_workers = True
+
     def __init__(self, configfile: str, configfolder: str) -> None:
         """
         Initialize a client connection object.
@@ -26,6 +84,75 @@ class ParInterface(Harness):
         Harness.__init__(self, configfile, configfolder)
         self.api_url = self.configuration_data["url"]
         self.folder = configfolder
+        self.pool_size = self.configuration_data.get("pool_size", 10)
+        self.keep_alive = self.configuration_data.get("keep_alive", True)
+        self._pid = os.getpid()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.compression = self.configuration_data.get("compression", "none")
+        if self.compression not in ACCEPT_ENCODINGS:
+            raise ValueError(f"Unsupported compression {self.compression}")
+        if self.compression == "zstd" and zstandard is None:
+            logging.warning(
+                "zstandard is not installed, using gzip compression, install "
+                "sail_on_client[zstd] for zstd"
+            )
+            self.compression = "gzip"
+        self.compress_requests = self.compression != "none"
+        # Compressed requests are sent until the server has decoded one of them
+        self._compression_negotiated = not self.compress_requests
+
+    def _session(self) -> requests.Session:
+        """
+        Get the session used for requests by the current thread.
+
+        Sessions are created per thread since a session is not thread safe, the
+        sessions share the connection pool of a single adapter so connections
+        are kept alive and reused by all the threads. The pool is created again
+        in a forked process, as connections of the parent can not be shared.
+
+        Returns:
+            -session with pooled connections
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size
+                )
+                self._local = threading.local()
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+            # Replaces the default of requests, which accepts gzip and deflate
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODINGS[self.compression]
+            self._local.session = session
+        return session
+
+    def _compress(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Compress the chunks of a request body as they are sent.
+
+        Arguments:
+            -chunks : chunks of the body
+        Returns:
+            -chunks of the compressed body
+        """
+        if self.compression == "zstd":
+            compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            # wbits of 31 produce a gzip container
+            compressor = zlib.compressobj(wbits=31)
+        for chunk in chunks:
+            compressed_chunk = compressor.compress(chunk)
+            if compressed_chunk:
+                yield compressed_chunk
+        yield compressor.flush()
 
     def _check_response(self, response: Response) -> None:
         """
@@ -36,19 +163,24 @@ class ParInterface(Harness):
         """
         if response.status_code != 200:
             try:
-                response_json = response.json()
-                # Find the appropriate error class based on error code.
-                for subclass in ApiError.error_classes():
-                    if subclass.error_code == response.status_code:
-                        raise subclass(
-                            response_json["reason"],
-                            response_json["message"],
-                            response_json["stack_trace"],
-                        )
+                raise_api_error(response.status_code, response.json())
             except JSONDecodeError:
                 logging.exception(f"Server Error: {traceback.format_exc()}")
                 exit(1)
 
+    def _download(self, response: Response, filename: str) -> None:
+        """
+        Write the content of a streamed response to a file in chunks.
+
+        Arguments:
+            -response : response of a request made with stream=True
+            -filename : path of the file
+        Returns: No return
+        """
+        with open(filename, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+
     def test_ids_request(
         self,
         protocol: str,
@@ -76,21 +208,19 @@ class ParInterface(Harness):
         with open(test_assumptions, "r") as f:
             contents = f.read()
 
-        response = requests.get(
+        filename = os.path.abspath(
+            os.path.join(self.folder, f"{protocol}.{domain}.{detector_seed}.csv")
+        )
+        with self._session().get(
             f"{self.api_url}/test/ids",
             files={
                 "test_requirements": io.StringIO(json.dumps(payload)),
                 "test_assumptions": io.StringIO(contents),
             },
-        )
-
-        self._check_response(response)
-
-        filename = os.path.abspath(
-            os.path.join(self.folder, f"{protocol}.{domain}.{detector_seed}.csv")
-        )
-        with open(filename, "w") as f:
-            f.write(response.content.decode("utf-8"))
+            stream=True,
+        ) as response:
+            self._check_response(response)
+            self._download(response, filename)
 
         return filename
 
@@ -122,11 +252,12 @@ class ParInterface(Harness):
         }
 
         ids = "\n".join(test_ids) + "\n"
+        files: Dict[str, Any] = {
+            "test_ids": ids,
+            "configuration": io.StringIO(json.dumps(payload)),
+        }
 
-        response = requests.post(
-            f"{self.api_url}/session",
-            files={"test_ids": ids, "configuration": io.StringIO(json.dumps(payload))},
-        )
+        response = self._session().post(f"{self.api_url}/session", files=files)
 
         self._check_response(response)
         return response.json()["session_id"]
@@ -146,17 +277,44 @@ class ParInterface(Harness):
             "test_id": test_id,
             "round_id": round_id,
         }
-        response = requests.get(f"{self.api_url}/session/dataset", params=params,)
-
-        self._check_response(response)
-
         filename = os.path.abspath(
             os.path.join(self.folder, f"{session_id}.{test_id}.{round_id}.csv")
         )
-        with open(filename, "wb") as f:
-            f.write(response.content)
+        with self._session().get(
+            f"{self.api_url}/session/dataset", params=params, stream=True
+        ) as response:
+            self._check_response(response)
+            self._download(response, filename)
         return filename
 
+    def dataset_ids_request(
+        self, test_id: str, round_id: int, session_id: str
+    ) -> List[str]:
+        """
+        Request data for evaluation without writing it to a file.
+
+        Arguments:
+            -test_id    : the test being evaluated at this moment.
+            -round_id   : the sequential number of the round being evaluated
+        Returns:
+            -list of image files (including full path for each)
+        """
+        params: Dict[str, Union[str, int]] = {
+            "session_id": session_id,
+            "test_id": test_id,
+            "round_id": round_id,
+        }
+        response = self._session().get(
+            f"{self.api_url}/session/dataset", params=params
+        )
+
+        self._check_response(response)
+        return [
+            image_id.strip()
+            for image_id in response.content.decode("utf-8").splitlines()
+            if image_id.strip()
+        ]
+
     def get_feedback_request(
         self,
         feedback_ids: list,
@@ -183,27 +341,27 @@ class ParInterface(Harness):
             "round_id": round_id,
             "feedback_type": feedback_type,
         }
-        response = requests.get(f"{self.api_url}/session/feedback", params=params,)
-
-        self._check_response(response)
         filename = os.path.abspath(
             os.path.join(
                 self.folder, f"{session_id}.{test_id}.{round_id}_{feedback_type}.csv"
             )
         )
-        with open(filename, "wb") as f:
-            f.write(response.content)
+        with self._session().get(
+            f"{self.api_url}/session/feedback", params=params, stream=True
+        ) as response:
+            self._check_response(response)
+            self._download(response, filename)
 
         return filename
 
     def post_results(
-        self, result_files: Dict[str, str], test_id: str, round_id: int, session_id: str
+        self, result_files: Dict[str, Any], test_id: str, round_id: int, session_id: str
     ) -> None:
         """
         Post client detector predictions for the dataset.
 
         Arguments:
-            -result_files (dict of "type : file")
+            -result_files (dict of "type : file", buffer or DataFrame)
             -session_id
             -test_id
             -round_id
@@ -216,20 +374,121 @@ class ParInterface(Harness):
             "result_types": "|".join(result_files.keys()),
         }
 
-        files = {"test_identification": io.StringIO(json.dumps(payload))}
-
         if len(result_files.keys()) == 0:
             raise Exception("Must provide at least one result file")
 
-        for r_type in result_files:
-            with open(result_files[r_type], "r") as f:
-                contents = f.read()
-                files[f"{r_type}_file"] = io.StringIO(contents)
-
-        response = requests.post(f"{self.api_url}/session/results", files=files)
+        response = self._post_files(
+            "/session/results",
+            payload,
+            {f"{r_type}_file": result_files[r_type] for r_type in result_files},
+        )
 
         self._check_response(response)
 
+    def post_results_batch(
+        self, batch: List[Tuple[Dict[str, Any], str, int]], session_id: str
+    ) -> List[Optional[Exception]]:
+        """
+        Post client detector predictions for many rounds.
+
+        The server does not provide an endpoint for posting many rounds, so the
+        rounds are posted in order to /session/results over the pooled
+        connection of the thread.
+
+        Arguments:
+            -batch      : list of (result_files, test_id, round_id) for the rounds
+            -session_id
+        Returns:
+            -error raised for every round, None for rounds that were posted
+        """
+        errors: List[Optional[Exception]] = []
+        for result_files, test_id, round_id in batch:
+            try:
+                self.post_results(result_files, test_id, round_id, session_id)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+    def _post_files(
+        self, route: str, payload: Dict[str, Any], result_files: Dict[str, Any]
+    ) -> Response:
+        """
+        Post results to the server, with compression if it is accepted.
+
+        Compression is negotiated with the first requests, a compressed request
+        that fails is posted again without compression. The server accepts
+        compression once a compressed request succeeds and rejects it when only
+        the uncompressed request succeeds, requests failing either way do not
+        settle the negotiation.
+
+        Arguments:
+            -route        : route on the server
+            -payload      : identification of the tests and rounds for the results
+            -result_files : dict of "name : file", buffer or DataFrame
+        Returns:
+            -response of the server
+        """
+        response = self._stream_files(
+            route, payload, result_files, self.compress_requests
+        )
+        if self._compression_negotiated:
+            return response
+        if response.ok:
+            self._compression_negotiated = True
+            return response
+        response = self._stream_files(route, payload, result_files, False)
+        if response.ok:
+            logging.warning(
+                "Server does not accept compressed requests, "
+                "results are posted without compression"
+            )
+            self.compress_requests = False
+            self._compression_negotiated = True
+        return response
+
+    def _stream_files(
+        self,
+        route: str,
+        payload: Dict[str, Any],
+        result_files: Dict[str, Any],
+        compress: bool,
+    ) -> Response:
+        """
+        Stream a multipart request with the results to the server.
+
+        Arguments:
+            -route        : route on the server
+            -payload      : identification of the tests and rounds for the results
+            -result_files : dict of "name : file", buffer or DataFrame
+            -compress     : compress the body of the request
+        Returns:
+            -response of the server
+        """
+        with ExitStack() as stack:
+            # Result files are streamed from disk instead of being read in memory
+            files: Dict[str, Tuple[str, BinaryIO]] = {
+                "test_identification": (
+                    "test_identification",
+                    io.BytesIO(json.dumps(payload).encode("utf-8")),
+                )
+            }
+            for name in result_files:
+                files[name] = (
+                    name,
+                    stack.enter_context(open_result(result_files[name])),
+                )
+            encoder = MultipartEncoder(fields=files)
+            headers = {"Content-Type": encoder.content_type}
+            data: Any = encoder
+            if compress:
+                headers["Content-Encoding"] = self.compression
+                data = self._compress(iter(lambda: encoder.read(CHUNK_SIZE), b""))
+            return self._session().post(
+                f"{self.api_url}{route}", data=data, headers=headers
+            )
+
     def evaluate(self, test_id: str, round_id: int, session_id: str) -> str:
         """
         Get results for test(s).
@@ -245,18 +504,16 @@ class ParInterface(Harness):
             "test_id": test_id,
             "round_id": round_id,
         }
-        response = requests.get(f"{self.api_url}/session/evaluations", params=params,)
-
-        self._check_response(response)
-
         filename = os.path.abspath(
             os.path.join(
                 self.folder, f"{session_id}.{test_id}.{round_id}_evaluation.csv"
             )
         )
-
-        with open(filename, "w") as f:
-            f.write(response.content.decode("utf-8"))
+        with self._session().get(
+            f"{self.api_url}/session/evaluations", params=params, stream=True
+        ) as response:
+            self._check_response(response)
+            self._download(response, filename)
 
         return filename
 
@@ -269,7 +526,7 @@ class ParInterface(Harness):
         Returns:
             metadata json
         """
-        response = requests.get(
+        response = self._session().get(
             f"{self.api_url}/test/metadata",
             params={"test_id": test_id, "session_id": session_id},
         )
@@ -284,7 +541,7 @@ class ParInterface(Harness):
         Arguments:
         Returns: No return
         """
-        response = requests.delete(
+        response = self._session().delete(
             f"{self.api_url}/session", params={"session_id": session_id}
         )
 
@@ -0,0 +1,355 @@
+"""Client implementation that replays a recorded session."""
+
+from sail_on_client.errors import RoundError, ServerError
+from sail_on_client.utils import write_result
+from tinker.harness import Harness
+
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import uuid
+
+# Round files in a recorded test are named {round_id}.csv and feedback files
+# are named {round_id}_{feedback_type}.csv
+ROUND_FILE = re.compile(r"^(\d+)\.csv$")
+FEEDBACK_FILE = re.compile(r"^(\d+)_(\w+)\.csv$")
+
+
+class ReplayInterface(Harness):
+    """
+    Interface that serves a recorded session without a server.
+
+    The recorded session is a directory with a subdirectory for every test::
+
+        {replay_dir}/{test_id}/metadata.json
+        {replay_dir}/{test_id}/{round_id}.csv
+        {replay_dir}/{test_id}/{round_id}_{feedback_type}.csv
+
+    Every file is loaded in memory when the interface is created, so rounds
+    are served as fast as the detector requests them. Results are accepted
+    without evaluation and copied to result_dir when it is configured.
+    Evaluations are served from {round_id}_evaluation.csv files when they are
+    recorded.
+    """
+
+    # Rounds are served from memory, so any round can be requested at any time
+    supports_prefetch = True
+    # The number of posted rounds is counted in memory shared with test workers
+    supports_test_workers = True
+
+    def __init__(self, config_file: str, config_folder: str) -> None:
+        """
+        Initialize an object of replay interface.
+
+        Args:
+            config_file: Name of the config file that provides parameter
+                         to the interface
+            config_folder: The directory where configfile is present
+        Returns:
+            None
+        """
+        Harness.__init__(self, config_file, config_folder)
+        self.replay_dir = self.configuration_data["replay_dir"]
+        self.result_dir = self.configuration_data.get("result_dir", "")
+        self.temp_dir = TemporaryDirectory()
+        self.data_directory = self.temp_dir.name
+        self.rounds: Dict[str, List[bytes]] = {}
+        self.feedback: Dict[Tuple[str, int, str], bytes] = {}
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self._posted_rounds = mp.get_context("fork").Value("i", 0)
+        self._load_session()
+
+    def _load_session(self) -> None:
+        """Load the rounds, feedback and metadata of the recorded tests."""
+        if not os.path.isdir(self.replay_dir):
+            raise FileNotFoundError(f"No recorded session found in {self.replay_dir}")
+        for test_id in sorted(os.listdir(self.replay_dir)):
+            test_dir = os.path.join(self.replay_dir, test_id)
+            if not os.path.isdir(test_dir):
+                continue
+            rounds: Dict[int, bytes] = {}
+            for file_name in os.listdir(test_dir):
+                file_path = os.path.join(test_dir, file_name)
+                round_match = ROUND_FILE.match(file_name)
+                feedback_match = FEEDBACK_FILE.match(file_name)
+                if round_match:
+                    with open(file_path, "rb") as f:
+                        rounds[int(round_match.group(1))] = f.read()
+                elif feedback_match:
+                    round_id, feedback_type = feedback_match.groups()
+                    with open(file_path, "rb") as f:
+                        self.feedback[(test_id, int(round_id), feedback_type)] = (
+                            f.read()
+                        )
+                elif file_name == "metadata.json":
+                    with open(file_path, "r") as f:
+                        self.metadata[test_id] = json.load(f)
+            missing_rounds = set(range(len(rounds))) - set(rounds.keys())
+            if len(missing_rounds) > 0:
+                raise ValueError(
+                    f"Rounds {sorted(missing_rounds)} missing in {test_dir}"
+                )
+            self.rounds[test_id] = [rounds[round_id] for round_id in sorted(rounds)]
+        logging.info(
+            f"Loaded {sum(map(len, self.rounds.values()))} rounds for "
+            f"{len(self.rounds)} tests from {self.replay_dir}"
+        )
+
+    @property
+    def posted_rounds(self) -> int:
+        """Number of rounds posted by the protocol and its test workers."""
+        return self._posted_rounds.value
+
+    def test_ids_request(
+        self,
+        protocol: str,
+        domain: str,
+        detector_seed: str,
+        test_assumptions: str = "{}",
+    ) -> str:
+        """
+        Request Test Identifiers as part of a series of individual tests.
+
+        Args:
+            protocol : string indicating which protocol is being evaluated
+            domain : problem domain for the tests
+            detector_seed : A seed provided by the novelty detector
+            test_assumptions : Assumptions used by the detector
+        Returns:
+            Filename of file containing test ids
+        """
+        test_ids = [
+            test_id for test_id in self.rounds if test_id.startswith(f"{protocol}.")
+        ]
+        test_ids_file = os.path.join(self.data_directory, f"{protocol}.test_ids.csv")
+        with open(test_ids_file, "w") as f:
+            f.writelines([f"{test_id}\n" for test_id in test_ids])
+        return test_ids_file
+
+    def session_request(
+        self,
+        test_ids: list,
+        protocol: str,
+        domain: str,
+        novelty_detector_version: str,
+        hints: list,
+    ) -> str:
+        """
+        Create a new session to evaluate the detector using an empirical protocol.
+
+        Args:
+            test_ids   : list of tests being evaluated in this session
+            protocol   : string indicating which protocol is being evaluated
+            domain     : string indicating which domain is being evaluated
+            novelty_detector_version : string indicating the version of the novelty
+                                       detector being evaluated
+            hints      : Hints used for the session
+        Returns:
+            A session identifier
+        """
+        missing_tests = [test_id for test_id in test_ids if test_id not in self.rounds]
+        if len(missing_tests) > 0:
+            raise ServerError(
+                "MissingTests", f"Tests {missing_tests} are not in {self.replay_dir}"
+            )
+        return str(uuid.uuid4())
+
+    def dataset_request(self, test_id: str, round_id: int, session_id: str) -> str:
+        """
+        Request data for evaluation.
+
+        Args:
+            test_id    : the test being evaluated at this moment.
+            round_id   : the sequential number of the round being evaluated
+            session_id : the identifier provided by the server for a single experiment
+
+        Returns:
+            Filename of a file containing a list of image files (including full path for each)
+        """
+        data_file = os.path.join(
+            self.data_directory, f"{session_id}.{test_id}.{round_id}.csv"
+        )
+        with open(data_file, "wb") as f:
+            f.write(self._round(test_id, round_id))
+        return data_file
+
+    def dataset_ids_request(
+        self, test_id: str, round_id: int, session_id: str
+    ) -> List[str]:
+        """
+        Request data for evaluation without writing it to a file.
+
+        Args:
+            test_id    : the test being evaluated at this moment.
+            round_id   : the sequential number of the round being evaluated
+            session_id : the identifier provided by the server for a single experiment
+
+        Returns:
+            List of image files (including full path for each)
+        """
+        return [
+            image_id.strip()
+            for image_id in self._round(test_id, round_id).decode("utf-8").splitlines()
+            if image_id.strip()
+        ]
+
+    def _round(self, test_id: str, round_id: int) -> bytes:
+        """Get the recorded dataset for a round."""
+        rounds = self.rounds.get(test_id, [])
+        if round_id >= len(rounds):
+            raise RoundError(
+                "NoRound", f"Round {round_id} is not recorded for test {test_id}"
+            )
+        return rounds[round_id]
+
+    def get_feedback_request(
+        self,
+        feedback_ids: list,
+        feedback_type: str,
+        test_id: str,
+        round_id: int,
+        session_id: str,
+    ) -> str:
+        """
+        Get recorded labels for one or more example ids.
+
+        Args:
+            feedback_ids   : List of media ids for which feedback is required
+            feedback_type  : protocols constants with the values: label, detection, characterization
+            test_id        : the id of the test currently being evaluated
+            round_id       : the sequential number of the round being evaluated
+            session_id     : the id provided by a server denoting a session
+
+        Returns:
+            Path to a file containing containing requested feedback
+        """
+        feedback_key = (test_id, round_id, feedback_type)
+        if feedback_key not in self.feedback:
+            raise ServerError(
+                "MissingFeedback",
+                f"No {feedback_type} feedback recorded for round {round_id} "
+                f"of test {test_id}",
+            )
+        feedback_lines = self.feedback[feedback_key].splitlines(keepends=True)
+        if feedback_ids:
+            requested_ids = {
+                feedback_id.encode("utf-8") for feedback_id in feedback_ids
+            }
+            feedback_lines = [
+                line
+                for line in feedback_lines
+                if line.split(b",", 1)[0].strip() in requested_ids
+            ]
+        feedback_file = os.path.join(
+            self.data_directory,
+            f"{session_id}.{test_id}.{round_id}_{feedback_type}.csv",
+        )
+        with open(feedback_file, "wb") as f:
+            f.writelines(feedback_lines)
+        return feedback_file
+
+    def post_results(
+        self, result_files: Dict[str, Any], test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """
+        Accept client detector predictions for the dataset.
+
+        Args:
+            result_files : A dictionary of results with protocol constant as key and
+                           file path, buffer or DataFrame as value
+            test_id        : the id of the test currently being evaluated
+            round_id       : the sequential number of the round being evaluated
+            session_id     : the id provided by a server denoting a session
+
+        Returns:
+            None
+        """
+        with self._posted_rounds.get_lock():
+            self._posted_rounds.value += 1
+        if not self.result_dir:
+            return
+        os.makedirs(self.result_dir, exist_ok=True)
+        for result_key, result in result_files.items():
+            write_result(
+                result,
+                os.path.join(
+                    self.result_dir,
+                    f"{session_id}.{test_id}.{round_id}_{result_key}.csv",
+                ),
+            )
+
+    def post_results_batch(
+        self, batch: List[Tuple[Dict[str, Any], str, int]], session_id: str
+    ) -> List[Optional[Exception]]:
+        """
+        Accept client detector predictions for many rounds.
+
+        Args:
+            batch          : list of (result_files, test_id, round_id) for the rounds
+            session_id     : the id provided by a server denoting a session
+
+        Returns:
+            Error raised for every round, None for rounds that were posted
+        """
+        errors: List[Optional[Exception]] = []
+        for result_files, test_id, round_id in batch:
+            try:
+                self.post_results(result_files, test_id, round_id, session_id)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+    def evaluate(self, test_id: str, round_id: int, session_id: str) -> str:
+        """
+        Get results for test(s).
+
+        Args:
+            test_id        : the id of the test currently being evaluated
+            round_id       : the sequential number of the round being evaluated
+            session_id     : the id provided by a server denoting a session
+
+        Returns:
+            Path to a file with the results
+        """
+        evaluation_key = (test_id, round_id, "evaluation")
+        if evaluation_key not in self.feedback:
+            raise ServerError(
+                "MissingEvaluation",
+                f"No evaluation recorded for round {round_id} of test {test_id}",
+            )
+        evaluation_file = os.path.join(
+            self.data_directory, f"{session_id}.{test_id}.{round_id}_evaluation.csv"
+        )
+        with open(evaluation_file, "wb") as f:
+            f.write(self.feedback[evaluation_key])
+        return evaluation_file
+
+    def get_test_metadata(self, session_id: str, test_id: str) -> Dict[str, Any]:
+        """
+        Retrieve the metadata json for the specified test.
+
+        Args:
+            session_id        : the id of the session currently being evaluated
+            test_id           : the id of the test currently being evaluated
+
+        Returns:
+            A json file containing metadata
+        """
+        return dict(self.metadata.get(test_id, {}))
+
+    def terminate_session(self, session_id: str) -> None:
+        """
+        Terminate the session after the evaluation for the protocol is complete.
+
+        Args:
+            session_id     : the id provided by a server denoting a session
+
+        Returns: None
+        """
+        logging.info(f"Replayed session {session_id}: {self.posted_rounds} rounds")
@@ -0,0 +1,67 @@
+"""Run the tests in a session with multiple worker processes."""
+
+import logging
+import multiprocessing as mp
+import threading
+
+from typing import Callable, Iterable, List
+
+
+def run_tests_in_workers(
+    run_tests: Callable[[Iterable[str]], None], test_ids: List[str], num_workers: int
+) -> None:
+    """
+    Run tests in forked worker processes.
+
+    Every worker takes the next test from a shared queue till all tests are
+    done, so the workers stay busy when tests have a different number of
+    rounds. Workers are forked so that they share the harness and session of
+    the protocol without pickling them. State of the harness that the protocol
+    needs once the tests are done has to be kept in shared memory, since it is
+    copied in every worker, which is why protocols only use workers with
+    harnesses that declare supports_test_workers. A lock held by another
+    thread would never be released in a forked worker, so the tests are run in
+    this process when other threads are running.
+
+    Args:
+        run_tests (callable): Function that runs an iterable of test ids, this
+                              is called once in every worker
+        test_ids (list): List of test ids in the session
+        num_workers (int): Number of worker processes
+
+    Return:
+        None
+    """
+    num_workers = min(num_workers, len(test_ids))
+    if num_workers <= 1:
+        run_tests(test_ids)
+        return
+    if threading.active_count() > 1:
+        logging.warning(
+            f"Running tests without workers since {threading.active_count() - 1} "
+            "threads are running"
+        )
+        run_tests(test_ids)
+        return
+    ctx = mp.get_context("fork")
+    test_queue = ctx.Queue()
+    for test_id in test_ids:
+        test_queue.put(test_id)
+    for _ in range(num_workers):
+        test_queue.put(None)
+    workers = [
+        ctx.Process(
+            target=run_tests,
+            args=(iter(test_queue.get, None),),
+            name=f"test-worker-{idx}",
+        )
+        for idx in range(num_workers)
+    ]
+    logging.info(f"Running {len(test_ids)} tests with {num_workers} workers")
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed_workers = [worker.name for worker in workers if worker.exitcode != 0]
+    if len(failed_workers) > 0:
+        raise RuntimeError(f"Tests failed in {', '.join(failed_workers)}")
@@ -0,0 +1,257 @@
+"""Post results to the harness without blocking the rounds of a test."""
+
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from sail_on_client.utils import safe_remove_results
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Results for a round waiting to be posted in a batch with the session id,
+# cleanup and on_posted arguments of post_results
+PendingResults = Tuple[
+    Dict[str, Any], str, int, str, bool, Optional[Callable[[], None]]
+]
+
+
+class ResultsUploader(object):
+    """
+    Post results for rounds with a pool of threads.
+
+    Results for a test are posted in the order they were submitted, results
+    for different tests are posted concurrently. The number of results that
+    are waiting to be posted is bounded, so submitting blocks when the
+    harness falls behind. An error raised while posting results is raised by
+    the next call to the uploader.
+
+    With a batch size larger than 1 results for consecutive rounds are posted
+    together with post_results_batch of the harness. A batch is posted once
+    it is full or when the results for a test in it are waited for, batches
+    are posted in the order they were submitted and stop at the first round
+    that failed.
+    """
+
+    def __init__(
+        self,
+        harness: Any,
+        background: bool = True,
+        max_in_flight: int = 4,
+        num_workers: int = 2,
+        batch_size: int = 1,
+    ) -> None:
+        """
+        Initialize the uploader.
+
+        Args:
+            harness (Harness): Harness used for posting results
+            background (bool): Post results on background threads instead of
+                               the caller
+            max_in_flight (int): Number of results that can be waiting to be posted
+            num_workers (int): Number of threads used for posting results
+            batch_size (int): Number of rounds posted together, batches
+                              require a harness with post_results_batch and
+                              count as a single result in max_in_flight
+
+        Return:
+            None
+        """
+        self.harness = harness
+        self.background = background
+        self._error: Optional[BaseException] = None
+        self._raised_error: Optional[BaseException] = None
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._last_upload: Dict[str, Future] = {}
+        self.batch_size = batch_size
+        self._batch: List[PendingResults] = []
+        self._last_batch: Optional[Future] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if background:
+            self._executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    def _check_error(self) -> None:
+        """Raise error encountered while posting results."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            self._raised_error = error
+            raise error
+
+    def _record_error(self, upload: Future) -> None:
+        """Record error raised while posting results on a background thread."""
+        error = upload.exception()
+        # Uploads that waited on a failed upload raise the same error
+        if error is None or error is self._error or error is self._raised_error:
+            return
+        logging.error(f"Failed to post results: {error}")
+        self._error = error
+
+    def _post_results(
+        self,
+        previous_upload: Optional[Future],
+        results: Dict[str, Any],
+        test_id: str,
+        round_id: int,
+        session_id: str,
+        cleanup: bool,
+        on_posted: Optional[Callable[[], None]],
+    ) -> None:
+        """Post results after the previous results for the test are posted."""
+        try:
+            if previous_upload is not None:
+                previous_upload.result()
+            self.harness.post_results(results, test_id, round_id, session_id)
+            if on_posted is not None:
+                on_posted()
+            if cleanup:
+                safe_remove_results(results)
+        finally:
+            self._in_flight.release()
+
+    def _post_batch(
+        self, previous_batch: Optional[Future], batch: List[PendingResults]
+    ) -> None:
+        """
+        Post a batch of results after the previous batch is posted.
+
+        Rounds are reported as posted in order till the first round that
+        failed, so rounds after it are posted again when the test is resumed.
+        A batch is not posted when the previous batch failed.
+        """
+        try:
+            if previous_batch is not None:
+                previous_batch.result()
+            errors = self.harness.post_results_batch(
+                [
+                    (results, test_id, round_id)
+                    for results, test_id, round_id, *_ in batch
+                ],
+                batch[0][3],
+            )
+            for (results, test_id, round_id, _, cleanup, on_posted), error in zip(
+                batch, errors
+            ):
+                if error is not None:
+                    logging.error(
+                        f"Failed to post results for round {round_id} of {test_id}: "
+                        f"{error}"
+                    )
+                    raise error
+                if on_posted is not None:
+                    on_posted()
+                if cleanup:
+                    safe_remove_results(results)
+        finally:
+            self._in_flight.release()
+
+    def _submit_batch(self) -> None:
+        """Post the results waiting in the batch."""
+        if len(self._batch) == 0:
+            return
+        batch, self._batch = self._batch, []
+        self._in_flight.acquire()
+        if self._executor is None:
+            self._post_batch(None, batch)
+            return
+        upload = self._executor.submit(self._post_batch, self._last_batch, batch)
+        upload.add_done_callback(self._record_error)
+        self._last_batch = upload
+        for _, test_id, *_ in batch:
+            self._last_upload[test_id] = upload
+
+    def post_results(
+        self,
+        results: Dict[str, Any],
+        test_id: str,
+        round_id: int,
+        session_id: str,
+        cleanup: bool = True,
+        on_posted: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Post results for a round.
+
+        Args:
+            results (dict): A dictionary of results with protocol constant as
+                            key and file path, buffer or DataFrame as value
+            test_id (str): The id of the test currently being evaluated
+            round_id (int): The sequential number of the round being evaluated
+            session_id (str): The id provided by a server denoting a session
+            cleanup (bool): Remove the result files once they are posted
+            on_posted (callable): Function called once the results are posted,
+                                  before the result files are removed
+
+        Return:
+            None
+        """
+        self._check_error()
+        if self.batch_size > 1:
+            # A batch is posted for a single session
+            if len(self._batch) > 0 and self._batch[0][3] != session_id:
+                self._submit_batch()
+            self._batch.append(
+                (results, test_id, round_id, session_id, cleanup, on_posted)
+            )
+            if len(self._batch) >= self.batch_size:
+                self._submit_batch()
+            return
+        self._in_flight.acquire()
+        if self._executor is None:
+            self._post_results(
+                None, results, test_id, round_id, session_id, cleanup, on_posted
+            )
+            return
+        upload = self._executor.submit(
+            self._post_results,
+            self._last_upload.get(test_id),
+            results,
+            test_id,
+            round_id,
+            session_id,
+            cleanup,
+            on_posted,
+        )
+        upload.add_done_callback(self._record_error)
+        self._last_upload[test_id] = upload
+
+    def wait(self, test_id: str) -> None:
+        """
+        Wait for the results submitted for a test to be posted.
+
+        Args:
+            test_id (str): The id of the test
+
+        Return:
+            None
+        """
+        if any(pending[1] == test_id for pending in self._batch):
+            self._submit_batch()
+        last_upload = self._last_upload.pop(test_id, None)
+        if last_upload is not None:
+            # The error is recorded here since callbacks can run after the wait
+            self._record_error(last_upload)
+        self._check_error()
+
+    def drain(self) -> None:
+        """
+        Wait for all the submitted results to be posted.
+
+        Return:
+            None
+        """
+        self._submit_batch()
+        for test_id in list(self._last_upload.keys()):
+            self.wait(test_id)
+        self._check_error()
+
+    def close(self) -> None:
+        """
+        Post the submitted results and stop the background threads.
+
+        Return:
+            None
+        """
+        try:
+            self.drain()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
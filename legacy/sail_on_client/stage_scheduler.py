@@ -0,0 +1,286 @@
+"""Schedule the stages of a round based on the dependencies declared by a detector."""
+
+import logging
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from sail_on_client.utils import Dataset, ProtocolConfig, dataset_ids, safe_remove
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Order of the stages executed by the protocols in a round
+ROUND_STAGES = [
+    "FeatureExtraction",
+    "WorldDetection",
+    "NoveltyClassification",
+    "NoveltyCharacterization",
+    "NoveltyAdaption",
+]
+
+# Stages executed by every protocol in a round, in order
+PROTOCOL_STAGES = {
+    "OND": [
+        "FeatureExtraction",
+        "WorldDetection",
+        "NoveltyClassification",
+        "NoveltyAdaption",
+    ],
+    "CONDDA": [
+        "FeatureExtraction",
+        "WorldDetection",
+        "NoveltyCharacterization",
+        "NoveltyAdaption",
+    ],
+}
+
+# Entries of the toolset that are replaced by the features of the next round or
+# are accumulated over the test, which are not copied for the next round
+ROUND_OUTPUTS = {
+    "features_dict",
+    "logit_dict",
+    "features_array",
+    "logit_array",
+    "feature_ids",
+    "attributes",
+}
+
+# Entries of the toolset that are not shared with feature extraction running on
+# another thread or process, feedback holds the harness and is not used for
+# feature extraction
+WORKER_EXCLUDED = ROUND_OUTPUTS | {"ImageClassificationFeedback"}
+
+
+def _stage_name(stage: str) -> str:
+    """
+    Convert name of a stage from a configuration to the name used by protocols.
+
+    Args:
+        stage (str): Name of the stage, e.g. FeatureExtraction or feature_extraction
+
+    Return:
+        Name of the stage used by the protocols
+    """
+    if stage not in ROUND_STAGES:
+        stage = "".join(part.capitalize() for part in stage.split("_"))
+    if stage not in ROUND_STAGES:
+        raise ValueError(f"Unknown stage {stage}")
+    return stage
+
+
+def stages_to_skip(config: ProtocolConfig) -> Set[str]:
+    """
+    Find the stages that should be skipped by a protocol.
+
+    A stage listed in skip_stage is still executed when saved attributes are
+    restored for it, since the detector restores its attributes in the stage.
+
+    Args:
+        config (dict or Config): Protocol configuration
+
+    Return:
+        Names of the stages that should be skipped
+    """
+    skipped_stages = {_stage_name(stage) for stage in config["skip_stage"]}
+    if config["use_saved_attributes"]:
+        restored_stages = {_stage_name(stage) for stage in config["saved_attributes"]}
+        for stage in skipped_stages & restored_stages:
+            logging.info(f"Executing {stage} to restore saved attributes")
+        skipped_stages -= restored_stages
+    if len(skipped_stages) > 0:
+        logging.info(f"Skipping stages: {sorted(skipped_stages)}")
+    return skipped_stages
+
+
+def feature_extraction_start(
+    stage_dependencies: Optional[Dict[str, List[str]]],
+    protocol_stages: List[str] = ROUND_STAGES,
+) -> Optional[str]:
+    """
+    Find the stage after which feature extraction for the next round can start.
+
+    Dependencies on stages that the protocol does not execute are ignored,
+    e.g. NoveltyCharacterization in OND, since they never change the detector.
+
+    Args:
+        stage_dependencies (dict): Dictionary with a stage as key and the list
+                                   of stages from the previous round it depends
+                                   on as value. A detector without dependencies
+                                   runs every stage in order.
+        protocol_stages (list): Stages executed by the protocol in a round
+
+    Return:
+        Last stage of a round that feature extraction depends on, None if the
+        stages have to run in order
+    """
+    if stage_dependencies is None or "FeatureExtraction" not in stage_dependencies:
+        return None
+    dependencies = stage_dependencies["FeatureExtraction"]
+    unknown_stages = set(dependencies) - set(ROUND_STAGES)
+    if len(unknown_stages) > 0:
+        raise ValueError(f"Unknown stages {unknown_stages} in stage dependencies")
+    dependencies = [stage for stage in dependencies if stage in protocol_stages]
+    if "NoveltyAdaption" in dependencies:
+        return None
+    return max(dependencies, key=ROUND_STAGES.index, default="FeatureExtraction")
+
+
+def _snapshot_toolset(toolset: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a toolset for extracting features of the next round on another thread.
+
+    The copy is shallow, the dataset and round are replaced in the copy and the
+    image ids of the test are the only value the protocol modifies in place, so
+    they are the only value that is copied.
+
+    Args:
+        toolset (dict): Toolset used by the protocol
+
+    Return:
+        Copy of the toolset without the outputs of the round and the feedback,
+        so the protocol can modify the toolset while features are extracted
+    """
+    snapshot = {key: val for key, val in toolset.items() if key not in WORKER_EXCLUDED}
+    if "dataset_ids" in snapshot:
+        snapshot["dataset_ids"] = list(snapshot["dataset_ids"])
+    return snapshot
+
+
+class StageScheduler(object):
+    """
+    Overlap feature extraction for the next round with the current round.
+
+    Feature extraction for round N+1 is started on a background thread as
+    soon as the stages of round N that it depends on are complete. Stages
+    that depend on adaptation are run in order by the protocol.
+    """
+
+    def __init__(
+        self,
+        toolset: Dict[str, Any],
+        dataset_request: Callable[[int], Dataset],
+        extract: Callable[[Dict[str, Any], List[str]], Tuple[Dict, Dict]],
+        start_after: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the scheduler for a test.
+
+        Args:
+            toolset (dict): Toolset used by the protocol, a copy of it
+                            taken when the next round is started is used for
+                            the next round
+            dataset_request (callable): Function that requests the dataset for a round
+            extract (callable): Function that extracts features and logits for the
+                                images in a round using a toolset
+            start_after (str): Stage after which feature extraction for the
+                               next round is started, None to run rounds in order
+
+        Return:
+            None
+        """
+        self.toolset = toolset
+        self._dataset_request = dataset_request
+        self._extract = extract
+        self.start_after = start_after
+        self._pending: Optional[Tuple[int, Future]] = None
+        self._extracted: Optional[Tuple[int, Tuple[Dict, Dict]]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if start_after is not None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def pipelined(self) -> bool:
+        """Check if feature extraction overlaps with the previous round."""
+        return self._executor is not None
+
+    def _prepare_round(
+        self, toolset: Dict[str, Any], round_id: int
+    ) -> Tuple[Dataset, Tuple[Dict, Dict]]:
+        """Request the dataset for a round and extract features for it."""
+        dataset = self._dataset_request(round_id)
+        toolset["dataset"] = dataset
+        toolset["round_id"] = round_id
+        return dataset, self._extract(toolset, dataset_ids(dataset))
+
+    def dataset_request(self, round_id: int) -> Dataset:
+        """
+        Request data for a round.
+
+        Args:
+            round_id (int): The sequential number of the round
+
+        Return:
+            Filename of a file containing a list of image files or the list of
+            image files
+        """
+        if self._pending is not None and self._pending[0] == round_id:
+            _, future = self._pending
+            self._pending = None
+            # Raises RoundError if the round is not available
+            dataset, extracted = future.result()
+            self._extracted = (round_id, extracted)
+            return dataset
+        self._discard_pending()
+        return self._dataset_request(round_id)
+
+    def extract(self, round_id: int, image_ids: List[str]) -> Tuple[Dict, Dict]:
+        """
+        Get features and logits for a round.
+
+        Args:
+            round_id (int): The sequential number of the round
+            image_ids (list): List of image ids in the round
+
+        Return:
+            Tuple with features and logits for the round
+        """
+        if self._extracted is not None and self._extracted[0] == round_id:
+            _, extracted = self._extracted
+            self._extracted = None
+            return extracted
+        return self._extract(self.toolset, image_ids)
+
+    def stage_complete(self, round_id: int, stage: str) -> None:
+        """
+        Notify the scheduler that a stage of a round is complete.
+
+        Args:
+            round_id (int): The sequential number of the round
+            stage (str): Name of the stage
+
+        Return:
+            None
+        """
+        if self._executor is None or stage != self.start_after:
+            return
+        if self._pending is not None:
+            return
+        logging.info(f"Starting feature extraction for round {round_id + 1}")
+        self._pending = (
+            round_id + 1,
+            self._executor.submit(
+                self._prepare_round, _snapshot_toolset(self.toolset), round_id + 1
+            ),
+        )
+
+    def _discard_pending(self) -> None:
+        """Wait for features that are not required and remove their dataset."""
+        if self._pending is None:
+            return
+        _, future = self._pending
+        self._pending = None
+        try:
+            dataset, _ = future.result()
+            safe_remove(dataset)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """
+        Discard features extracted ahead and stop the background thread.
+
+        Return:
+            None
+        """
+        self._discard_pending()
+        self._extracted = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
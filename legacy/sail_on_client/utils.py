@@ -1,19 +1,32 @@
 """Utility function for sail-on-client."""
 
+import io
 import os
+import scriptconfig as scfg
 
+from typing import Any, BinaryIO, List, Mapping, Union
 
-def safe_remove(file_path: str) -> None:
+# A dataset is a file with an image id per line or the list of image ids
+Dataset = Union[str, List[str]]
+
+# A protocol configuration is read like a mapping, the configurations of the
+# protocols are not typed as mappings by scriptconfig
+ProtocolConfig = Union[Mapping[str, Any], scfg.Config]
+
+
+def safe_remove(file_path: Any) -> None:
     """
     Remove a file after checking that it exists.
 
     Args:
-        file_path (str): File path that should be removed
+        file_path (str): File path that should be removed, values that are not
+                         paths (e.g. datasets and results kept in memory) are
+                         ignored
 
     Return:
         None
     """
-    if os.path.exists(file_path):
+    if isinstance(file_path, str) and os.path.exists(file_path):
         os.remove(file_path)
 
 
@@ -29,3 +42,74 @@ def safe_remove_results(results: dict) -> None:
     """
     for result_files in results.values():
         safe_remove(result_files)
+
+
+def dataset_ids(dataset: Dataset) -> List[str]:
+    """
+    Get the image ids in a dataset.
+
+    Args:
+        dataset (str or list): Path to a file with an image id per line or the
+                               list of image ids
+
+    Return:
+        List of image ids
+    """
+    if isinstance(dataset, list):
+        return dataset
+    with open(dataset, "r") as f:
+        return [image_id.strip() for image_id in f.readlines()]
+
+
+def result_content(result: Any) -> str:
+    """
+    Get the content of a result.
+
+    Args:
+        result: Path to a result file, a text or binary buffer, or a DataFrame
+                that is written without header and index
+
+    Return:
+        Content of the result in csv format
+    """
+    if isinstance(result, str):
+        with open(result, "r") as f:
+            return f.read()
+    elif isinstance(result, (io.StringIO, io.BytesIO)):
+        content = result.getvalue()
+        return content.decode("utf-8") if isinstance(content, bytes) else content
+    elif hasattr(result, "to_csv"):
+        return result.to_csv(header=False, index=False)
+    raise TypeError(f"Unsupported result type {type(result).__name__}")
+
+
+def open_result(result: Any) -> BinaryIO:
+    """
+    Open a result for reading its content in binary mode.
+
+    Args:
+        result: Path to a result file, a text or binary buffer, or a DataFrame
+
+    Return:
+        File object for a result file, a binary buffer with the content otherwise
+    """
+    if isinstance(result, str):
+        return open(result, "rb")
+    elif isinstance(result, io.BytesIO):
+        return io.BytesIO(result.getvalue())
+    return io.BytesIO(result_content(result).encode("utf-8"))
+
+
+def write_result(result: Any, result_path: str) -> None:
+    """
+    Write a result to a file.
+
+    Args:
+        result: Path to a result file, a text or binary buffer, or a DataFrame
+        result_path (str): Path where the result is written
+
+    Return:
+        None
+    """
+    with open(result_path, "w") as f:
+        f.write(result_content(result))
@@ -22,6 +22,10 @@ setup(
     name="sail_on_client",
     setup_requires=setup_requirements,
     install_requires=requirements,
+    extras_require={
+        "async": ["aiohttp>=3.6.2"],
+        "zstd": ["zstandard>=0.14.0"],
+    },
     packages=find_packages(),
     package_data={"sail_on_client": ["py.typed"]},
     test_suite="tests",
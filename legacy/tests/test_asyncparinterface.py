@@ -0,0 +1,150 @@
+"""Tests for asyncio PAR Interface."""
+
+import asyncio
+import json
+import os
+import pytest
+
+
+from sail_on_client.errors import ProtocolError, ServerError
+from tempfile import TemporaryDirectory
+
+pytest.importorskip("aiohttp")
+
+
+def _test_ids(protocol_name):
+    """
+    Private function to read test ids for a protocol.
+
+    Args:
+        protocol_name (str): Name of the protocol
+
+    Return:
+        list of test ids
+    """
+    test_id_path = os.path.join(
+        os.path.dirname(__file__),
+        "data",
+        f"{protocol_name}",
+        "image_classification",
+        "test_ids.csv",
+    )
+    return list(map(str.strip, open(test_id_path, "r").readlines()))
+
+
+async def _run_session(par_interface, protocol_name):
+    """
+    Private function to run a round of a session.
+
+    Args:
+        par_interface (AsyncParInterface): An instance of AsyncParInterface
+        protocol_name (str): Name of the protocol
+
+    Return:
+        Tuple with session id, dataset, feedback, evaluation and metadata
+    """
+    test_id = f"{protocol_name}.1.1.1234"
+    session_id = await par_interface.session_request(
+        _test_ids(protocol_name), protocol_name, "image_classification", "0.1.1", []
+    )
+    dataset = await par_interface.dataset_request(test_id, 0, session_id)
+    result_path = os.path.join(
+        os.path.dirname(__file__), f"test_results_{protocol_name}.1.1.1234.csv"
+    )
+    await par_interface.post_results(
+        {"detection": result_path, "classification": result_path},
+        test_id,
+        0,
+        session_id,
+    )
+    feedback = await par_interface.get_feedback_request(
+        ["n01484850_18013.JPEG", "n01484850_24624.JPEG"],
+        "classification",
+        test_id,
+        0,
+        session_id,
+    )
+    evaluation = await par_interface.evaluate(test_id, 0, session_id)
+    metadata = await par_interface.get_test_metadata(session_id, test_id)
+    await par_interface.terminate_session(session_id)
+    return session_id, dataset, feedback, evaluation, metadata
+
+
+def test_concurrent_sessions(server_setup, get_interface_params):
+    """
+    Test sessions driven concurrently by an event loop.
+
+    Args:
+        server_setup (tuple): Tuple containing url and result directory
+        get_interface_params (tuple): Tuple to configure par interface
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.asyncparinterface import AsyncParInterface
+
+    config_directory, config_name = get_interface_params
+
+    async def run_sessions():
+        async with AsyncParInterface(config_name, config_directory) as par_interface:
+            return await asyncio.gather(
+                _run_session(par_interface, "OND"), _run_session(par_interface, "OND")
+            )
+
+    sessions = asyncio.run(run_sessions())
+    assert sessions[0][0] != sessions[1][0]
+    for session_id, dataset, feedback, evaluation, metadata in sessions:
+        assert dataset == os.path.join(
+            config_directory, f"{session_id}.OND.1.1.1234.0.csv"
+        )
+        assert feedback == os.path.join(
+            config_directory, f"{session_id}.OND.1.1.1234.0_classification.csv"
+        )
+        assert evaluation == os.path.join(
+            config_directory, f"{session_id}.OND.1.1.1234.0_evaluation.csv"
+        )
+        assert metadata["protocol"] == "OND"
+
+
+def test_error_mapping(server_setup, get_interface_params):
+    """
+    Test errors returned by the server are raised like ParInterface.
+
+    Args:
+        server_setup (tuple): Tuple containing url and result directory
+        get_interface_params (tuple): Tuple to configure par interface
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.asyncparinterface import AsyncParInterface
+
+    config_directory, config_name = get_interface_params
+
+    async def bad_dataset_request():
+        async with AsyncParInterface(config_name, config_directory) as par_interface:
+            session_id = await par_interface.session_request(
+                _test_ids("OND"), "OND", "image_classification", "0.1.1", []
+            )
+            await par_interface.dataset_request(f"{session_id}", "OND.1.1.1234", 3)
+
+    with pytest.raises(ProtocolError):
+        asyncio.run(bad_dataset_request())
+
+
+def test_invalid_response():
+    """
+    Test responses that are not json are raised as server errors.
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.asyncparinterface import AsyncParInterface
+
+    with TemporaryDirectory() as config_directory:
+        with open(os.path.join(config_directory, "configuration.json"), "w") as f:
+            json.dump({"url": "http://localhost:3306"}, f)
+        par_interface = AsyncParInterface("configuration.json", config_directory)
+        with pytest.raises(ServerError):
+            par_interface._check_response(500, b"<html>Internal Server Error</html>")
+        par_interface._check_response(200, b"{}")
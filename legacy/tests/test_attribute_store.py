@@ -0,0 +1,44 @@
+"""Tests for saving attributes as raw buffers."""
+
+from sail_on_client.attribute_store import (
+    is_raw_attribute_dir,
+    load_raw_attributes,
+    save_raw_attributes,
+)
+from tempfile import TemporaryDirectory
+from fractions import Fraction
+import numpy as np
+import os
+import torch
+
+
+def test_save_and_load_raw_attributes():
+    """
+    Test attributes restored from raw buffers.
+
+    Return:
+        None
+    """
+    attribute_dict = {
+        "features": {"Dummy_test": torch.rand(5, 10)},
+        "half_features": {"Dummy_test": torch.rand(3, 2).half()},
+        "scores": {"Dummy_test": np.arange(7, dtype=np.int16)},
+        "names": {"Dummy_test": ("a.JPEG", "b.JPEG")},
+        "labels": {"Dummy_test": {"a.JPEG": 1, "b.JPEG": None}},
+        "ratio": {"Dummy_test": Fraction(1, 3)},
+        "_round_index": {"features": {"Dummy_test": {"offsets": {0: [0, 5]}}}},
+    }
+    with TemporaryDirectory() as save_dir:
+        attribute_dir = os.path.join(save_dir, "Dummy_test_attribute")
+        save_raw_attributes(attribute_dir, attribute_dict)
+        assert is_raw_attribute_dir(attribute_dir)
+        restored_dict = load_raw_attributes(attribute_dir)
+        for name in ["features", "half_features"]:
+            restored_tensor = restored_dict[name]["Dummy_test"]
+            assert torch.equal(restored_tensor, attribute_dict[name]["Dummy_test"])
+            assert restored_tensor.dtype == attribute_dict[name]["Dummy_test"].dtype
+        restored_scores = restored_dict["scores"]["Dummy_test"]
+        assert np.array_equal(restored_scores, attribute_dict["scores"]["Dummy_test"])
+        assert isinstance(restored_scores.base, np.memmap)
+        for name in ["names", "labels", "ratio", "_round_index"]:
+            assert restored_dict[name] == attribute_dict[name]
@@ -0,0 +1,188 @@
+"""Tests for BatchedExtractor."""
+
+from sail_on_client.batched_extraction import BatchedExtractor, merge_rounds
+from sail_on_client.errors import RoundError
+from sail_on_client.feature_cache import extract_features
+from tempfile import TemporaryDirectory
+import os
+import pytest
+import torch
+
+ROUNDS = [
+    [f"n01484850_{idx}.JPEG" for idx in range(4)],
+    [f"n01484850_{idx}.JPEG" for idx in range(4, 8)],
+    ["n01484850_8.JPEG", "n01484850_0.JPEG"],
+]
+
+
+class DummyAlgorithm(object):
+    """Algorithm that computes features from the image id."""
+
+    def execute(self, toolset: dict, step_descriptor: str) -> tuple:
+        """Extract features for the images in the dataset."""
+        with open(toolset["dataset"], "r") as f:
+            image_ids = [image_id.strip() for image_id in f]
+        features_dict = {
+            image_id: torch.full((4,), float(image_id.split("_")[1].split(".")[0]))
+            for image_id in image_ids
+        }
+        logit_dict = {
+            image_id: feature[:2] for image_id, feature in features_dict.items()
+        }
+        return features_dict, logit_dict
+
+
+@pytest.fixture(scope="function")
+def data_dir():
+    """Fixture to create a temporary directory for the datasets."""
+    with TemporaryDirectory() as data_dir:
+        yield data_dir
+
+
+def _dataset_request(data_dir: str, round_id: int) -> str:
+    """
+    Private function to write the dataset for a round.
+
+    Args:
+        data_dir (str): Directory for the datasets
+        round_id (int): Round id
+
+    Return:
+        Path to the dataset
+    """
+    if round_id >= len(ROUNDS):
+        raise RoundError("NoRound", f"Round {round_id} is not available")
+    dataset = os.path.join(data_dir, f"OND.1.1.1234_{round_id}.csv")
+    with open(dataset, "w") as f:
+        f.writelines([f"{image_id}\n" for image_id in ROUNDS[round_id]])
+    return dataset
+
+
+def test_merge_rounds():
+    """
+    Test image ids of rounds are merged into batches of unique ids.
+
+    Return:
+        None
+    """
+    batches = merge_rounds(ROUNDS, 4)
+    assert [len(batch) for batch in batches] == [4, 4, 1]
+    assert batches[2] == ["n01484850_8.JPEG"]
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_batched_features_match_rounds(data_dir, num_workers):
+    """
+    Test features extracted in batches match features extracted round by round.
+
+    Args:
+        data_dir (str): Directory for the datasets
+        num_workers (int): Number of worker processes
+
+    Return:
+        None
+    """
+    algorithm = DummyAlgorithm()
+    batched_extractor = BatchedExtractor(
+        {},
+        algorithm,
+        None,
+        lambda round_id: _dataset_request(data_dir, round_id),
+        batch_size=3,
+        num_workers=num_workers,
+    )
+    for round_id, image_ids in enumerate(ROUNDS):
+        toolset = {"dataset": batched_extractor.dataset_request(round_id)}
+        features_dict, logit_dict = batched_extractor.extract(toolset, image_ids)
+        expected_features, expected_logits = extract_features(
+            algorithm, toolset, None, image_ids
+        )
+        assert list(features_dict.keys()) == list(expected_features.keys())
+        for image_id in image_ids:
+            assert torch.equal(features_dict[image_id], expected_features[image_id])
+            assert torch.equal(logit_dict[image_id], expected_logits[image_id])
+    with pytest.raises(RoundError):
+        batched_extractor.dataset_request(len(ROUNDS))
+    # Only the datasets for the rounds are left
+    assert len(os.listdir(data_dir)) == len(ROUNDS)
+
+
+def _unavailable_algorithm() -> None:
+    """Fail to load an algorithm, like a detector missing in the workers."""
+    raise ImportError("No module named 'unavailable_detector'")
+
+
+class UnavailableAlgorithm(DummyAlgorithm):
+    """Algorithm that can not be loaded by the worker processes."""
+
+    def __reduce__(self) -> tuple:
+        """Pickle the algorithm as a function that fails to load it."""
+        return _unavailable_algorithm, ()
+
+
+def test_workers_fail_to_load(data_dir):
+    """
+    Test batches are extracted in order when the workers can not load the detector.
+
+    Args:
+        data_dir (str): Directory for the datasets
+
+    Return:
+        None
+    """
+    batched_extractor = BatchedExtractor(
+        {},
+        UnavailableAlgorithm(),
+        None,
+        lambda round_id: _dataset_request(data_dir, round_id),
+        batch_size=3,
+        num_workers=2,
+    )
+    batched_extractor.dataset_request(0)
+    assert batched_extractor._pool is None
+    features_dict, _ = batched_extractor.extract({}, ROUNDS[0])
+    assert [float(feature[0]) for feature in features_dict.values()] == [0, 1, 2, 3]
+    batched_extractor.close()
+
+
+class RoundAlgorithm(object):
+    """Algorithm that extracts the round id in the toolset as features."""
+
+    def execute(self, toolset: dict, step_descriptor: str) -> tuple:
+        """Extract the round id for the images in the dataset."""
+        with open(toolset["dataset"], "r") as f:
+            image_ids = [image_id.strip() for image_id in f]
+        features_dict = {image_id: toolset["round_id"] for image_id in image_ids}
+        return features_dict, dict(features_dict)
+
+
+def test_batches_streamed(data_dir):
+    """
+    Test batches are extracted with their round and dropped once they are used.
+
+    Args:
+        data_dir (str): Directory for the datasets
+
+    Return:
+        None
+    """
+    batched_extractor = BatchedExtractor(
+        {"round_id": 5},
+        RoundAlgorithm(),
+        None,
+        lambda round_id: _dataset_request(data_dir, round_id),
+        batch_size=4,
+    )
+    batched_extractor.dataset_request(0)
+    features_dict, _ = batched_extractor.extract({}, ROUNDS[0])
+    assert set(features_dict.values()) == {0}
+    # Only the batch with the images of the first round was extracted
+    assert batched_extractor._received == 1
+    # n01484850_0.JPEG is kept for the last round
+    assert list(batched_extractor._features.keys()) == ["n01484850_0.JPEG"]
+    features_dict, _ = batched_extractor.extract({}, ROUNDS[1])
+    assert set(features_dict.values()) == {1}
+    features_dict, _ = batched_extractor.extract({}, ROUNDS[2])
+    assert features_dict == {"n01484850_8.JPEG": 2, "n01484850_0.JPEG": 0}
+    assert batched_extractor._features == {}
+    batched_extractor.close()
@@ -0,0 +1,98 @@
+"""Tests for CheckpointWriter."""
+
+from sail_on_client.checkpoint_writer import CheckpointWriter, pickle_to
+from sail_on_client.checkpointer import finalize_attributes
+from sail_on_client.attribute_store import load_raw_attributes, save_raw_attributes
+from functools import partial
+from tempfile import TemporaryDirectory
+import os
+import pickle as pkl
+import pytest
+import threading
+import torch
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_submit(background):
+    """
+    Test checkpoints written by the writer.
+
+    Args:
+        background (bool): Flag to write on a background thread
+
+    Return:
+        None
+    """
+    with TemporaryDirectory() as save_dir:
+        checkpoint_writer = CheckpointWriter(background)
+        for idx in range(5):
+            checkpoint_path = os.path.join(save_dir, f"{idx}_features.pkl")
+            checkpoint_writer.submit(checkpoint_path, partial(pickle_to, {"idx": idx}))
+        attribute_path = os.path.join(save_dir, "Dummy_test_attribute")
+        for idx in range(2):
+            checkpoint_writer.submit(
+                attribute_path,
+                partial(save_raw_attributes, attribute_dict={"idx": idx}),
+            )
+        checkpoint_writer.flush()
+        for idx in range(5):
+            checkpoint_path = os.path.join(save_dir, f"{idx}_features.pkl")
+            assert pkl.load(open(checkpoint_path, "rb")) == {"idx": idx}
+        assert load_raw_attributes(attribute_path) == {"idx": 1}
+        assert not any(name.endswith(".tmp") for name in os.listdir(save_dir))
+        checkpoint_writer.close()
+        metrics = checkpoint_writer.metrics()
+        assert metrics["writes"] == 7
+        assert metrics["queue_depth"] == 0
+
+
+def test_submit_finalized_attributes():
+    """
+    Test attributes are written as submitted while the detector modifies them.
+
+    Return:
+        None
+    """
+    with TemporaryDirectory() as save_dir:
+        checkpoint_writer = CheckpointWriter()
+        # Hold the writer till the detector modified its attributes
+        detector_done = threading.Event()
+
+        def wait_for_detector(path: str) -> None:
+            detector_done.wait()
+            pickle_to({}, path)
+
+        checkpoint_writer.submit(os.path.join(save_dir, "blocked"), wait_for_detector)
+        dummy_tensor = torch.zeros(2)
+        dummy_list = [0]
+        attributes = {
+            "dummy_dict": {"Dummy_test": {"dummy_key": dummy_list}},
+            "dummy_tensor": {"Dummy_test": dummy_tensor},
+        }
+        checkpoint_path = os.path.join(save_dir, "Dummy_test_attribute.pkl")
+        checkpoint_writer.submit(
+            checkpoint_path, partial(pickle_to, finalize_attributes(attributes))
+        )
+        dummy_list.append(1)
+        dummy_tensor.fill_(1)
+        detector_done.set()
+        checkpoint_writer.close()
+        saved_attributes = pkl.load(open(checkpoint_path, "rb"))
+        assert saved_attributes["dummy_dict"]["Dummy_test"] == {"dummy_key": [0]}
+        assert saved_attributes["dummy_tensor"]["Dummy_test"].tolist() == [0, 0]
+
+
+def test_error_raised_on_flush():
+    """
+    Test errors in the background thread are raised by flush.
+
+    Return:
+        None
+    """
+    with TemporaryDirectory() as save_dir:
+        checkpoint_writer = CheckpointWriter()
+        checkpoint_path = os.path.join(save_dir, "missing", "features.pkl")
+        checkpoint_writer.submit(checkpoint_path, partial(pickle_to, {}))
+        with pytest.raises(RuntimeError):
+            checkpoint_writer.flush()
+        checkpoint_writer.close()
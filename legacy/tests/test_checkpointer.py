@@ -1,9 +1,10 @@
 """Tests for Checkpointer."""
 
-from sail_on_client.checkpointer import Checkpointer
+from sail_on_client.checkpointer import Checkpointer, finalize_attributes
 from sail_on_client.mock import MockAdapterWithCheckpoint
 from tempfile import TemporaryDirectory
 from random import randint
+from unittest import mock
 import torch
 import os
 import ubelt as ub
@@ -149,3 +150,262 @@ def test_restore_attribute(
     restored_mock_detector = MockAdapterWithCheckpoint(checkpoint_restore_config)
     restored_mock_detector.restore_attributes("FeatureExtraction")
     assert mock_detector == restored_mock_detector
+
+
+@pytest.mark.parametrize(
+    "checkpoint_restore_config",
+    [
+        TemporaryDirectory().name,
+        os.path.join(TemporaryDirectory().name, "attributes.pkl"),
+    ],
+    indirect=True,
+)
+def test_restore_attribute_cached(
+    checkpoint_restore_config, checkpoint_save_config, dummy_attributes
+):
+    """
+    Test attributes are loaded once for a test.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+        checkpoint_restore_config (dict): Dictionary with the config to save attributes
+        dummy_attributes (dict): Dictionary with value for the attributes
+    Return:
+        None
+    """
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    mock_detector.execute(dummy_attributes, "FeatureExtraction")
+    mock_detector.save_attributes("FeatureExtraction")
+    save_dir = checkpoint_restore_config["save_dir"]
+    if os.path.isdir(save_dir):
+        save_dir = os.path.join(save_dir, "Dummy_test_attribute.pkl")
+    pkl.dump(mock_detector.toolset["attributes"], open(save_dir, "wb"))
+    restored_mock_detector = MockAdapterWithCheckpoint(checkpoint_restore_config)
+    with mock.patch(
+        "sail_on_client.checkpointer.open", wraps=open, create=True
+    ) as checkpointer_open:
+        restored_mock_detector.restore_attributes("FeatureExtraction")
+        restored_mock_detector.restore_attributes("FeatureExtraction")
+        attribute_opens = [
+            call for call in checkpointer_open.call_args_list if call[0][0] == save_dir
+        ]
+        assert len(attribute_opens) == 1
+    assert mock_detector == restored_mock_detector
+    # Rewriting the attributes invalidates the cached attributes
+    dummy_attributes["dummy_list"] = [1000]
+    mock_detector.execute(dummy_attributes, "FeatureExtraction")
+    mock_detector.toolset["attributes"] = {}
+    mock_detector.save_attributes("FeatureExtraction")
+    pkl.dump(mock_detector.toolset["attributes"], open(save_dir, "wb"))
+    restored_mock_detector.restore_attributes("FeatureExtraction")
+    assert mock_detector == restored_mock_detector
+
+
+def test_save_attribute_multiple_rounds(checkpoint_save_config):
+    """
+    Test sequence attributes saved over multiple rounds are concatenated.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+    Return:
+        None
+    """
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    round_attributes = []
+    for round_id in range(3):
+        dummy_attributes = {
+            "dummy_dict": {f"dummy_key_{round_id}": "Dummy_val"},
+            "dummy_list": [round_id],
+            "dummy_tuple": (round_id,),
+            "dummy_tensor": torch.rand(1, 10),
+            "dummy_val": round_id,
+        }
+        round_attributes.append(dummy_attributes)
+        mock_detector.execute(dummy_attributes, "FeatureExtraction")
+        mock_detector.save_attributes("FeatureExtraction")
+    attribute_dict = finalize_attributes(mock_detector.toolset["attributes"])
+    test_id = checkpoint_save_config["test_id"]
+    assert attribute_dict["dummy_list"][test_id] == [0, 1, 2]
+    assert attribute_dict["dummy_tuple"][test_id] == (0, 1, 2)
+    assert attribute_dict["dummy_val"][test_id] == 2
+    assert len(attribute_dict["dummy_dict"][test_id]) == 3
+    expected_tensor = torch.cat([val["dummy_tensor"] for val in round_attributes])
+    assert torch.all(torch.eq(attribute_dict["dummy_tensor"][test_id], expected_tensor))
+    # Pickling attributes without finalizing them should produce the same values
+    restored_dict = pkl.loads(pkl.dumps(mock_detector.toolset["attributes"]))
+    assert restored_dict["dummy_list"][test_id] == [0, 1, 2]
+
+
+def test_save_attribute_reused_buffer(checkpoint_save_config):
+    """
+    Test values of earlier rounds are kept when a detector reuses its buffers.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+    Return:
+        None
+    """
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    dummy_list = [0]
+    dummy_tensor = torch.zeros(1, 10)
+    dummy_attributes = {
+        "dummy_dict": {},
+        "dummy_list": dummy_list,
+        "dummy_tuple": (),
+        "dummy_tensor": dummy_tensor,
+        "dummy_val": 0,
+    }
+    for round_id in range(3):
+        # The detector overwrites the values of the previous round in place
+        dummy_list[0] = round_id
+        dummy_tensor.fill_(round_id)
+        mock_detector.execute(dummy_attributes, "FeatureExtraction")
+        mock_detector.save_attributes("FeatureExtraction")
+    dummy_list[0] = -1
+    dummy_tensor.fill_(-1)
+    attribute_dict = finalize_attributes(mock_detector.toolset["attributes"])
+    test_id = checkpoint_save_config["test_id"]
+    assert attribute_dict["dummy_list"][test_id] == [0, 1, 2]
+    assert attribute_dict["dummy_tensor"][test_id][:, 0].tolist() == [0, 1, 2]
+
+@pytest.mark.parametrize(
+    "checkpoint_restore_config", [TemporaryDirectory().name], indirect=True
+)
+def test_restore_attribute_ragged_rounds(
+    checkpoint_restore_config, checkpoint_save_config
+):
+    """
+    Test attributes restored for rounds of different sizes.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+        checkpoint_restore_config (dict): Dictionary with the config to save attributes
+    Return:
+        None
+    """
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    round_sizes = [3, 3, 1]
+    round_attributes = []
+    for round_id, round_size in enumerate(round_sizes):
+        dummy_attributes = {
+            "dummy_dict": {
+                f"dummy_key_{round_id}_{idx}": "Dummy_val" for idx in range(round_size)
+            },
+            "dummy_list": [round_id] * round_size,
+            "dummy_tuple": (round_id,) * round_size,
+            "dummy_tensor": torch.rand(round_size, 10),
+            # Scalar attributes are saved once per test
+            "dummy_val": 1,
+        }
+        round_attributes.append(dummy_attributes)
+        checkpoint_save_config["round_id"] = round_id
+        mock_detector.execute(dummy_attributes, "FeatureExtraction")
+        mock_detector.save_attributes("FeatureExtraction")
+    save_dir = checkpoint_restore_config["save_dir"]
+    if os.path.isdir(save_dir):
+        save_dir = os.path.join(save_dir, "Dummy_test_attribute.pkl")
+    attribute_dict = finalize_attributes(mock_detector.toolset["attributes"])
+    pkl.dump(attribute_dict, open(save_dir, "wb"))
+    restored_mock_detector = MockAdapterWithCheckpoint(checkpoint_restore_config)
+    # The dataset of the restore config is not consulted when rounds are indexed
+    for round_id in range(len(round_sizes)):
+        checkpoint_restore_config["round_id"] = round_id
+        restored_mock_detector.restore_attributes("FeatureExtraction")
+        mock_detector.execute(round_attributes[round_id], "FeatureExtraction")
+        assert mock_detector == restored_mock_detector
+
+
+@pytest.mark.parametrize(
+    "checkpoint_restore_config", [TemporaryDirectory().name], indirect=True
+)
+def test_restore_attribute_cumulative_dict(
+    checkpoint_restore_config, checkpoint_save_config
+):
+    """
+    Test dictionary attributes kept by the detector for an entire test.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+        checkpoint_restore_config (dict): Dictionary with the config to save attributes
+    Return:
+        None
+    """
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    dummy_dict = {}
+    for round_id in range(3):
+        # The detector adds the keys of every round to the same dictionary
+        dummy_dict[f"dummy_key_{round_id}"] = round_id
+        dummy_attributes = {
+            "dummy_dict": dummy_dict,
+            "dummy_list": [round_id],
+            "dummy_tuple": (round_id,),
+            "dummy_tensor": torch.rand(1, 10),
+            "dummy_val": 1,
+        }
+        checkpoint_save_config["round_id"] = round_id
+        mock_detector.execute(dummy_attributes, "FeatureExtraction")
+        mock_detector.save_attributes("FeatureExtraction")
+    save_dir = checkpoint_restore_config["save_dir"]
+    if os.path.isdir(save_dir):
+        save_dir = os.path.join(save_dir, "Dummy_test_attribute.pkl")
+    pkl.dump(
+        finalize_attributes(mock_detector.toolset["attributes"]), open(save_dir, "wb")
+    )
+    restored_mock_detector = MockAdapterWithCheckpoint(checkpoint_restore_config)
+    for round_id in range(3):
+        checkpoint_restore_config["round_id"] = round_id
+        restored_mock_detector.restore_attributes("FeatureExtraction")
+        restored_dict = restored_mock_detector.detector.dummy_dict
+        assert restored_dict == {f"dummy_key_{round_id}": round_id}
+    # Rounds that were not saved are not restored as empty rounds
+    checkpoint_restore_config["round_id"] = 3
+    with pytest.raises(KeyError):
+        restored_mock_detector.restore_attributes("FeatureExtraction")
+
+
+@pytest.mark.parametrize(
+    "checkpoint_restore_config", [TemporaryDirectory().name], indirect=True
+)
+def test_restore_round_attributes(checkpoint_restore_config, checkpoint_save_config):
+    """
+    Test attributes for an entire round restored without earlier rounds.
+
+    Args:
+        checkpoint_save_config (dict): Dictionary with the config to save attributes
+        checkpoint_restore_config (dict): Dictionary with the config to save attributes
+    Return:
+        None
+    """
+    save_dir = checkpoint_restore_config["save_dir"]
+    checkpoint_save_config["save_dir"] = save_dir
+    checkpoint_save_config["save_elementwise"] = False
+    checkpoint_restore_config["save_elementwise"] = False
+    mock_detector = MockAdapterWithCheckpoint(checkpoint_save_config)
+    round_attributes = []
+    for round_id in range(3):
+        dummy_attributes = {
+            "dummy_dict": {f"dummy_key_{round_id}": "Dummy_val"},
+            "dummy_list": [round_id],
+            "dummy_tuple": (round_id,),
+            "dummy_tensor": torch.rand(1, 10),
+            "dummy_val": round_id,
+        }
+        round_attributes.append(dummy_attributes)
+        checkpoint_save_config["round_id"] = round_id
+        mock_detector.execute(dummy_attributes, "FeatureExtraction")
+        mock_detector.save_attributes("FeatureExtraction")
+    assert mock_detector.toolset["attributes"] == {}
+    # Only the shard for the restored round is required
+    for round_id in range(2):
+        os.remove(
+            os.path.join(
+                save_dir, "Dummy_test_rounds", f"{round_id}_FeatureExtraction.pkl"
+            )
+        )
+    checkpoint_restore_config["round_id"] = 2
+    restored_mock_detector = MockAdapterWithCheckpoint(checkpoint_restore_config)
+    restored_mock_detector.restore_attributes("FeatureExtraction")
+    assert mock_detector == restored_mock_detector
+    checkpoint_restore_config["round_id"] = 0
+    with pytest.raises(FileNotFoundError):
+        restored_mock_detector.restore_attributes("FeatureExtraction")
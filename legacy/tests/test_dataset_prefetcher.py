@@ -0,0 +1,92 @@
+"""Tests for DatasetPrefetcher."""
+
+from sail_on_client.dataset_prefetcher import DatasetPrefetcher
+from sail_on_client.errors import RoundError
+import pytest
+
+
+class DummyHarness(object):
+    """Harness that provides a fixed number of rounds for every test."""
+
+    def __init__(self, num_rounds: int) -> None:
+        """Initialize."""
+        self.num_rounds = num_rounds
+        self.requests: list = []
+
+    def dataset_request(self, test_id: str, round_id: int, session_id: str) -> str:
+        """Return name of the dataset for a round."""
+        self.requests.append((test_id, round_id))
+        if round_id >= self.num_rounds:
+            raise RoundError("End of Dataset", "No more rounds")
+        return f"{session_id}.{test_id}.{round_id}.csv"
+
+    def dataset_ids_request(self, test_id: str, round_id: int, session_id: str) -> list:
+        """Return image ids for a round."""
+        self.requests.append((test_id, round_id))
+        if round_id >= self.num_rounds:
+            raise RoundError("End of Dataset", "No more rounds")
+        return [f"{test_id}.{round_id}.JPEG"]
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_dataset_request(prefetch):
+    """
+    Test datasets requested with and without prefetching.
+
+    Args:
+        prefetch (bool): Flag to prefetch the next round
+
+    Return:
+        None
+    """
+    harness = DummyHarness(2)
+    dataset_prefetcher = DatasetPrefetcher(harness, "session", prefetch)
+    for test_id in ["OND.1.1.1234", "OND.1.1.5678"]:
+        datasets = []
+        with pytest.raises(RoundError):
+            for round_id in range(3):
+                datasets.append(dataset_prefetcher.dataset_request(test_id, round_id))
+        assert datasets == [f"session.{test_id}.{idx}.csv" for idx in range(2)]
+    dataset_prefetcher.close()
+    assert len(harness.requests) == 6
+    assert dataset_prefetcher.hits == (2 if prefetch else 0)
+
+
+def test_unexpected_round():
+    """
+    Test prefetched round is discarded when a different round is requested.
+
+    Return:
+        None
+    """
+    harness = DummyHarness(3)
+    dataset_prefetcher = DatasetPrefetcher(harness, "session")
+    dataset_prefetcher.dataset_request("OND.1.1.1234", 0)
+    dataset = dataset_prefetcher.dataset_request("OND.1.1.1234", 2)
+    dataset_prefetcher.close()
+    assert dataset == "session.OND.1.1.1234.2.csv"
+    assert dataset_prefetcher.hits == 0
+    assert harness.requests[:3] == [
+        ("OND.1.1.1234", 0),
+        ("OND.1.1.1234", 1),
+        ("OND.1.1.1234", 2),
+    ]
+
+
+def test_in_memory_dataset_request():
+    """
+    Test image ids requested for rounds without a dataset file.
+
+    Return:
+        None
+    """
+    harness = DummyHarness(2)
+    dataset_prefetcher = DatasetPrefetcher(harness, "session", in_memory=True)
+    datasets = [
+        dataset_prefetcher.dataset_request("OND.1.1.1234", idx) for idx in range(2)
+    ]
+    with pytest.raises(RoundError):
+        dataset_prefetcher.dataset_request("OND.1.1.1234", 2)
+    dataset_prefetcher.close()
+    assert datasets == [["OND.1.1.1234.0.JPEG"], ["OND.1.1.1234.1.JPEG"]]
+    assert dataset_prefetcher.hits == 1
@@ -0,0 +1,135 @@
+"""Tests for FeatureCache."""
+
+from sail_on_client.feature_cache import FeatureCache, extract_features
+from tempfile import TemporaryDirectory
+import os
+import pytest
+import torch
+
+
+class DummyExtractor(object):
+    """Feature extractor that records the images it was asked to process."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.extracted_ids: list = []
+
+    def execute(self, toolset: dict, step_descriptor: str) -> tuple:
+        """Extract features for images in the dataset."""
+        with open(toolset["dataset"], "r") as f:
+            image_ids = [image_id.strip() for image_id in f.readlines()]
+        self.extracted_ids.extend(image_ids)
+        features_dict = {
+            image_id: torch.full((4,), float(image_id.split("_")[1][0]))
+            for image_id in image_ids
+        }
+        logit_dict = {image_id: torch.zeros(2) for image_id in image_ids}
+        return features_dict, logit_dict
+
+
+@pytest.fixture(scope="function")
+def cache_setup():
+    """Fixture to create a cache directory and a round of images."""
+    with TemporaryDirectory() as cache_dir:
+        image_ids = [f"n01484850_{idx}.JPEG" for idx in range(4)]
+        for image_id in image_ids:
+            with open(os.path.join(cache_dir, image_id), "w") as f:
+                f.write(image_id)
+        yield cache_dir, image_ids
+
+
+def _write_dataset(dataset_path, image_ids):
+    """
+    Private function to write a dataset file.
+
+    Args:
+        dataset_path (str): Path to the dataset file
+        image_ids (list): List of image ids
+
+    Return:
+        None
+    """
+    with open(dataset_path, "w") as f:
+        f.writelines([f"{image_id}\n" for image_id in image_ids])
+
+
+@pytest.mark.parametrize("key_type", ["id", "hash"])
+def test_partial_hit(cache_setup, key_type):
+    """
+    Test only missed images are extracted on a partial hit.
+
+    Args:
+        cache_setup (tuple): Tuple with cache directory and image ids
+        key_type (str): Key used by the cache
+
+    Return:
+        None
+    """
+    cache_dir, image_ids = cache_setup
+    version = {"detector_class": "DummyExtractor", "model_paths": ["missing.pth"]}
+    feature_cache = FeatureCache(cache_dir, version, key_type, cache_dir)
+    dataset_path = os.path.join(cache_dir, "round.csv")
+    extractor = DummyExtractor()
+
+    _write_dataset(dataset_path, image_ids[:2])
+    toolset = {"dataset": dataset_path}
+    extract_features(extractor, toolset, feature_cache, image_ids[:2])
+    assert extractor.extracted_ids == image_ids[:2]
+
+    _write_dataset(dataset_path, image_ids)
+    features_dict, logit_dict = extract_features(
+        extractor, toolset, feature_cache, image_ids
+    )
+    assert extractor.extracted_ids == image_ids
+    assert toolset["dataset"] == dataset_path
+    assert list(features_dict.keys()) == image_ids
+    assert list(logit_dict.keys()) == image_ids
+    for image_id in image_ids:
+        assert float(features_dict[image_id][0]) == float(image_id.split("_")[1][0])
+
+
+def test_cache_versioned_by_model(cache_setup):
+    """
+    Test features are not shared between different models.
+
+    Args:
+        cache_setup (tuple): Tuple with cache directory and image ids
+
+    Return:
+        None
+    """
+    cache_dir, image_ids = cache_setup
+    version = {"detector_class": "DummyExtractor", "model_paths": ["a.pth"]}
+    feature_cache = FeatureCache(cache_dir, version)
+    feature_cache.add({image_ids[0]: torch.zeros(4)}, {image_ids[0]: torch.zeros(2)})
+    _, _, missed_ids = feature_cache.lookup(image_ids[:1])
+    assert missed_ids == []
+    version["model_paths"] = ["b.pth"]
+    _, _, missed_ids = FeatureCache(cache_dir, version).lookup(image_ids[:1])
+    assert missed_ids == image_ids[:1]
+
+
+def test_lookup_reloads_store(cache_setup):
+    """
+    Test features added by another cache for the same store are found.
+
+    Args:
+        cache_setup (tuple): Tuple with cache directory and image ids
+
+    Return:
+        None
+    """
+    cache_dir, image_ids = cache_setup
+    version = {"detector_class": "DummyExtractor", "model_paths": ["a.pth"]}
+    reader_cache = FeatureCache(cache_dir, version)
+    _, _, missed_ids = reader_cache.lookup(image_ids[:2])
+    assert missed_ids == image_ids[:2]
+    writer_cache = FeatureCache(cache_dir, version)
+    writer_cache.add(
+        {image_id: torch.ones(4) for image_id in image_ids[:2]},
+        {image_id: torch.zeros(2) for image_id in image_ids[:2]},
+    )
+    features_dict, _, missed_ids = reader_cache.lookup(image_ids[:3])
+    assert missed_ids == image_ids[2:3]
+    assert list(features_dict.keys()) == image_ids[:2]
+    assert not reader_cache.feature_store.refresh()
@@ -0,0 +1,244 @@
+"""Tests for FeatureStore."""
+
+from sail_on_client.feature_store import (
+    FeatureStore,
+    FeatureWriter,
+    feature_store_version,
+)
+from tempfile import TemporaryDirectory
+import multiprocessing as mp
+import numpy as np
+import os
+import pytest
+import torch
+
+
+@pytest.fixture(scope="function")
+def store_dir():
+    """Fixture to create a temporary directory for a feature store."""
+    with TemporaryDirectory() as save_dir:
+        yield os.path.join(save_dir, "OND.1.1.1234_features")
+
+
+@pytest.fixture(scope="function")
+def dummy_features():
+    """Fixture for generating dummy features and logits."""
+    image_ids = [f"n01484850_{idx}.JPEG" for idx in range(4)]
+    features_dict = {image_id: torch.rand(8) for image_id in image_ids}
+    logit_dict = {image_id: np.random.rand(3) for image_id in image_ids}
+    return features_dict, logit_dict
+
+
+def test_feature_store_version():
+    """
+    Test version computed from a protocol configuration.
+
+    Return:
+        None
+    """
+    config = {
+        "novelty_detector_class": "MockDetector",
+        "detector_config": {
+            "efficientnet_params": {"model_path": "b.pth"},
+            "evm_params": {"model_path": "a.hdf5", "tailsize": 10},
+        },
+    }
+    version = feature_store_version(config)
+    assert version["detector_class"] == "MockDetector"
+    assert version["model_paths"] == ["a.hdf5", "b.pth"]
+
+
+def test_append_and_read(store_dir, dummy_features):
+    """
+    Test features appended to the store are read back without copies.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    version = {"detector_class": "MockDetector", "model_paths": []}
+    feature_store = FeatureStore(store_dir, version, mode="a")
+    assert feature_store.append(features_dict, logit_dict) == 4
+    # Appending the same images again should not add rows
+    assert feature_store.append(features_dict, logit_dict) == 0
+
+    restored_store = FeatureStore(store_dir, version)
+    image_ids = list(features_dict.keys())[1:3]
+    restored_features = restored_store.features(image_ids)
+    restored_logits = restored_store.logits(image_ids)
+    assert list(restored_features.keys()) == image_ids
+    for image_id in image_ids:
+        assert np.allclose(restored_features[image_id], features_dict[image_id])
+        assert np.allclose(restored_logits[image_id], logit_dict[image_id])
+        assert isinstance(restored_features[image_id], torch.Tensor)
+        assert isinstance(restored_logits[image_id].base, np.memmap)
+
+
+def test_version_mismatch(store_dir, dummy_features):
+    """
+    Test opening a store created with a different detector.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    version = {"detector_class": "MockDetector", "model_paths": []}
+    FeatureStore(store_dir, version, mode="a").append(features_dict, logit_dict)
+    with pytest.raises(ValueError):
+        FeatureStore(store_dir, {"detector_class": "Other", "model_paths": []})
+
+
+def test_partial_rows_dropped(store_dir, dummy_features):
+    """
+    Test rows written without being added to the log are dropped.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    feature_store = FeatureStore(store_dir, mode="a")
+    feature_store.append(features_dict, logit_dict)
+    with open(os.path.join(store_dir, "features.bin"), "ab") as f:
+        f.write(b"partial")
+    feature_store = FeatureStore(store_dir, mode="a")
+    assert len(feature_store) == 4
+    assert os.path.getsize(os.path.join(store_dir, "features.bin")) == 4 * 8 * 4
+    with open(os.path.join(store_dir, "ids.jsonl"), "a") as f:
+        f.write('["n01484850_4.JP')
+    feature_store = FeatureStore(store_dir, mode="a")
+    assert len(feature_store) == 4
+    assert feature_store.append(features_dict, logit_dict) == 0
+
+
+def test_feature_writer(store_dir, dummy_features):
+    """
+    Test features written round by round on a background thread.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    image_ids = list(features_dict.keys())
+    feature_writer = FeatureWriter(FeatureStore(store_dir, mode="a"))
+    for round_ids in [image_ids[:2], image_ids[2:]]:
+        feature_writer.write(
+            {image_id: features_dict[image_id] for image_id in round_ids},
+            {image_id: logit_dict[image_id] for image_id in round_ids},
+        )
+    feature_writer.close()
+    feature_store = FeatureStore(store_dir)
+    assert feature_store.ids == image_ids
+    restored_features = feature_store.features(image_ids)
+    for image_id in image_ids:
+        assert np.allclose(restored_features[image_id], features_dict[image_id])
+
+
+def test_feature_writer_error(store_dir, dummy_features):
+    """
+    Test errors in the background thread are raised by the writer.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, _ = dummy_features
+    feature_writer = FeatureWriter(FeatureStore(store_dir, mode="a"))
+    feature_writer.write(features_dict, {})
+    with pytest.raises(RuntimeError):
+        feature_writer.close()
+
+
+def test_gather(store_dir, dummy_features):
+    """
+    Test features and logits gathered for a round in contiguous arrays.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    FeatureStore(store_dir, mode="a").append(features_dict, logit_dict)
+    image_ids = list(features_dict.keys())[::-2]
+    features, logits = FeatureStore(store_dir).gather(image_ids)
+    assert isinstance(features, torch.Tensor)
+    assert features.shape == (2, 8)
+    assert logits.shape == (2, 3)
+    assert features.is_contiguous()
+    for idx, image_id in enumerate(image_ids):
+        assert torch.allclose(features[idx], features_dict[image_id])
+        assert np.allclose(logits[idx], logit_dict[image_id])
+
+
+def test_gather_empty_store(store_dir):
+    """
+    Test gathering from a store that nothing was appended to.
+
+    Args:
+        store_dir (str): Directory for the store
+
+    Return:
+        None
+    """
+    FeatureStore(store_dir, mode="a")
+    features, logits = FeatureStore(store_dir).gather([])
+    assert len(features) == 0
+    assert len(logits) == 0
+
+
+def test_append_from_processes(store_dir, dummy_features):
+    """
+    Test features appended to a store from several processes.
+
+    Args:
+        store_dir (str): Directory for the store
+        dummy_features (tuple): Tuple with features and logits
+
+    Return:
+        None
+    """
+    features_dict, logit_dict = dummy_features
+    image_ids = list(features_dict.keys())
+    feature_store = FeatureStore(store_dir, mode="a")
+    ctx = mp.get_context("fork")
+    workers = [
+        ctx.Process(
+            target=feature_store.append,
+            args=(
+                {image_id: features_dict[image_id] for image_id in round_ids},
+                {image_id: logit_dict[image_id] for image_id in round_ids},
+            ),
+        )
+        for round_ids in [image_ids[:3], image_ids[1:]]
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert feature_store.append(features_dict, logit_dict) == 0
+    restored_store = FeatureStore(store_dir)
+    assert sorted(restored_store.ids) == sorted(image_ids)
+    restored_features = restored_store.features(image_ids)
+    for image_id in image_ids:
+        assert np.allclose(restored_features[image_id], features_dict[image_id])
@@ -0,0 +1,167 @@
+"""Tests for stage instrumentation."""
+
+from sail_on_client.instrumentation import (
+    InstrumentedAlgorithm,
+    InstrumentedHarness,
+    StageRecorder,
+    _result_size,
+    write_stage_summary,
+)
+from tempfile import TemporaryDirectory
+import io
+import json
+import os
+import pytest
+
+
+class DummyAlgorithm(object):
+    """Algorithm that returns features for the images in a round."""
+
+    name = "dummy"
+
+    def execute(self, toolset: dict, step_descriptor: str) -> tuple:
+        """Return features and logits for every image in the dataset."""
+        if step_descriptor == "FeatureExtraction":
+            with open(toolset["dataset"], "r") as f:
+                image_ids = [image_id.strip() for image_id in f.readlines()]
+            features = {image_id: [0.0] for image_id in image_ids}
+            return features, dict(features)
+        return None
+
+
+class DummyHarness(object):
+    """Harness that writes a dataset with three images for every round."""
+
+    def __init__(self, data_dir: str) -> None:
+        """Initialize."""
+        self.data_dir = data_dir
+        self.posted: list = []
+
+    def dataset_request(self, test_id: str, round_id: int, session_id: str) -> str:
+        """Write the dataset for a round."""
+        dataset = os.path.join(self.data_dir, f"{test_id}_{round_id}.csv")
+        with open(dataset, "w") as f:
+            f.write("a.png\nb.png\nc.png\n")
+        return dataset
+
+    def post_results(
+        self, result_files: dict, test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """Record the posted results."""
+        self.posted.append((test_id, round_id))
+
+    def get_feedback_request(
+        self,
+        feedback_ids: list,
+        feedback_type: str,
+        test_id: str,
+        round_id: int,
+        session_id: str,
+    ) -> str:
+        """Write labels for the requested images."""
+        feedback = os.path.join(self.data_dir, f"{test_id}_{round_id}_feedback.csv")
+        with open(feedback, "w") as f:
+            f.writelines([f"{feedback_id},1\n" for feedback_id in feedback_ids])
+        return feedback
+
+    def get_test_metadata(self, session_id: str, test_id: str) -> dict:
+        """Return metadata for a test."""
+        return {"red_light": "b.png"}
+
+
+@pytest.fixture(scope="function")
+def record_dir():
+    """Fixture to create a temporary directory for records."""
+    with TemporaryDirectory() as record_dir:
+        yield record_dir
+
+
+def _read_records(record_path: str) -> list:
+    with open(record_path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_record(record_dir):
+    """Test recording a stage."""
+    record_path = os.path.join(record_dir, "stages.jsonl")
+    stage_recorder = StageRecorder(record_path, "1234")
+    with stage_recorder.record("WorldDetection", "OND.1.1.1234", 0) as metrics:
+        metrics["images"] = 10
+    with pytest.raises(ValueError):
+        with stage_recorder.record("NoveltyClassification", "OND.1.1.1234", 0):
+            raise ValueError("Failed")
+    stage_recorder.close()
+    records = _read_records(record_path)
+    assert len(records) == 1
+    assert records[0]["stage"] == "WorldDetection"
+    assert records[0]["test_id"] == "OND.1.1.1234"
+    assert records[0]["images"] == 10
+    assert records[0]["wall_time"] >= 0
+
+
+def test_record_disabled():
+    """Test that nothing is recorded without a record file."""
+    stage_recorder = StageRecorder()
+    assert not stage_recorder.enabled
+    with stage_recorder.record("WorldDetection") as metrics:
+        metrics["images"] = 10
+    stage_recorder.close()
+
+
+def test_instrumented_protocol_steps(record_dir):
+    """Test recording the requests and steps executed for a round."""
+    record_path = os.path.join(record_dir, "stages.jsonl")
+    stage_recorder = StageRecorder(record_path, "1234")
+    harness = InstrumentedHarness(DummyHarness(record_dir), stage_recorder)
+    algorithm = InstrumentedAlgorithm(DummyAlgorithm(), stage_recorder)
+    assert algorithm.name == "dummy"
+    toolset = {"test_id": "OND.1.1.1234", "round_id": 0}
+    toolset["metadata"] = harness.get_test_metadata("1234", "OND.1.1.1234")
+    toolset["dataset"] = harness.dataset_request("OND.1.1.1234", 0, "1234")
+    # Features of the round are not provided to the steps that use saved features
+    algorithm.execute(toolset, "FeatureExtraction")
+    algorithm.execute(toolset, "WorldDetection")
+    harness.post_results({"detection": toolset["dataset"]}, "OND.1.1.1234", 0, "1234")
+    harness.get_feedback_request(["a.png"], "classification", "OND.1.1.1234", 0, "1234")
+    stage_recorder.close()
+    assert harness.posted == [("OND.1.1.1234", 0)]
+    records = _read_records(record_path)
+    assert [record["stage"] for record in records] == [
+        "get_test_metadata",
+        "dataset_request",
+        "FeatureExtraction",
+        "WorldDetection",
+        "post_results",
+        "get_feedback_request",
+    ]
+    assert [record["images"] for record in records[1:4]] == [3, 3, 3]
+    assert records[1]["bytes"] == records[4]["bytes"] > 0
+    assert records[5]["images"] == 1
+    assert records[5]["bytes"] == len("a.png,1\n")
+
+
+def test_result_size():
+    """Test size of results kept in memory."""
+    pd = pytest.importorskip("pandas")
+    result = pd.DataFrame({"id": ["a.png", "b.png"], "score": [0.5, 0.5]})
+    assert _result_size(result) == result.memory_usage(index=False, deep=True).sum()
+    assert _result_size(io.BytesIO(b"a.png,1\n")) == 8
+    assert _result_size(io.StringIO("a.png,1\n")) == 8
+
+
+def test_write_stage_summary(record_dir):
+    """Test summarizing the records for a session."""
+    record_path = os.path.join(record_dir, "stages.jsonl")
+    stage_recorder = StageRecorder(record_path, "1234")
+    for round_id in range(3):
+        with stage_recorder.record("WorldDetection", "OND.1.1.1234", round_id) as m:
+            m["images"] = 2
+    stage_recorder.close()
+    other_recorder = StageRecorder(record_path, "5678")
+    with other_recorder.record("WorldDetection", "OND.1.1.5678", 0):
+        pass
+    other_recorder.close()
+    summary = write_stage_summary(record_path, "1234")
+    assert summary["WorldDetection"]["count"] == 3
+    assert summary["WorldDetection"]["images"] == 6
+    assert _read_records(record_path)[-1] == {"session_id": "1234", "summary": summary}
@@ -167,6 +167,38 @@ def test_post_results(get_interface_params, protocol_constant, protocol_name):
     )
 
 
+@pytest.mark.parametrize("protocol_name", ["OND", "CONDDA"])
+def test_post_results_batch(get_interface_params, protocol_name):
+    """
+    Tests for posting results in a batch.
+
+    Args:
+        get_interface_params (tuple): Tuple to configure local interface
+        protocol_name (str): Name of the protocol ( options: OND and CONDDA)
+    Return:
+        None
+    """
+    from sail_on_client.protocol.localinterface import LocalInterface
+
+    config_directory, config_name = get_interface_params
+    local_interface = LocalInterface(config_name, config_directory)
+    session_id = _initialize_session(local_interface, protocol_name)
+    result_path = os.path.join(
+        os.path.dirname(__file__), f"test_results_{protocol_name}.1.1.1234.csv"
+    )
+    missing_path = os.path.join(config_directory, "missing_results.csv")
+    errors = local_interface.post_results_batch(
+        [
+            ({"detection": result_path}, f"{protocol_name}.1.1.1234", 0),
+            ({"detection": missing_path}, f"{protocol_name}.1.1.1234", 1),
+        ],
+        session_id,
+    )
+    # Errors are reported for the round that failed
+    assert errors[0] is None
+    assert isinstance(errors[1], FileNotFoundError)
+
+
 @pytest.mark.skip(
     reason="Modifications in results is incompatible with the feedback api. Refer to #1 on sail-on-api"
 )
@@ -1,8 +1,12 @@
 """Tests for PAR Interface."""
 
+import gzip
+import json
 import os
 import pytest
 
+from tempfile import TemporaryDirectory
+
 
 from sail_on_client.errors import ProtocolError
 
@@ -179,6 +183,41 @@ def test_post_results(
     par_interface.post_results(result_files, f"{protocol_name}.1.1.1234", 0, session_id)
 
 
+@pytest.mark.parametrize("protocol_name", ["OND", "CONDDA"])
+def test_post_results_batch(server_setup, get_interface_params, protocol_name):
+    """
+    Tests for posting results in a batch.
+
+    Args:
+        server_setup (tuple): Tuple containing url and result directory
+        get_interface_params (tuple): Tuple to configure par interface
+        protocol_name (str): Name of the protocol ( options: OND and CONDDA)
+    Return:
+        None
+    """
+    from sail_on_client.protocol.parinterface import ParInterface
+
+    url, result_dir = server_setup
+    config_directory, config_name = get_interface_params
+    par_interface = ParInterface(config_name, config_directory)
+    session_id = _initialize_session(par_interface, protocol_name)
+    result_files = {
+        "detection": os.path.join(
+            os.path.dirname(__file__), f"test_results_{protocol_name}.1.1.1234.csv"
+        )
+    }
+    errors = par_interface.post_results_batch(
+        [
+            (result_files, f"{protocol_name}.1.1.1234", 0),
+            ({}, f"{protocol_name}.1.1.1234", 1),
+        ],
+        session_id,
+    )
+    # Errors are reported for the round that failed
+    assert errors[0] is None
+    assert isinstance(errors[1], Exception)
+
+
 @pytest.mark.parametrize(
     "feedback_mapping",
     (
@@ -302,3 +341,148 @@ def test_get_metadata(server_setup, get_interface_params):
     session_id = _initialize_session(par_interface, "OND", ["red_light"])
     metadata = par_interface.get_test_metadata(session_id, "OND.1.1.1234")
     assert "n01484850_4515.JPEG" == metadata["red_light"]
+
+
+def test_pooled_sessions(get_interface_params):
+    """
+    Test sessions share a connection pool between threads.
+
+    Args:
+        get_interface_params (tuple): Tuple to configure par interface
+
+    Return:
+        None
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from sail_on_client.protocol.parinterface import ParInterface
+
+    config_directory, config_name = get_interface_params
+    par_interface = ParInterface(config_name, config_directory)
+    session = par_interface._session()
+    assert par_interface._session() is session
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        thread_session = executor.submit(par_interface._session).result()
+    assert thread_session is not session
+    adapter = session.get_adapter(par_interface.api_url)
+    assert thread_session.get_adapter(par_interface.api_url) is adapter
+    assert adapter._pool_maxsize == par_interface.pool_size
+    # A forked process creates a new pool
+    par_interface._pid = -1
+    assert par_interface._session() is not session
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_compression(server_setup, compression):
+    """
+    Test requests with compressed payloads.
+
+    Args:
+        server_setup (tuple): Tuple containing url and result directory
+        compression (str): Compression used for the payloads
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.parinterface import ACCEPT_ENCODINGS, ParInterface
+
+    url, result_dir = server_setup
+    with TemporaryDirectory() as config_directory:
+        with open(os.path.join(config_directory, "configuration.json"), "w") as f:
+            json.dump({"url": url, "compression": compression}, f)
+        par_interface = ParInterface("configuration.json", config_directory)
+        if par_interface.compression == "gzip":
+            body = b"".join(par_interface._compress(iter([b"n01484850_18013.JPEG\n"])))
+            assert gzip.decompress(body) == b"n01484850_18013.JPEG\n"
+        # Record the headers of the requests sent to the server
+        sent_headers = []
+        par_interface._session().hooks["response"].append(
+            lambda response, *args, **kwargs: sent_headers.append(
+                response.request.headers
+            )
+        )
+        session_id = _initialize_session(par_interface, "OND")
+        filename = par_interface.dataset_request("OND.1.1.1234", 0, session_id)
+        expected_image_ids = _read_image_ids(filename)
+        assert expected_image_ids == ["n01484850_18013.JPEG", "n01484850_24624.JPEG"]
+        assert (
+            sent_headers[-1]["Accept-Encoding"]
+            == ACCEPT_ENCODINGS[par_interface.compression]
+        )
+        result_files = {
+            "detection": os.path.join(
+                os.path.dirname(__file__), "test_results_OND.1.1.1234.csv"
+            )
+        }
+        sent_headers.clear()
+        par_interface.post_results(result_files, "OND.1.1.1234", 0, session_id)
+        content_encodings = [
+            headers.get("Content-Encoding") for headers in sent_headers
+        ]
+        if compression == "none":
+            assert content_encodings == [None]
+        elif par_interface.compress_requests:
+            assert content_encodings == [par_interface.compression]
+        else:
+            # Results rejected by the server are posted again without compression
+            assert content_encodings == [par_interface.compression, None]
+        # The server stored the decoded results
+        with open(result_files["detection"], "rb") as f:
+            expected_results = f.read()
+        posted_results = []
+        for root, _, filenames in os.walk(result_dir):
+            for filename in filenames:
+                with open(os.path.join(root, filename), "rb") as f:
+                    posted_results.append(f.read())
+        assert expected_results in posted_results
+        # The negotiated encoding is used for the following requests
+        sent_headers.clear()
+        par_interface.post_results(result_files, "OND.1.1.1234", 1, session_id)
+        assert [headers.get("Content-Encoding") for headers in sent_headers] == [
+            par_interface.compression if par_interface.compress_requests else None
+        ]
+
+
+@pytest.mark.parametrize(
+    "status_codes, compress_requests, negotiated",
+    (
+        ([200], True, True),
+        ([400, 200], False, True),
+        ([500, 200], False, True),
+        ([400, 400], True, False),
+    ),
+)
+def test_compression_negotiation(status_codes, compress_requests, negotiated):
+    """
+    Test negotiation of compressed requests with the server.
+
+    Args:
+        status_codes (list[int]): Status codes of the responses to the requests
+        compress_requests (bool): Compression of requests after negotiation
+        negotiated (bool): Negotiation is settled by the requests
+
+    Return:
+        None
+    """
+    from requests import Response
+
+    from sail_on_client.protocol.parinterface import ParInterface
+
+    with TemporaryDirectory() as config_directory:
+        with open(os.path.join(config_directory, "configuration.json"), "w") as f:
+            json.dump({"url": "http://localhost:3306", "compression": "gzip"}, f)
+        par_interface = ParInterface("configuration.json", config_directory)
+    responses = iter(status_codes)
+    sent_compressed = []
+
+    def _stream_files(route, payload, result_files, compress):
+        sent_compressed.append(compress)
+        response = Response()
+        response.status_code = next(responses)
+        return response
+
+    par_interface._stream_files = _stream_files
+    response = par_interface._post_files("/session/results", {}, {})
+    assert response.status_code == status_codes[-1]
+    assert sent_compressed == [True, False][: len(status_codes)]
+    assert par_interface.compress_requests == compress_requests
+    assert par_interface._compression_negotiated == negotiated
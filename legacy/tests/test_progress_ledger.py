@@ -0,0 +1,173 @@
+"""Tests for ProgressLedger."""
+
+from sail_on_client.progress_ledger import ProgressLedger
+from sail_on_client.feature_store import FeatureStore
+from sail_on_client.results_uploader import ResultsUploader
+from functools import partial
+from tempfile import TemporaryDirectory
+import numpy as np
+import os
+import pytest
+
+
+class DummyHarness(object):
+    """Harness that accepts every result."""
+
+    def post_results(
+        self, result_files: dict, test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """Check that the result files exist."""
+        for result_file in result_files.values():
+            assert os.path.exists(result_file)
+
+
+@pytest.fixture(scope="function")
+def save_dir():
+    """Fixture to create a temporary directory for the ledger."""
+    with TemporaryDirectory() as save_dir:
+        yield save_dir
+
+
+def _results(save_dir, test_id, round_id):
+    """
+    Private function to create a result file for a round.
+
+    Args:
+        save_dir (str): Directory for the result files
+        test_id (str): Test id
+        round_id (int): Round id
+
+    Return:
+        Dictionary with the path to the result file
+    """
+    result_path = os.path.join(save_dir, f"{test_id}.{round_id}_detection.csv")
+    with open(result_path, "w") as f:
+        f.write(f"n01484850_{round_id}.JPEG,0.5\n")
+    return {"detection": result_path}
+
+
+def test_resume_progress(save_dir):
+    """
+    Test progress recorded in a ledger is restored.
+
+    Args:
+        save_dir (str): Directory for the ledger
+
+    Return:
+        None
+    """
+    ledger_path = os.path.join(save_dir, "progress.jsonl")
+    progress_ledger = ProgressLedger(ledger_path)
+    progress_ledger.start_session("1234")
+    progress_ledger.record_round("OND.1.1.1234", 0, feature_offset=1)
+    progress_ledger.record_round("OND.1.1.1234", 1, feature_offset=2)
+    progress_ledger.record_test("OND.1.1.1234")
+    progress_ledger.record_round("OND.1.1.5678", 0, feature_offset=1)
+    restored_ledger = ProgressLedger(ledger_path)
+    assert restored_ledger.session_id == "1234"
+    assert not restored_ledger.session_ended
+    assert restored_ledger.test_complete("OND.1.1.1234")
+    assert not restored_ledger.test_complete("OND.1.1.5678")
+    assert restored_ledger.last_round("OND.1.1.1234") == 1
+    assert restored_ledger.last_round("OND.1.1.5678") == 0
+    assert restored_ledger.last_round("OND.1.1.9012") == -1
+    assert restored_ledger.feature_offset("OND.1.1.1234") == 2
+    restored_ledger.end_session()
+    assert ProgressLedger(ledger_path).session_ended
+
+
+def test_partial_entry(save_dir):
+    """
+    Test entry partially written during a crash is ignored.
+
+    Args:
+        save_dir (str): Directory for the ledger
+
+    Return:
+        None
+    """
+    ledger_path = os.path.join(save_dir, "progress.jsonl")
+    progress_ledger = ProgressLedger(ledger_path)
+    progress_ledger.start_session("1234")
+    progress_ledger.record_round("OND.1.1.1234", 0)
+    with open(ledger_path, "a") as f:
+        f.write('{"event": "round", "test_id": "OND.1.1.1234", "rou')
+    restored_ledger = ProgressLedger(ledger_path)
+    assert restored_ledger.last_round("OND.1.1.1234") == 0
+
+
+def test_new_session(save_dir):
+    """
+    Test progress of an earlier session is discarded by a new session.
+
+    Args:
+        save_dir (str): Directory for the ledger
+
+    Return:
+        None
+    """
+    ledger_path = os.path.join(save_dir, "progress.jsonl")
+    progress_ledger = ProgressLedger(ledger_path)
+    progress_ledger.start_session("1234")
+    progress_ledger.record_test("OND.1.1.1234")
+    ProgressLedger(ledger_path).start_session("5678")
+    restored_ledger = ProgressLedger(ledger_path)
+    assert restored_ledger.session_id == "5678"
+    assert not restored_ledger.test_complete("OND.1.1.1234")
+
+
+def test_record_posted_rounds(save_dir):
+    """
+    Test rounds are recorded once their results are posted.
+
+    Args:
+        save_dir (str): Directory for the ledger
+
+    Return:
+        None
+    """
+    ledger_path = os.path.join(save_dir, "progress.jsonl")
+    progress_ledger = ProgressLedger(ledger_path)
+    progress_ledger.start_session("1234")
+    results_uploader = ResultsUploader(DummyHarness())
+    for round_id in range(3):
+        results = _results(save_dir, "OND.1.1.1234", round_id)
+        results_uploader.post_results(
+            results,
+            "OND.1.1.1234",
+            round_id,
+            "1234",
+            on_posted=partial(
+                progress_ledger.record_round,
+                "OND.1.1.1234",
+                round_id,
+                feature_offset=2 * (round_id + 1),
+            ),
+        )
+    results_uploader.close()
+    restored_ledger = ProgressLedger(ledger_path)
+    assert restored_ledger.last_round("OND.1.1.1234") == 2
+    assert restored_ledger.feature_offset("OND.1.1.1234") == 6
+    assert os.listdir(save_dir) == ["progress.jsonl"]
+
+
+def test_saved_features(save_dir):
+    """
+    Test features saved for completed rounds are opened.
+
+    Args:
+        save_dir (str): Directory for the ledger and feature store
+
+    Return:
+        None
+    """
+    store_dir = os.path.join(save_dir, "OND.1.1.1234_features")
+    progress_ledger = ProgressLedger()
+    progress_ledger.start_session("1234")
+    assert progress_ledger.saved_features("OND.1.1.1234", store_dir) is None
+    feature_store = FeatureStore(store_dir, mode="a")
+    feature_store.append({"a.JPEG": np.zeros(4)}, {"a.JPEG": np.zeros(2)})
+    progress_ledger.record_round("OND.1.1.1234", 0, feature_offset=1)
+    saved_features = progress_ledger.saved_features("OND.1.1.1234", store_dir)
+    assert saved_features is not None
+    assert "a.JPEG" in saved_features
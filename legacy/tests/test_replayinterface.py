@@ -0,0 +1,118 @@
+"""Tests for Replay Interface."""
+
+from sail_on_client.errors import RoundError, ServerError
+from tempfile import TemporaryDirectory
+import json
+import multiprocessing
+import os
+import pytest
+
+
+@pytest.fixture(scope="function")
+def replay_params():
+    """Fixture to record a session and add a configuration.json for it."""
+    with TemporaryDirectory() as config_folder:
+        replay_dir = os.path.join(config_folder, "session")
+        test_dir = os.path.join(replay_dir, "OND.1.1.1234")
+        os.makedirs(test_dir)
+        for round_id in range(2):
+            with open(os.path.join(test_dir, f"{round_id}.csv"), "w") as f:
+                f.write(f"n01484850_{round_id}.JPEG\nn01484850_{round_id + 2}.JPEG\n")
+        with open(os.path.join(test_dir, "0_classification.csv"), "w") as f:
+            f.write("n01484850_0.JPEG,1\nn01484850_2.JPEG,3\n")
+        with open(os.path.join(test_dir, "0_evaluation.csv"), "w") as f:
+            f.write("accuracy,0.5\n")
+        with open(os.path.join(test_dir, "metadata.json"), "w") as f:
+            json.dump({"red_light": "n01484850_2.JPEG"}, f)
+        config = {
+            "replay_dir": replay_dir,
+            "result_dir": os.path.join(config_folder, "results"),
+        }
+        config_name = "configuration.json"
+        json.dump(config, open(os.path.join(config_folder, config_name), "w"))
+        yield config_folder, config_name
+
+
+def test_replay_session(replay_params):
+    """
+    Test rounds, feedback and metadata are served from the recorded session.
+
+    Args:
+        replay_params (tuple): Tuple to configure replay interface
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.replayinterface import ReplayInterface
+
+    config_directory, config_name = replay_params
+    replay_interface = ReplayInterface(config_name, config_directory)
+    test_ids_file = replay_interface.test_ids_request(
+        "OND", "image_classification", "5678"
+    )
+    assert open(test_ids_file, "r").read() == "OND.1.1.1234\n"
+    session_id = replay_interface.session_request(
+        ["OND.1.1.1234"], "OND", "image_classification", "0.1.1", []
+    )
+    metadata = replay_interface.get_test_metadata(session_id, "OND.1.1.1234")
+    assert metadata["red_light"] == "n01484850_2.JPEG"
+    dataset = replay_interface.dataset_request("OND.1.1.1234", 1, session_id)
+    assert open(dataset, "r").readlines() == [
+        "n01484850_1.JPEG\n",
+        "n01484850_3.JPEG\n",
+    ]
+    with pytest.raises(RoundError):
+        replay_interface.dataset_request("OND.1.1.1234", 2, session_id)
+    feedback_file = replay_interface.get_feedback_request(
+        ["n01484850_2.JPEG"], "classification", "OND.1.1.1234", 0, session_id
+    )
+    assert open(feedback_file, "r").read() == "n01484850_2.JPEG,3\n"
+    replay_interface.post_results({"detection": dataset}, "OND.1.1.1234", 1, session_id)
+    result_dir = os.path.join(config_directory, "results")
+    assert os.listdir(result_dir) == [f"{session_id}.OND.1.1.1234.1_detection.csv"]
+    evaluation_file = replay_interface.evaluate("OND.1.1.1234", 0, session_id)
+    assert open(evaluation_file, "r").read() == "accuracy,0.5\n"
+    with pytest.raises(ServerError):
+        replay_interface.evaluate("OND.1.1.1234", 1, session_id)
+    # Rounds posted by forked test workers are counted by the protocol
+    worker = multiprocessing.get_context("fork").Process(
+        target=replay_interface.post_results,
+        args=({"detection": dataset}, "OND.1.1.1234", 0, session_id),
+    )
+    worker.start()
+    worker.join()
+    assert replay_interface.posted_rounds == 2
+    replay_interface.terminate_session(session_id)
+
+
+def test_replay_protocol_async_post_results(replay_params, discoverable_plugins):
+    """
+    Test a protocol posting results in the background to a replayed session.
+
+    Args:
+        replay_params (tuple): Tuple to configure replay interface
+        discoverable_plugins (dict): Dictionary with the plugins
+
+    Return:
+        None
+    """
+    from sail_on_client.protocol.ond_protocol import SailOn
+    from sail_on_client.protocol.replayinterface import ReplayInterface
+
+    config_directory, config_name = replay_params
+    replay_interface = ReplayInterface(config_name, config_directory)
+    ond_config = os.path.join(config_directory, "ond_config.json")
+    with open(ond_config, "w") as f:
+        json.dump(
+            {
+                "domain": "image_classification",
+                "test_ids": ["OND.1.1.1234"],
+                "novelty_detector_class": "MockDetector",
+                "async_post_results": True,
+            },
+            f,
+        )
+    ond = SailOn(discoverable_plugins, "", replay_interface, ond_config)
+    # The mock detector posts the dataset of a round as its results
+    ond.run_protocol()
+    assert replay_interface.posted_rounds == 2
@@ -0,0 +1,206 @@
+"""Tests for ResultsUploader."""
+
+from sail_on_client.results_uploader import ResultsUploader
+from sail_on_client.errors import ServerError
+from functools import partial
+from tempfile import TemporaryDirectory
+import os
+import pytest
+import random
+import threading
+import time
+
+
+class DummyHarness(object):
+    """Harness that records the results posted to it."""
+
+    def __init__(self, fail_round: int = -1) -> None:
+        """Initialize."""
+        self.fail_round = fail_round
+        self.posted: list = []
+        self.lock = threading.Lock()
+
+    def post_results(
+        self, result_files: dict, test_id: str, round_id: int, session_id: str
+    ) -> None:
+        """Record the results after checking that the files exist."""
+        time.sleep(random.uniform(0, 0.01))
+        if round_id == self.fail_round:
+            raise ServerError("Failed", f"Failed to post round {round_id}")
+        for result_file in result_files.values():
+            assert os.path.exists(result_file)
+        with self.lock:
+            self.posted.append((test_id, round_id))
+
+
+class DummyBatchHarness(DummyHarness):
+    """Harness that records the batches of results posted to it."""
+
+    def __init__(self, fail_round: int = -1) -> None:
+        """Initialize."""
+        super().__init__(fail_round)
+        self.batches: list = []
+
+    def post_results_batch(self, batch: list, session_id: str) -> list:
+        """Post every round in a batch and return the errors for the rounds."""
+        self.batches.append([(test_id, round_id) for _, test_id, round_id in batch])
+        errors = []
+        for result_files, test_id, round_id in batch:
+            try:
+                self.post_results(result_files, test_id, round_id, session_id)
+            except ServerError as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+
+@pytest.fixture(scope="function")
+def result_dir():
+    """Fixture to create a temporary directory for result files."""
+    with TemporaryDirectory() as result_dir:
+        yield result_dir
+
+
+def _results(result_dir, test_id, round_id):
+    """
+    Private function to create a result file for a round.
+
+    Args:
+        result_dir (str): Directory for the result files
+        test_id (str): Test id
+        round_id (int): Round id
+
+    Return:
+        Dictionary with the path to the result file
+    """
+    result_path = os.path.join(result_dir, f"{test_id}.{round_id}_detection.csv")
+    with open(result_path, "w") as f:
+        f.write("n01484850_4515.JPEG,0.5\n")
+    return {"detection": result_path}
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_post_results_in_order(result_dir, background):
+    """
+    Test results for a test are posted in order and removed after posting.
+
+    Args:
+        result_dir (str): Directory for the result files
+        background (bool): Post results on background threads
+
+    Return:
+        None
+    """
+    harness = DummyHarness()
+    results_uploader = ResultsUploader(harness, background, max_in_flight=3)
+    test_ids = ["OND.1.1.1234", "OND.1.1.5678"]
+    for round_id in range(5):
+        for test_id in test_ids:
+            results_uploader.post_results(
+                _results(result_dir, test_id, round_id), test_id, round_id, "session"
+            )
+    results_uploader.close()
+    for test_id in test_ids:
+        posted_rounds = [
+            round_id for posted_id, round_id in harness.posted if posted_id == test_id
+        ]
+        assert posted_rounds == list(range(5))
+    assert os.listdir(result_dir) == []
+
+
+def test_error_raised_by_next_call(result_dir):
+    """
+    Test error while posting results is raised by the uploader.
+
+    Args:
+        result_dir (str): Directory for the result files
+
+    Return:
+        None
+    """
+    harness = DummyHarness(fail_round=1)
+    results_uploader = ResultsUploader(harness)
+    for round_id in range(3):
+        results_uploader.post_results(
+            _results(result_dir, "OND.1.1.1234", round_id),
+            "OND.1.1.1234",
+            round_id,
+            "session",
+        )
+    with pytest.raises(ServerError):
+        results_uploader.drain()
+    results_uploader.close()
+    assert harness.posted == [("OND.1.1.1234", 0)]
+    # Results that were not posted are kept
+    assert len(os.listdir(result_dir)) == 2
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_post_results_in_batches(result_dir, background):
+    """
+    Test results for consecutive rounds are posted in batches.
+
+    Args:
+        result_dir (str): Directory for the result files
+        background (bool): Post results on background threads
+
+    Return:
+        None
+    """
+    harness = DummyBatchHarness()
+    results_uploader = ResultsUploader(
+        harness, background, max_in_flight=1, batch_size=4
+    )
+    test_ids = ["OND.1.1.1234", "OND.1.1.5678"]
+    for round_id in range(3):
+        for test_id in test_ids:
+            results_uploader.post_results(
+                _results(result_dir, test_id, round_id), test_id, round_id, "session"
+            )
+    # Waiting for a test posts the batch with its results
+    results_uploader.wait("OND.1.1.5678")
+    assert len(harness.batches) == 2
+    results_uploader.close()
+    assert [len(batch) for batch in harness.batches] == [4, 2]
+    for test_id in test_ids:
+        posted_rounds = [
+            round_id for posted_id, round_id in harness.posted if posted_id == test_id
+        ]
+        assert posted_rounds == list(range(3))
+    assert os.listdir(result_dir) == []
+
+
+def test_batch_errors_per_round(result_dir):
+    """
+    Test rounds after a round that failed in a batch are not reported as posted.
+
+    Args:
+        result_dir (str): Directory for the result files
+
+    Return:
+        None
+    """
+    harness = DummyBatchHarness(fail_round=1)
+    posted_rounds: list = []
+    results_uploader = ResultsUploader(harness, batch_size=2)
+    results = [_results(result_dir, "OND.1.1.1234", round_id) for round_id in range(4)]
+    # The error can be raised by any call after the first batch is submitted
+    with pytest.raises(ServerError):
+        for round_id in range(4):
+            results_uploader.post_results(
+                results[round_id],
+                "OND.1.1.1234",
+                round_id,
+                "session",
+                on_posted=partial(posted_rounds.append, round_id),
+            )
+        results_uploader.drain()
+    results_uploader.close()
+    assert posted_rounds == [0]
+    # The batch after the failed batch is not posted
+    assert harness.batches == [[("OND.1.1.1234", 0), ("OND.1.1.1234", 1)]]
+    # Results that were not reported as posted are kept
+    assert sorted(os.listdir(result_dir)) == [
+        f"OND.1.1.1234.{round_id}_detection.csv" for round_id in range(1, 4)
+    ]
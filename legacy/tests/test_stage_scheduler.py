@@ -0,0 +1,220 @@
+"""Tests for StageScheduler."""
+
+from sail_on_client.stage_scheduler import (
+    PROTOCOL_STAGES,
+    StageScheduler,
+    feature_extraction_start,
+    stages_to_skip,
+)
+from sail_on_client.errors import RoundError
+from tempfile import TemporaryDirectory
+import multiprocessing as mp
+import os
+import pytest
+import threading
+
+
+@pytest.fixture(scope="function")
+def dataset_dir():
+    """Fixture to create a temporary directory for datasets."""
+    with TemporaryDirectory() as dataset_dir:
+        yield dataset_dir
+
+
+class DummyRounds(object):
+    """Provide datasets and features for a fixed number of rounds."""
+
+    def __init__(self, dataset_dir: str, num_rounds: int) -> None:
+        """Initialize."""
+        self.dataset_dir = dataset_dir
+        self.num_rounds = num_rounds
+        self.extract_threads: list = []
+
+    def dataset_request(self, round_id: int) -> str:
+        """Write the dataset for a round."""
+        if round_id >= self.num_rounds:
+            raise RoundError("End of Dataset", "No more rounds")
+        dataset = os.path.join(self.dataset_dir, f"{round_id}.csv")
+        with open(dataset, "w") as f:
+            f.writelines([f"n01484850_{round_id}{idx}.JPEG\n" for idx in range(2)])
+        return dataset
+
+    def extract(self, toolset: dict, image_ids: list) -> tuple:
+        """Extract features for the images in the dataset of the toolset."""
+        self.extract_threads.append(threading.current_thread())
+        with open(toolset["dataset"], "r") as f:
+            assert [image_id.strip() for image_id in f.readlines()] == image_ids
+        features_dict = {image_id: toolset["round_id"] for image_id in image_ids}
+        return features_dict, {}
+
+
+def test_feature_extraction_start():
+    """
+    Test stage after which feature extraction can start.
+
+    Return:
+        None
+    """
+    assert feature_extraction_start(None) is None
+    assert feature_extraction_start({"FeatureExtraction": []}) == "FeatureExtraction"
+    assert (
+        feature_extraction_start(
+            {"FeatureExtraction": ["NoveltyClassification", "WorldDetection"]}
+        )
+        == "NoveltyClassification"
+    )
+    assert feature_extraction_start({"FeatureExtraction": ["NoveltyAdaption"]}) is None
+    # Dependencies on stages that are not executed by a protocol are ignored
+    characterization_dependencies = {
+        "FeatureExtraction": ["WorldDetection", "NoveltyCharacterization"]
+    }
+    assert (
+        feature_extraction_start(characterization_dependencies, PROTOCOL_STAGES["OND"])
+        == "WorldDetection"
+    )
+    assert (
+        feature_extraction_start(
+            characterization_dependencies, PROTOCOL_STAGES["CONDDA"]
+        )
+        == "NoveltyCharacterization"
+    )
+    with pytest.raises(ValueError):
+        feature_extraction_start({"FeatureExtraction": ["Unknown"]})
+
+
+def test_stages_to_skip():
+    """
+    Test stages skipped for a configuration.
+
+    Return:
+        None
+    """
+    config = {
+        "skip_stage": ["feature_extraction", "WorldDetection"],
+        "use_saved_attributes": False,
+        "saved_attributes": {"FeatureExtraction": ["FVs"]},
+    }
+    assert stages_to_skip(config) == {"FeatureExtraction", "WorldDetection"}
+    # Stages are executed when their attributes are restored
+    config["use_saved_attributes"] = True
+    assert stages_to_skip(config) == {"WorldDetection"}
+    config["skip_stage"] = ["Detection"]
+    with pytest.raises(ValueError):
+        stages_to_skip(config)
+
+
+@pytest.mark.parametrize("start_after", [None, "FeatureExtraction", "WorldDetection"])
+def test_rounds(dataset_dir, start_after):
+    """
+    Test features for every round with and without overlapping rounds.
+
+    Args:
+        dataset_dir (str): Directory for datasets
+        start_after (str): Stage after which the next round is started
+
+    Return:
+        None
+    """
+    dummy_rounds = DummyRounds(dataset_dir, 3)
+    toolset: dict = {}
+    stage_scheduler = StageScheduler(
+        toolset, dummy_rounds.dataset_request, dummy_rounds.extract, start_after
+    )
+    round_features = []
+    with pytest.raises(RoundError):
+        for round_id in range(4):
+            toolset["round_id"] = round_id
+            toolset["dataset"] = stage_scheduler.dataset_request(round_id)
+            with open(toolset["dataset"], "r") as f:
+                image_ids = [image_id.strip() for image_id in f.readlines()]
+            features_dict, _ = stage_scheduler.extract(round_id, image_ids)
+            round_features.append(features_dict)
+            for stage in ["FeatureExtraction", "WorldDetection"]:
+                stage_scheduler.stage_complete(round_id, stage)
+    stage_scheduler.close()
+    assert stage_scheduler.pipelined is False
+    assert [set(features.values()) for features in round_features] == [
+        {0},
+        {1},
+        {2},
+    ]
+    main_thread_extractions = dummy_rounds.extract_threads.count(
+        threading.current_thread()
+    )
+    assert main_thread_extractions == (3 if start_after is None else 1)
+
+
+def test_toolset_snapshot(dataset_dir):
+    """
+    Test features for the next round are extracted with a copy of the toolset.
+
+    Args:
+        dataset_dir (str): Directory for datasets
+
+    Return:
+        None
+    """
+    dummy_rounds = DummyRounds(dataset_dir, 2)
+    extract_toolsets = []
+
+    def extract(toolset: dict, image_ids: list) -> tuple:
+        extract_toolsets.append(toolset)
+        return dummy_rounds.extract(toolset, image_ids)
+
+    toolset = {"round_id": 0, "dataset_ids": ["n01484850_00.JPEG"]}
+    stage_scheduler = StageScheduler(
+        toolset, dummy_rounds.dataset_request, extract, "FeatureExtraction"
+    )
+    toolset["features_dict"] = {"n01484850_00.JPEG": 0}
+    stage_scheduler.stage_complete(0, "FeatureExtraction")
+    # The protocol keeps modifying the toolset while the next round is extracted
+    toolset["dataset_ids"].append("n01484850_01.JPEG")
+    stage_scheduler.dataset_request(1)
+    stage_scheduler.close()
+    assert extract_toolsets[0]["dataset_ids"] == ["n01484850_00.JPEG"]
+    assert "features_dict" not in extract_toolsets[0]
+
+
+class DummyFeedback(object):
+    """Feedback holding a lock that can not be copied, like the harnesses."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.lock = mp.get_context("fork").RLock()
+
+
+def test_toolset_snapshot_with_feedback(dataset_dir):
+    """
+    Test the next round is extracted when the toolset carries feedback.
+
+    Args:
+        dataset_dir (str): Directory for datasets
+
+    Return:
+        None
+    """
+    dummy_rounds = DummyRounds(dataset_dir, 2)
+    extract_toolsets = []
+
+    def extract(toolset: dict, image_ids: list) -> tuple:
+        extract_toolsets.append(toolset)
+        return dummy_rounds.extract(toolset, image_ids)
+
+    detector_config = {"feature_size": 4}
+    toolset = {
+        "round_id": 0,
+        "dataset_ids": [],
+        "detector_config": detector_config,
+        "ImageClassificationFeedback": DummyFeedback(),
+    }
+    stage_scheduler = StageScheduler(
+        toolset, dummy_rounds.dataset_request, extract, "FeatureExtraction"
+    )
+    stage_scheduler.stage_complete(0, "FeatureExtraction")
+    stage_scheduler.dataset_request(1)
+    features_dict, _ = stage_scheduler.extract(1, [])
+    stage_scheduler.close()
+    assert set(features_dict.values()) == {1}
+    assert "ImageClassificationFeedback" not in extract_toolsets[0]
+    # Values that are not modified by the protocol are shared
+    assert extract_toolsets[0]["detector_config"] is detector_config
@@ -0,0 +1,79 @@
+"""Tests for utility functions."""
+
+from sail_on_client.utils import (
+    dataset_ids,
+    open_result,
+    result_content,
+    safe_remove,
+    write_result,
+)
+from tempfile import TemporaryDirectory
+import io
+import os
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="function")
+def result_dir():
+    """Fixture to create a temporary directory for result files."""
+    with TemporaryDirectory() as result_dir:
+        yield result_dir
+
+
+def test_dataset_ids(result_dir):
+    """
+    Test image ids are read from a dataset file or a list.
+
+    Args:
+        result_dir (str): Directory for the dataset
+
+    Return:
+        None
+    """
+    image_ids = ["n01484850_4515.JPEG", "n01484850_4516.JPEG"]
+    dataset = os.path.join(result_dir, "dataset.csv")
+    with open(dataset, "w") as f:
+        f.writelines([f"{image_id}\n" for image_id in image_ids])
+    assert dataset_ids(dataset) == image_ids
+    assert dataset_ids(image_ids) == image_ids
+    # Datasets kept in memory are not removed
+    safe_remove(image_ids)
+    safe_remove(dataset)
+    assert not os.path.exists(dataset)
+
+
+@pytest.mark.parametrize("result_type", ["file", "text", "binary", "dataframe"])
+def test_result_content(result_dir, result_type):
+    """
+    Test content of results kept in files and in memory.
+
+    Args:
+        result_dir (str): Directory for the result files
+        result_type (str): Type of the result
+
+    Return:
+        None
+    """
+    content = "n01484850_4515.JPEG,0.5\nn01484850_4516.JPEG,0.25\n"
+    if result_type == "file":
+        result = os.path.join(result_dir, "detection.csv")
+        with open(result, "w") as f:
+            f.write(content)
+    elif result_type == "text":
+        result = io.StringIO(content)
+    elif result_type == "binary":
+        result = io.BytesIO(content.encode("utf-8"))
+    else:
+        result = pd.DataFrame(
+            {"id": ["n01484850_4515.JPEG", "n01484850_4516.JPEG"], "val": [0.5, 0.25]}
+        )
+    assert result_content(result) == content
+    with open_result(result) as f:
+        assert f.read() == content.encode("utf-8")
+    result_path = os.path.join(result_dir, "archived.csv")
+    write_result(result, result_path)
+    with open(result_path, "r") as f:
+        assert f.read() == content
+    with pytest.raises(TypeError):
+        result_content(0.5)
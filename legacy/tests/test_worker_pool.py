@@ -0,0 +1,71 @@
+"""Tests for running tests in worker processes."""
+
+from sail_on_client.protocol.worker_pool import run_tests_in_workers
+from tempfile import TemporaryDirectory
+import os
+import pytest
+import threading
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_run_tests_in_workers(num_workers):
+    """
+    Test every test is run once by the workers.
+
+    Args:
+        num_workers (int): Number of worker processes
+
+    Return:
+        None
+    """
+    test_ids = [f"OND.1.1.{idx}" for idx in range(7)]
+    with TemporaryDirectory() as result_dir:
+
+        def run_tests(worker_test_ids):
+            for test_id in worker_test_ids:
+                with open(os.path.join(result_dir, test_id), "w") as f:
+                    f.write(str(os.getpid()))
+
+        run_tests_in_workers(run_tests, test_ids, num_workers)
+        assert sorted(os.listdir(result_dir)) == sorted(test_ids)
+
+
+def test_failed_worker():
+    """
+    Test failure in a worker is raised after the workers are done.
+
+    Return:
+        None
+    """
+
+    def run_tests(worker_test_ids):
+        for test_id in worker_test_ids:
+            raise ValueError(f"Failed {test_id}")
+
+    with pytest.raises(RuntimeError):
+        run_tests_in_workers(run_tests, ["OND.1.1.1", "OND.1.1.2"], 2)
+
+
+def test_running_threads():
+    """
+    Test tests are run without forking while other threads are running.
+
+    Return:
+        None
+    """
+    test_ids = [f"OND.1.1.{idx}" for idx in range(3)]
+    worker_pids = []
+
+    def run_tests(worker_test_ids):
+        for _ in worker_test_ids:
+            worker_pids.append(os.getpid())
+
+    stop_thread = threading.Event()
+    thread = threading.Thread(target=stop_thread.wait)
+    thread.start()
+    try:
+        run_tests_in_workers(run_tests, test_ids, 3)
+    finally:
+        stop_thread.set()
+        thread.join()
+    assert worker_pids == [os.getpid()] * 3